@@ -1,20 +1,32 @@
 from contextlib import asynccontextmanager
-from itertools import chain
+from functools import wraps
 from logging import getLogger
 from pathlib import Path
 from typing import Annotated, Mapping, Sequence
 
 from fastapi import FastAPI, Form, UploadFile, status
 from fastapi.requests import Request
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.responses import (
+    FileResponse,
+    HTMLResponse,
+    JSONResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi_utils.tasks import repeat_every
 
 from app.backend import PrecisBackend
+from app.backup import compressions, encode_records, parse_since
+from app.content.httpx import http_client
+from app.content.playwright import browser_pool
+from app.extraction import extraction_pool
 from app.impls import load_storage_config
 from app.logging import HealthCheckFilter
 from app.models import Feed, HealthCheck
+from app.outbox import NotificationOutbox
+from app.queue import JobQueue, JobWorkers
 from app.rss import PrecisRSS
 from app.settings import GlobalSettings, Themes
 
@@ -27,8 +39,12 @@ templates = Jinja2Templates(directory=Path(base_path, "templates").resolve())
 
 storage_handler = load_storage_config()
 
-bk = PrecisBackend(db=storage_handler)
-rss = PrecisRSS(db=storage_handler)
+queue = JobQueue()
+outbox = NotificationOutbox(db=storage_handler)
+
+bk = PrecisBackend(db=storage_handler, queue=queue)
+rss = PrecisRSS(db=storage_handler, queue=queue, outbox=outbox)
+workers = JobWorkers(queue=queue, handlers=rss.job_handlers)
 
 logger.addFilter(HealthCheckFilter())
 getLogger("uvicorn.access").addFilter(HealthCheckFilter())
@@ -44,13 +60,38 @@ async def poll_feeds():
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    storage_handler.start()
+    await extraction_pool.start()
+    workers.start()
+    outbox.start()
     await poll_feeds()
 
     yield
 
+    await workers.stop()
+    await outbox.stop()
+    await browser_pool.close()
+    await http_client.close()
+    extraction_pool.close()
+    await storage_handler.stop()
+
 
 app = FastAPI(lifespan=lifespan, title="Precis", openapi_url="/openapi.json")
 
+
+def read_snapshot(endpoint):
+    # share one read transaction between all the reads a read-only page makes.
+    # Only the endpoint runs inside it, not sending the response, and pages
+    # that write, fetch content or stream are left out, so that no request
+    # holds a read transaction open for long.
+    @wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        with storage_handler.snapshot():
+            return await endpoint(*args, **kwargs)
+
+    return wrapper
+
+
 app.mount(
     "/static",
     StaticFiles(directory=Path(Path(__file__).parent, "static")),
@@ -71,6 +112,7 @@ async def favicon():
 
 
 @app.get("/", response_class=HTMLResponse)
+@read_snapshot
 async def root(request: Request):
     settings = await bk.get_settings()
 
@@ -79,7 +121,7 @@ async def root(request: Request):
             "index.html",
             {
                 "request": request,
-                "settings": await bk.get_settings(),
+                "settings": settings,
                 "feeds": bk.list_feeds(agg=True),
             },
         )
@@ -126,6 +168,7 @@ async def onboarding(request: Request):
 
 
 @app.get("/list-entries/{feed_id}", response_class=HTMLResponse)
+@read_snapshot
 async def list_entries_by_feed(
     feed_id: str, request: Request, refresh_requested: bool = False
 ):
@@ -146,6 +189,7 @@ async def list_entries_by_feed(
 
 
 @app.get("/recent/", response_class=HTMLResponse)
+@read_snapshot
 async def list_recent_feed_entries(request: Request, refresh_requested: bool = False):
     response = {
         "settings": await bk.get_settings(),
@@ -182,6 +226,7 @@ async def read(request: Request, feed_entry_id: str, redrive: bool = False):
 
 
 @app.get("/settings/", response_class=HTMLResponse)
+@read_snapshot
 async def settings(
     request: Request, update_status: bool = False, update_exception: str = None
 ):
@@ -205,6 +250,7 @@ async def settings(
 
 
 @app.get("/settings/{handler}", response_class=HTMLResponse)
+@read_snapshot
 async def handler_settings(
     request: Request,
     handler: str,
@@ -277,6 +323,8 @@ async def update_settings(
     refresh_interval: Annotated[int, Form()],
     request: Request,
     send_notification: Annotated[bool, Form()] = False,
+    digest: Annotated[bool, Form()] = False,
+    digest_window: Annotated[int, Form()] = 15,
     notification: Annotated[str, Form()] = None,
     content: Annotated[str, Form()] = None,
     llm: Annotated[str, Form()] = None,
@@ -287,6 +335,8 @@ async def update_settings(
     try:
         settings = GlobalSettings(
             send_notification=send_notification,
+            digest=digest,
+            digest_window=digest_window,
             theme=theme,
             refresh_interval=refresh_interval,
             notification_handler_key=notification,
@@ -325,6 +375,7 @@ async def update_feed(
     refresh_enabled: Annotated[bool, Form()] = False,
     use_script: Annotated[bool, Form()] = False,
     retrieve_content: Annotated[bool, Form()] = False,
+    digest: Annotated[bool, Form()] = False,
 ):
     try:
         feed = Feed(
@@ -337,6 +388,7 @@ async def update_feed(
             refresh_enabled=refresh_enabled,
             use_script=use_script,
             retrieve_content=retrieve_content,
+            digest=digest,
         )
 
         await bk.update_feed(feed=feed)
@@ -370,16 +422,33 @@ async def export_opml(request: Request):
 
 
 @app.get("/api/backup/", status_code=status.HTTP_200_OK)
-async def backup(request: Request):
-    write_path, file_name = await rss.backup()
+async def backup(request: Request, compression: str = "gzip", since: str = None):
+    if compression not in compressions():
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"detail": f"Unsupported backup compression {compression}"},
+        )
 
-    return FileResponse(path=write_path, filename=file_name)
+    try:
+        since_seq, since_ts = parse_since(since) if since else (None, None)
+    except ValueError as e:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST, content={"detail": str(e)}
+        )
+
+    file_name = rss.backup_file_name(compression)
+
+    return StreamingResponse(
+        encode_records(rss.backup(since=since_seq, since_ts=since_ts), compression),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'},
+    )
 
 
 @app.post("/api/restore/", status_code=status.HTTP_200_OK)
 async def restore(request: Request, file: UploadFile):
     try:
-        await rss.restore(file=file.file)
+        await rss.restore(file.file)
 
         return RedirectResponse(
             request.url_for("about").include_query_params(update_status=True),
@@ -409,6 +478,7 @@ async def import_opml(request: Request, file: UploadFile):
 
 
 @app.get("/feeds/", response_class=HTMLResponse)
+@read_snapshot
 async def feeds(
     request: Request, update_status: bool = False, update_exception: str = None
 ):
@@ -425,6 +495,7 @@ async def feeds(
 
 
 @app.get("/feeds/{id}", response_class=HTMLResponse)
+@read_snapshot
 async def feed_settings(
     request: Request, id: str, update_status: bool = False, update_exception: str = None
 ):
@@ -463,20 +534,19 @@ async def new_feed(request: Request, update_exception: str = None):
 
 
 @app.get("/util/list-feeds", status_code=status.HTTP_200_OK)
+@read_snapshot
 async def list_feeds(request: Request) -> Sequence[Mapping]:
     return bk.list_feeds()
 
 
 @app.get("/util/list-feed-entries", status_code=status.HTTP_200_OK)
+@read_snapshot
 async def list_feed_entries(request: Request) -> Sequence[Mapping]:
-    all_feeds = bk.list_feeds()
-
-    entries = [list(bk.list_entries(feed["id"])) for feed in all_feeds]
-
-    return list(chain.from_iterable(entries))
+    return list(bk.list_entries())
 
 
 @app.get("/util/list-handlers", status_code=status.HTTP_200_OK)
+@read_snapshot
 async def list_handlers(request: Request) -> Sequence[Mapping]:
     handlers = bk.get_handlers()
 
@@ -5,22 +5,24 @@ from json import dumps, loads
 from logging import getLogger
 from sys import version as py_version
 from time import localtime, strftime, time
-from typing import List, Mapping, Type
+from typing import Mapping, Type
 
 from pydantic import BaseModel
 from textstat import textstat as txt
 
 from app.constants import GITHUB_LINK, IS_DOCKER
 from app.errors import InvalidFeedException
-from app.models import EntryContent, Feed, FeedEntry, HealthCheck
+from app.models import EntryContent, Feed, FeedEntry, FeedStats, HealthCheck
+from app.queue import JobQueue
 from app.settings import GlobalSettings
 
 logger = getLogger("uvicorn.error")
 
 
 class PrecisBackend:
-    def __init__(self, db):
+    def __init__(self, db, queue: JobQueue = None):
         self.db = db
+        self.queue = queue
 
     @staticmethod
     def _format_time(time: int) -> str:
@@ -37,21 +39,15 @@ class PrecisBackend:
             "docker": IS_DOCKER,
             "storage_handler": type(self.db).__name__,
             "github": GITHUB_LINK,
+            "queue_depth": self.queue.depth() if self.queue else None,
         }
 
     def list_feeds(self, agg=False):
         feeds = self.db.get_feeds()
-        entry_list = self.db.get_entries() or []
-        entries: List[FeedEntry] = [i["entry"] for i in entry_list]
 
         if agg:
-            entry_agg = {}
-
-            for entry in entries:
-                if entry.feed_id in entry_agg:
-                    entry_agg[entry.feed_id] += 1
-                else:
-                    entry_agg[entry.feed_id] = 1
+            stats: Mapping[str, FeedStats] = self.db.get_feed_stats()
+            entry_counts = {k: v.entry_count for k, v in stats.items()}
 
         return [
             {
@@ -63,7 +59,7 @@ class PrecisBackend:
                 "preview_only": feed.preview_only,
                 "notify": feed.notify,
                 "refresh_enabled": feed.refresh_enabled,
-                "entry_count": entry_agg.get(feed.id, 0) if agg else False,
+                "entry_count": entry_counts.get(feed.id, 0) if agg else False,
             }
             for feed in feeds
         ]
@@ -73,8 +69,11 @@ class PrecisBackend:
     ):
         if feed_id:
             feed = self.db.get_feed(id=feed_id)
+            feeds = {feed.id: feed}
         else:
             feed = None
+            # resolve feeds once up front instead of once per entry
+            feeds = {i.id: i for i in self.db.get_feeds()}
 
         settings: GlobalSettings = self.db.get_settings()
         start_time = time - (settings.recent_hours * 3600)
@@ -86,11 +85,14 @@ class PrecisBackend:
 
         for entry in entries:
             feed_entry: FeedEntry = entry["entry"]
-            if not feed:
-                local_feed: Feed = self.db.get_feed(entry["feed_id"])
+            local_feed: Feed = feed or feeds.get(entry["feed_id"])
+
+            if not local_feed:
+                logger.debug(f"Skipping entry {entry['id']} with no matching feed")
+                continue
 
             yield {
-                "feed_name": feed.name if feed else local_feed.name,
+                "feed_name": local_feed.name,
                 "title": feed_entry.title,
                 "url": feed_entry.url,
                 "published_at": self._format_time(feed_entry.published_at),
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import gzip
+from datetime import datetime
+from importlib import import_module
+from importlib.util import find_spec
+from io import TextIOWrapper
+from json import JSONDecodeError, dumps, loads
+from logging import getLogger
+from pathlib import Path
+from typing import IO, AsyncIterator, Iterator, List, Mapping, Optional, Tuple
+from zlib import compressobj
+
+from app.constants import DATA_DIR
+
+logger = getLogger("uvicorn.error")
+
+BACKUP_FORMAT = "precis-ndjson"
+BACKUP_VERSION = 1
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# how much output to gather before compressing and handing it on
+CHUNK_SIZE = 64 * 1024
+
+
+def compressions() -> List[str]:
+    available = ["none", "gzip"]
+
+    if find_spec("zstandard"):
+        available.append("zstd")
+
+    return available
+
+
+def file_suffix(compression: str) -> str:
+    return {"none": ".ndjson", "gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}[compression]
+
+
+class _Identity:
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def parse_since(since: str) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Read the starting point of an incremental backup, which is either a
+    change sequence number or an ISO-8601 time. Returns (seq, timestamp)
+    """
+    if since.isdigit():
+        return int(since), None
+
+    try:
+        when = datetime.fromisoformat(since)
+    except ValueError:
+        raise ValueError(f"{since} is neither a change number nor an ISO-8601 time")
+
+    if not when.tzinfo:
+        when = when.astimezone()
+
+    return None, int(when.timestamp())
+
+
+def _compressor(compression: str):
+    if compression == "gzip":
+        # wbits of 31 writes a gzip header and trailer
+        return compressobj(wbits=31)
+
+    if compression == "zstd":
+        return import_module("zstandard").ZstdCompressor().compressobj()
+
+    return _Identity()
+
+
+async def encode_records(
+    records: AsyncIterator[Mapping], compression: str = "none"
+) -> AsyncIterator[bytes]:
+    """
+    Turn backup records into chunks of (optionally compressed) NDJSON,
+    without holding more than a chunk of them in memory
+    """
+    if compression not in compressions():
+        raise ValueError(f"Unsupported backup compression {compression}")
+
+    compressor = _compressor(compression)
+    buffer = bytearray()
+
+    async for record in records:
+        buffer.extend(dumps(record).encode())
+        buffer.extend(b"\n")
+
+        if len(buffer) >= CHUNK_SIZE:
+            chunk = compressor.compress(bytes(buffer))
+            buffer.clear()
+            if chunk:
+                yield chunk
+
+    yield compressor.compress(bytes(buffer)) + compressor.flush()
+
+
+def _open_text(fp: IO) -> IO[str]:
+    if isinstance(fp.read(0), str):
+        return fp
+
+    head = fp.read(4)
+    fp.seek(0)
+
+    if head.startswith(GZIP_MAGIC):
+        return gzip.open(fp, "rt", encoding="utf-8")
+
+    if head.startswith(ZSTD_MAGIC):
+        if not find_spec("zstandard"):
+            raise ValueError("This backup is zstd-compressed, but zstandard is missing")
+
+        reader = (
+            import_module("zstandard")
+            .ZstdDecompressor()
+            .stream_reader(fp, closefd=False)
+        )
+        return TextIOWrapper(reader, encoding="utf-8")
+
+    return TextIOWrapper(fp, encoding="utf-8")
+
+
+def _legacy_records(backup: Mapping) -> Iterator[Mapping]:
+    # the original format was a single json document holding everything
+    yield {"type": "header", "format": "precis-json", "version": 0, "id": None}
+
+    for k, v in backup.get("handlers", {}).items():
+        yield {"type": "handler", "id": k, "config": v}
+
+    yield {"type": "settings", "settings": backup.get("settings", {})}
+
+    for feed in backup.get("feeds", []):
+        yield {"type": "feed", "feed": feed}
+
+    for feed_id, entries in backup.get("feed_entries", {}).items():
+        for entry in entries:
+            yield {"type": "entry", "entry": {**entry, "feed_id": feed_id}}
+
+    for contents in backup.get("entry_content", {}).values():
+        for content in contents.values():
+            yield {"type": "content", "content": content}
+
+
+def read_records(fp: IO) -> Iterator[Mapping]:
+    """
+    Read the records of a backup one at a time, whether it is compressed
+    NDJSON or a legacy json backup
+    """
+    text = _open_text(fp)
+
+    try:
+        yield from _read_text(text)
+    finally:
+        # the file belongs to the caller, so don't let the text wrapper close
+        # it when the wrapper is collected
+        if text is not fp and not fp.closed:
+            text.detach()
+
+
+def _read_text(text: IO[str]) -> Iterator[Mapping]:
+    first = text.readline()
+
+    try:
+        header = loads(first)
+    except JSONDecodeError:
+        header = None
+
+    if not isinstance(header, dict) or header.get("type") != "header":
+        logger.info("Reading a legacy json backup")
+        yield from _legacy_records(loads(first + text.read()))
+        return
+
+    if header.get("version", 0) > BACKUP_VERSION:
+        raise ValueError(f"Backup version {header['version']} is too new to restore")
+
+    yield header
+
+    for line in text:
+        if line.strip():
+            yield loads(line)
+
+
+class RestoreCheckpoint:
+    """
+    Records how many records of a backup have been restored, so that an
+    interrupted restore of the same backup can skip what is already written.
+    Older backups carry no id and so always restore from the start.
+    """
+
+    def __init__(self, backup_id: str = None):
+        self.backup_id = backup_id
+
+    @property
+    def path(self) -> Path | None:
+        if not self.backup_id:
+            return None
+
+        return Path(DATA_DIR, f"restore_{self.backup_id}.json").resolve()
+
+    def load(self) -> int:
+        if not self.path or not self.path.exists():
+            return 0
+
+        return loads(self.path.read_text()).get("restored", 0)
+
+    def save(self, restored: int) -> None:
+        if not self.path:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(dumps({"id": self.backup_id, "restored": restored}))
+        tmp.replace(self.path)
+
+    def clear(self) -> None:
+        if self.path:
+            self.path.unlink(missing_ok=True)
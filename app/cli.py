@@ -1,10 +1,15 @@
+from contextlib import ExitStack
 from logging import INFO, getLogger
 from os import PathLike
 from pathlib import Path
+from typing import List
 
 import asyncclick as click
 
-from app.app import rss
+from app.app import outbox, rss, workers
+from app.backup import compressions, encode_records, parse_since
+from app.constants import DATA_DIR
+from app.storage.media import MediaStore
 
 logger = getLogger("cli")
 logger.setLevel(INFO)
@@ -16,27 +21,52 @@ def cli():
 
 
 @cli.command()
-async def backup():
+@click.option(
+    "--compression",
+    type=click.Choice(compressions()),
+    default="none",
+    help="Compress the backup as it is written",
+)
+@click.option(
+    "--since",
+    help="Only back up what changed after this change number or ISO-8601 time",
+)
+async def backup(compression: str, since: str):
     """
-    Write a json-format backup of the current Precis state
-    to stdout. The file will also be saved in DATA_DIR.
+    Stream an NDJSON-format backup of the current Precis state
+    to stdout. The header records the change number to pass as
+    --since for the next incremental backup.
     """
-    file_path, _ = await rss.backup()
+    try:
+        since_seq, since_ts = parse_since(since) if since else (None, None)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--since")
 
-    with open(file_path, "r") as fp:
-        bk = fp.read()
+    out = click.get_binary_stream("stdout")
 
-    click.echo(bk)
+    async for chunk in encode_records(
+        rss.backup(since=since_seq, since_ts=since_ts), compression
+    ):
+        out.write(chunk)
+
+    out.flush()
 
 
 @cli.command()
-@click.argument("file_path")
-async def restore(file_path: PathLike):
+@click.argument("file_paths", nargs=-1, required=True)
+async def restore(file_paths: List[PathLike]):
     """
-    Restore a json-format backup of the Precis state
+    Restore a backup of the Precis state, in either the NDJSON
+    or the older json format. A full backup may be followed by
+    the incremental backups taken after it, oldest first.
     """
-    with open(Path(file_path).resolve(), "r") as fp:
-        await rss.restore(fp)
+    with ExitStack() as stack:
+        files = [stack.enter_context(open(Path(i).resolve(), "rb")) for i in file_paths]
+        restored = await rss.restore(
+            *files, progress=lambda n: click.echo(f"restored {n} records", err=True)
+        )
+
+    click.echo(f"Restored {restored} records from {len(file_paths)} backup(s)")
 
 
 @cli.command()
@@ -80,6 +110,12 @@ async def check_feeds():
     logger.info("Precis CLI requested to check feeds")
     await rss.check_feeds()
 
+    # there are no background workers here, so retrieve content before exiting
+    done = await workers.drain()
+    logger.info(f"Ran {done} queued job(s)")
+
+    await outbox.deliver()
+
 
 @cli.command()
 def load_settings():
@@ -95,3 +131,17 @@ def load_handlers():
     Load handlers from a YML-formatted handlers.yml file in the config dir
     """
     rss.load_handlers()
+
+
+@cli.command()
+def migrate_media():
+    """
+    Move content saved by the hybrid storage handler into the
+    compressed, sharded media layout
+    """
+    store = MediaStore(Path(DATA_DIR, "media"))
+    migrated = store.migrate(
+        progress=lambda n: click.echo(f"migrated {n} files", err=True)
+    )
+
+    click.echo(f"Migrated {migrated} media files")
@@ -1,5 +1,5 @@
 from importlib.metadata import version
-from os import environ
+from os import cpu_count, environ
 from pathlib import Path
 
 CONFIG_DIR = environ.get("CONFIG_DIR", Path(__file__, "../../configs"))
@@ -8,6 +8,62 @@ IS_DOCKER = bool(environ.get("IS_DOCKER", False))
 # overrride this if you feel it's important to point to your fork
 GITHUB_LINK = environ.get("GITHUB_LINK", "https://github.com/leozqin/precis")
 
+# how many feeds may be polled at once, in total and against any single host
+POLL_CONCURRENCY = int(environ.get("POLL_CONCURRENCY", 16))
+POLL_HOST_CONCURRENCY = int(environ.get("POLL_HOST_CONCURRENCY", 2))
+
+# how long a fetched and parsed feed can be reused, in seconds
+FEED_CACHE_TTL = int(environ.get("FEED_CACHE_TTL", 60))
+
+# how long settings, handlers and feeds can be served from memory, in seconds.
+# writes through the same process invalidate them immediately.
+METADATA_CACHE_TTL = int(environ.get("METADATA_CACHE_TTL", 30))
+
+# how many background workers retrieve content, how often they look for work
+# queued by other processes, and how often failed jobs are retried
+QUEUE_WORKERS = int(environ.get("QUEUE_WORKERS", 4))
+QUEUE_POLL_INTERVAL = int(environ.get("QUEUE_POLL_INTERVAL", 5))
+QUEUE_MAX_ATTEMPTS = int(environ.get("QUEUE_MAX_ATTEMPTS", 5))
+QUEUE_RETRY_BACKOFF = int(environ.get("QUEUE_RETRY_BACKOFF", 30))
+
+# the playwright content retriever keeps one browser running, with at most this
+# many pages open at once, and replaces it after this many pages to cap memory
+PLAYWRIGHT_POOL_SIZE = int(environ.get("PLAYWRIGHT_POOL_SIZE", 4))
+PLAYWRIGHT_MAX_USES = int(environ.get("PLAYWRIGHT_MAX_USES", 200))
+PLAYWRIGHT_TIMEOUT = int(environ.get("PLAYWRIGHT_TIMEOUT", 30))
+
+# limits for the httpx content retriever, in seconds and bytes
+HTTP_CONNECT_TIMEOUT = int(environ.get("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_READ_TIMEOUT = int(environ.get("HTTP_READ_TIMEOUT", 30))
+HTTP_MAX_CONNECTIONS = int(environ.get("HTTP_MAX_CONNECTIONS", 20))
+HTTP_MAX_BODY_SIZE = int(environ.get("HTTP_MAX_BODY_SIZE", 5 * 1024 * 1024))
+
+# readability extraction runs in this many worker processes, and gives up on
+# documents that take longer than this many seconds or are larger than this
+EXTRACT_WORKERS = int(environ.get("EXTRACT_WORKERS", cpu_count() or 1))
+EXTRACT_TIMEOUT = int(environ.get("EXTRACT_TIMEOUT", 30))
+EXTRACT_MAX_SIZE = int(environ.get("EXTRACT_MAX_SIZE", 2 * 1024 * 1024))
+
+# how many llm summaries are kept on disk for reuse
+SUMMARY_CACHE_SIZE = int(environ.get("SUMMARY_CACHE_SIZE", 10000))
+
+# notifications are delivered from an outbox, this many at once to any one
+# destination, retrying failures with backoff up to this many times
+OUTBOX_DESTINATION_CONCURRENCY = int(environ.get("OUTBOX_DESTINATION_CONCURRENCY", 2))
+OUTBOX_MAX_ATTEMPTS = int(environ.get("OUTBOX_MAX_ATTEMPTS", 8))
+OUTBOX_RETRY_BACKOFF = int(environ.get("OUTBOX_RETRY_BACKOFF", 30))
+OUTBOX_POLL_INTERVAL = int(environ.get("OUTBOX_POLL_INTERVAL", 10))
+
+# restores are written in transactions of this many records, checkpointing
+# after each so that an interrupted restore can pick up where it stopped
+RESTORE_BATCH_SIZE = int(environ.get("RESTORE_BATCH_SIZE", 5000))
+
+# the packfile storage handler appends entry content to segments of this
+# size, and compacts a full segment once less than this share of it is live
+PACKFILE_SEGMENT_SIZE = int(environ.get("PACKFILE_SEGMENT_SIZE", 64 * 1024 * 1024))
+PACKFILE_COMPACT_RATIO = float(environ.get("PACKFILE_COMPACT_RATIO", 0.5))
+PACKFILE_COMPACT_INTERVAL = int(environ.get("PACKFILE_COMPACT_INTERVAL", 600))
+
 USER_AGENT = f"Precis/{version('precis')}"
 BANNED_GLOBS = [
     "*x.com/*",
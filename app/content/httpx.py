@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from importlib.util import find_spec
+from logging import getLogger
+
+from httpx import AsyncClient, HTTPStatusError, Limits, Timeout
+
+from app.constants import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_BODY_SIZE,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_READ_TIMEOUT,
+    USER_AGENT,
+)
+from app.handlers import ContentRetrievalHandler
+
+logger = getLogger("uvicorn.error")
+
+
+class HttpClient:
+    """
+    A connection pool shared by every HttpxContentRetriever, created the
+    first time it is needed. HTTP/2 is used when h2 is installed, and
+    responses are decompressed by httpx, including brotli when it is
+    installed.
+    """
+
+    def __init__(self) -> None:
+        self._client: AsyncClient = None
+
+    @property
+    def client(self) -> AsyncClient:
+        if not self._client or self._client.is_closed:
+            self._client = AsyncClient(
+                headers={"User-Agent": USER_AGENT},
+                http2=find_spec("h2") is not None,
+                follow_redirects=True,
+                timeout=Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                limits=Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                ),
+            )
+
+        return self._client
+
+    async def close(self) -> None:
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+
+http_client = HttpClient()
+
+
+class HttpxContentRetriever(ContentRetrievalHandler):
+    id = "httpx"
+
+    # httpx does not implement the use_script option so we'll just ignore it
+    async def get_html(self, url: str, use_script: bool = False) -> str:
+        try:
+            async with http_client.client.stream("GET", url) as response:
+                response.raise_for_status()
+
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body.extend(chunk)
+
+                    if len(body) > HTTP_MAX_BODY_SIZE:
+                        logger.warning(
+                            f"Skipping {url}, which is larger than "
+                            f"{HTTP_MAX_BODY_SIZE} bytes"
+                        )
+                        return
+
+                text = body.decode(response.encoding or "utf-8", errors="replace")
+
+                return text if text != "" else None
+
+        except HTTPStatusError as e:
+            # the server may recover from errors on its side, or from being
+            # asked too often, so those are left to be retried
+            if e.response.status_code == 429 or e.response.is_server_error:
+                raise
+
+            logger.warning(f"Failed to retrieve {url}: {e}")
+            return
@@ -1,52 +1,180 @@
 from __future__ import annotations
 
+from asyncio import Lock, Semaphore
+from contextlib import asynccontextmanager
 from logging import getLogger
+from typing import Dict, List
 
-from playwright.async_api import Playwright, Route, async_playwright
+from playwright.async_api import (
+    Browser,
+    BrowserContext,
+    Page,
+    Playwright,
+    Route,
+    async_playwright,
+)
 
-from app.constants import USER_AGENT
+from app.constants import (
+    PLAYWRIGHT_MAX_USES,
+    PLAYWRIGHT_POOL_SIZE,
+    PLAYWRIGHT_TIMEOUT,
+    USER_AGENT,
+)
 from app.handlers import ContentRetrievalHandler
 
 logger = getLogger("uvicorn.error")
 
+# stylesheets, images and fonts never contribute to the text of an article
+BLOCKED_RESOURCES = (
+    "**/*.{css,png,jpg,jpeg,gif,webp,avif,svg,ico,bmp,woff,woff2,ttf,otf,eot}"
+)
 
-class PlaywrightContentRetriever(ContentRetrievalHandler):
-    id = "playwright"
 
-    @staticmethod
-    async def _block_common_with_script(route: Route):
-        excluded_resource_types = ["stylesheet", "image", "font"]
-        if route.request.resource_type in excluded_resource_types:
-            await route.abort()
-        else:
-            await route.continue_()
+class BrowserGeneration:
+    """
+    A browser, its two contexts (with and without javascript) and the pages
+    they have opened. A generation is retired after it has served enough
+    pages, and closed once the last of them is handed back.
+    """
 
-    @staticmethod
-    async def _block_common(route: Route):
-        excluded_resource_types = ["stylesheet", "image", "font", "script"]
-        if route.request.resource_type in excluded_resource_types:
-            await route.abort()
-        else:
-            await route.continue_()
+    def __init__(self, browser: Browser, contexts: Dict[bool, BrowserContext]):
+        self.browser = browser
+        self.contexts = contexts
+        self.idle: Dict[bool, List[Page]] = {True: [], False: []}
+        self.uses = 0
+        self.in_use = 0
+        self.retired = False
+
+    async def close(self) -> None:
+        try:
+            await self.browser.close()
+        except Exception as e:
+            logger.debug(f"Failed to close browser cleanly: {e}")
+
+
+class BrowserPool:
+    """
+    A long-lived chromium shared by every PlaywrightContentRetriever, which
+    is launched the first time it is needed and reuses its pages between
+    urls, with at most `size` of them open at once
+    """
+
+    def __init__(
+        self,
+        size: int = PLAYWRIGHT_POOL_SIZE,
+        max_uses: int = PLAYWRIGHT_MAX_USES,
+        timeout: int = PLAYWRIGHT_TIMEOUT,
+    ) -> None:
+        self.size = size
+        self.max_uses = max_uses
+        self.timeout = timeout
+
+        self._playwright: Playwright = None
+        self._current: BrowserGeneration = None
+        self._lock: Lock = None
+        self._slots: Semaphore = None
 
     @staticmethod
-    async def _retrieve(url: str, playright: Playwright, use_script: bool = False):
-        browser = await playright.chromium.launch()
-        page = await browser.new_page(user_agent=USER_AGENT)
+    async def _block(route: Route):
+        await route.abort()
+
+    async def _launch(self) -> BrowserGeneration:
+        if not self._playwright:
+            self._playwright = await async_playwright().start()
+
+        logger.info("Launching chromium for content retrieval")
+        browser = await self._playwright.chromium.launch()
+
+        contexts = {}
+        for use_script in [True, False]:
+            context = await browser.new_context(
+                user_agent=USER_AGENT, java_script_enabled=use_script
+            )
+            context.set_default_timeout(self.timeout * 1000)
+            await context.route(BLOCKED_RESOURCES, self._block)
+            contexts[use_script] = context
+
+        return BrowserGeneration(browser=browser, contexts=contexts)
+
+    async def _generation(self) -> BrowserGeneration:
+        async with self._lock:
+            current = self._current
+
+            if current and current.uses >= self.max_uses:
+                logger.info(f"Recycling chromium after {current.uses} pages")
+                await self._retire(current)
+                current = None
+
+            if current and not current.browser.is_connected():
+                logger.warning("Chromium has disconnected, relaunching it")
+                current.retired = True
+                current = None
 
-        retriever = (
-            PlaywrightContentRetriever._block_common_with_script
-            if use_script
-            else PlaywrightContentRetriever._block_common
-        )
+            if not current:
+                current = self._current = await self._launch()
 
-        await page.route("**/*", retriever)
-        await page.goto(url)
+            current.uses += 1
+            current.in_use += 1
 
-        await page.wait_for_load_state("domcontentloaded")
+            return current
 
-        return await page.content()
+    async def _retire(self, generation: BrowserGeneration) -> None:
+        generation.retired = True
+
+        if generation.in_use == 0:
+            await generation.close()
+
+    @asynccontextmanager
+    async def page(self, use_script: bool = False):
+        # asyncio primitives belong to the loop that creates them
+        if not self._slots:
+            self._lock = Lock()
+            self._slots = Semaphore(self.size)
+
+        async with self._slots:
+            generation = await self._generation()
+            idle = generation.idle[use_script]
+
+            page = None
+            try:
+                page = idle.pop() if idle else None
+                if not page or page.is_closed():
+                    page = await generation.contexts[use_script].new_page()
+
+                yield page
+            except BaseException:
+                # a page that failed may be left mid-navigation, so drop it
+                if page:
+                    await page.close(run_before_unload=False)
+                page = None
+                raise
+            finally:
+                generation.in_use -= 1
+
+                if generation.retired:
+                    if generation.in_use == 0:
+                        await generation.close()
+                elif page:
+                    idle.append(page)
+
+    async def close(self) -> None:
+        if self._current:
+            await self._current.close()
+            self._current = None
+
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+browser_pool = BrowserPool()
+
+
+class PlaywrightContentRetriever(ContentRetrievalHandler):
+    id = "playwright"
 
     async def get_html(self, url: str, use_script: bool = False) -> str:
-        async with async_playwright() as pw:
-            return await self._retrieve(url=url, playright=pw, use_script=use_script)
+        async with browser_pool.page(use_script=use_script) as page:
+            await page.goto(url, wait_until="domcontentloaded")
+
+            return await page.content()
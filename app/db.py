@@ -1,8 +1,9 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from logging import getLogger
-from typing import List, Mapping, Optional, Type
+from typing import Iterable, List, Mapping, Optional, Set, Type
 
 from app.handlers import HandlerBase
 from app.models import *
@@ -16,6 +17,38 @@ class StorageHandler(ABC):
     def reconfigure_handler(self, id: str, config: Mapping) -> Type[HandlerBase]:
         return self.handler_map[id](**config)
 
+    @contextmanager
+    def snapshot(self):
+        """
+        Serve every read made inside this context from one consistent view of
+        the database, while still seeing writes made through this handler.
+        Handlers that cannot offer such a view do nothing.
+        """
+        yield
+
+    @contextmanager
+    def batch(self):
+        """
+        Group every write made inside this context into a single commit, so a
+        poll or a restore does not pay for one commit per record. Batches may
+        be nested, in which case only the outermost one commits. Handlers that
+        cannot batch write through as usual.
+        """
+        yield
+
+    def start(self) -> None:
+        """
+        Start any background maintenance the handler needs. Handlers that
+        need none do nothing.
+        """
+        pass
+
+    async def stop(self) -> None:
+        """
+        Stop whatever was started by start()
+        """
+        pass
+
     @abstractmethod
     def clear_active_feeds(self) -> None:
         """
@@ -84,6 +117,23 @@ class StorageHandler(ABC):
         """
         pass
 
+    @abstractmethod
+    def get_feed_validators(self, feed: Feed) -> FeedValidators:
+        """
+        Given a feed, retrieve the ETag, Last-Modified and permanent redirect
+        url recorded the last time it was polled, returning empty validators
+        if there are none
+        """
+        pass
+
+    @abstractmethod
+    def update_feed_validators(self, feed: Feed, validators: FeedValidators) -> None:
+        """
+        Given a feed and the validators from its latest poll, store them
+        alongside the poll state for that feed
+        """
+        pass
+
     @abstractmethod
     def upsert_feed_entry(self, feed: Feed, entry: FeedEntry) -> None:
         """
@@ -101,7 +151,19 @@ class StorageHandler(ABC):
         dicts, where each dict has key entry = FeedEntry object, feed_id = the
         id of the feed for which the entry exists, and id = the entry ID. If no
         feed is specified return entries for all feeds. Optionally, only return
-        entries after a certain epoch timestamp.
+        entries after a certain epoch timestamp. Entries are returned newest
+        first, and handlers should use an index on publish time so that the
+        cost depends on the number of entries returned rather than stored.
+        """
+        pass
+
+    @abstractmethod
+    def get_feed_stats(self) -> Mapping[str, FeedStats]:
+        """
+        Return a mapping between feed IDs and the number of entries stored for
+        that feed, along with the latest publish time among them. Handlers
+        should maintain these as entries are written and deleted rather than
+        counting entries when asked.
         """
         pass
 
@@ -119,6 +181,14 @@ class StorageHandler(ABC):
         """
         pass
 
+    @abstractmethod
+    def feed_entries_exist(self, ids: Iterable[str]) -> Set[str]:
+        """
+        Given a collection of IDs, return the subset of them for which a
+        feed entry exists
+        """
+        pass
+
     @abstractmethod
     async def upsert_entry_content(self, content: EntryContent):
         """
@@ -199,7 +269,49 @@ class StorageHandler(ABC):
         """
         pass
 
-    async def get_content(self, entry: FeedEntry) -> EntryContent:
+    @abstractmethod
+    def upsert_outbox_item(self, item: OutboxItem) -> None:
+        """
+        Given a notification waiting to be delivered, add it to the outbox or
+        update it if it is already there
+        """
+        pass
+
+    @abstractmethod
+    def get_outbox_items(self, before: float) -> List[OutboxItem]:
+        """
+        Retrieve the notifications in the outbox that may be delivered at the
+        given time, oldest first
+        """
+        pass
+
+    @abstractmethod
+    def delete_outbox_item(self, item: OutboxItem) -> None:
+        """
+        Given a notification in the outbox, remove it from the outbox
+        """
+        pass
+
+    @abstractmethod
+    def get_changes(self, after: int = 0) -> List[Change]:
+        """
+        Retrieve the latest change to each feed, entry, entry content,
+        handler and the settings made after the given change sequence number,
+        oldest first
+        """
+        pass
+
+    @abstractmethod
+    def get_change_seq(self) -> int:
+        """
+        Return the sequence number of the most recent change, or 0 if
+        nothing has changed yet
+        """
+        pass
+
+    async def get_content(
+        self, entry: FeedEntry, raise_errors: bool = False
+    ) -> EntryContent:
 
         feed = self.get_feed(entry.feed_id)
         self.logger.debug(f"Found feed {feed} for entry {entry}")
@@ -207,14 +319,14 @@ class StorageHandler(ABC):
         summarizer = settings.llm_handler.summarize
 
         content = await settings.content_retrieval_handler.get_content(
-            feed=feed, entry=entry, summarizer=summarizer
+            feed=feed, entry=entry, summarizer=summarizer, raise_errors=raise_errors
         )
         self.logger.debug(f"Received content {content}")
 
         return content
 
     async def get_entry_content(
-        self, entry: FeedEntry, redrive: bool = False
+        self, entry: FeedEntry, redrive: bool = False, raise_errors: bool = False
     ) -> EntryContent:
 
         if self.entry_content_exists(entry) and not redrive:
@@ -225,7 +337,9 @@ class StorageHandler(ABC):
                 self.logger.info(f"starting redrive for feed entry {entry.id}")
 
             self.logger.debug(f"Getting content for entry {type(entry)}: {entry}")
-            entry_content = await self.get_content(entry=entry)
+            entry_content = await self.get_content(
+                entry=entry, raise_errors=raise_errors
+            )
             await self.upsert_entry_content(entry_content)
 
             return entry_content
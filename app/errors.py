@@ -2,3 +2,14 @@ class InvalidFeedException(Exception):
     """
     Exception for when a Feed fails validation
     """
+
+
+class RateLimited(Exception):
+    """
+    Exception for when a notification destination asks us to slow down,
+    optionally saying for how many seconds
+    """
+
+    def __init__(self, retry_after: float = None) -> None:
+        super().__init__(f"Rate limited, retry after {retry_after}s")
+        self.retry_after = retry_after
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+from asyncio import Lock, Queue, gather, to_thread
+from logging import getLogger
+from multiprocessing import get_context
+from multiprocessing.connection import Connection
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+from app.constants import EXTRACT_TIMEOUT, EXTRACT_WORKERS
+
+logger = getLogger("uvicorn.error")
+
+
+def _serve(conn: Connection) -> None:
+    # say that start-up is done, then run jobs until the pool goes away
+    conn.send(None)
+
+    while True:
+        try:
+            fn, args = conn.recv()
+        except EOFError:
+            return
+
+        try:
+            conn.send((True, fn(*args)))
+        except Exception as e:
+            conn.send((False, e))
+
+
+class Worker:
+    """
+    A single extraction process, and the pipe jobs are sent to it over.
+    Creating one blocks until the process has started.
+    """
+
+    def __init__(self) -> None:
+        # spawn, because forking a process that runs threads is unsafe
+        context = get_context("spawn")
+
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+        self.conn.recv()
+
+    def call(self, fn: Callable, args: Tuple, timeout: float) -> Tuple[bool, Any]:
+        self.conn.send((fn, args))
+
+        if not self.conn.poll(timeout):
+            raise TimeoutError
+
+        return self.conn.recv()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class ExtractionPool:
+    """
+    A pool of worker processes for cpu-heavy work such as readability
+    extraction, so that it neither blocks the event loop nor competes with
+    it for the GIL. Each job has a worker to itself, so a job that runs past
+    the timeout has only its own worker killed, and the jobs running on the
+    others carry on. Killed workers are replaced before their next job, and
+    starting a worker never counts against the timeout.
+    """
+
+    def __init__(
+        self, workers: int = EXTRACT_WORKERS, timeout: int = EXTRACT_TIMEOUT
+    ) -> None:
+        self.workers = workers
+        self.timeout = timeout
+
+        # idle workers, with None in place of one that has to be replaced
+        self._idle: Queue[Optional[Worker]] = None
+        self._workers: Set[Worker] = set()
+        self._starting: Lock = None
+
+    async def _spawn(self) -> Worker:
+        worker = await to_thread(Worker)
+        self._workers.add(worker)
+
+        return worker
+
+    def _kill(self, worker: Worker) -> None:
+        self._workers.discard(worker)
+        worker.kill()
+
+    async def start(self) -> None:
+        if not self._starting:
+            self._starting = Lock()
+
+        async with self._starting:
+            if self._idle is None:
+                workers: List[Worker] = await gather(
+                    *[self._spawn() for _ in range(self.workers)]
+                )
+
+                self._idle = Queue()
+                for worker in workers:
+                    self._idle.put_nowait(worker)
+
+    async def run(self, fn: Callable, *args) -> Any:
+        await self.start()
+
+        idle = self._idle
+        worker = await idle.get()
+        healthy = False
+
+        try:
+            if not worker:
+                worker = await self._spawn()
+
+            ok, value = await to_thread(worker.call, fn, args, self.timeout)
+            healthy = True
+        except TimeoutError:
+            logger.warning(
+                f"{fn.__qualname__} took longer than {self.timeout}s, "
+                "killing its worker"
+            )
+            raise
+        finally:
+            # a worker that timed out, died or was abandoned may still be busy,
+            # so it is never handed another job
+            if worker and not healthy:
+                self._kill(worker)
+
+            idle.put_nowait(worker if healthy else None)
+
+        if not ok:
+            raise value
+
+        return value
+
+    def close(self) -> None:
+        for worker in list(self._workers):
+            self._kill(worker)
+
+        self._idle = None
+
+
+extraction_pool = ExtractionPool()
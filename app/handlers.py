@@ -1,17 +1,20 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from asyncio import Semaphore
 from fnmatch import fnmatch
 from logging import getLogger
 from os import environ
-from typing import Callable, ClassVar
+from typing import Awaitable, Callable, ClassVar, Dict, Hashable, List, Tuple
 
 from markdown2 import markdown
 from pydantic import BaseModel
 from readabilipy import simple_json_from_html_string
 
-from app.constants import BANNED_GLOBS
+from app.constants import BANNED_GLOBS, EXTRACT_MAX_SIZE
+from app.extraction import extraction_pool
 from app.models import EntryContent, Feed, FeedEntry
+from app.summary_cache import summary_cache
 
 logger = getLogger("uvicorn.error")
 
@@ -31,7 +34,8 @@ class ContentRetrievalHandler(HandlerBase):
         self,
         entry: FeedEntry,
         feed: Feed,
-        summarizer: Callable[[Feed, FeedEntry, str], str],
+        summarizer: Callable[[Feed, FeedEntry, str], Awaitable[str]],
+        raise_errors: bool = False,
     ) -> EntryContent:
         if await self.is_banned(entry.url):
             logger.info(f"Found banned entry from url {entry.url}")
@@ -46,11 +50,11 @@ class ContentRetrievalHandler(HandlerBase):
             else:
                 html = await self.get_html(url=entry.url, use_script=feed.use_script)
 
-            content = self.get_main_content(content=html)
+            content = await self.extract_main_content(content=html)
             if not html or not content:
                 return EntryContent(url=entry.url, unretrievable=True)
             else:
-                summary = summarizer(feed=feed, entry=entry, mk=content)
+                summary = await summarizer(feed=feed, entry=entry, mk=content)
 
                 return EntryContent(
                     url=entry.url,
@@ -60,6 +64,11 @@ class ContentRetrievalHandler(HandlerBase):
                 )
 
         except Exception as e:
+            # a caller that will try again wants the error rather than an
+            # entry marked unretrievable for good
+            if raise_errors:
+                raise
+
             logger.warning(
                 f"Encountered retrieval exception, returning unretrievable: {e}"
             )
@@ -69,6 +78,19 @@ class ContentRetrievalHandler(HandlerBase):
     async def is_banned(url) -> bool:
         return any(fnmatch(url, i) for i in BANNED_GLOBS)
 
+    @classmethod
+    async def extract_main_content(cls, content: str) -> str:
+        if not content:
+            return
+
+        if len(content) > EXTRACT_MAX_SIZE:
+            logger.warning(
+                f"Skipping extraction of a {len(content)} character document"
+            )
+            return
+
+        return await extraction_pool.run(cls.get_main_content, content)
+
     @staticmethod
     def get_main_content(content: str) -> str:
         md = simple_json_from_html_string(html=content, use_readability=True)
@@ -97,14 +119,68 @@ class NotificationHandler(HandlerBase):
     async def send_notification(self, feed: Feed, entry: FeedEntry):
         pass
 
+    async def send_digest(
+        self, destination: str, entries: List[Tuple[Feed, FeedEntry]]
+    ):
+        """
+        Send one message to a destination for several entries. Handlers that
+        can't batch messages send one per entry instead.
+        """
+        for feed, entry in entries:
+            await self.send_notification(feed=feed, entry=entry)
+
+
+# handler objects are rebuilt from their config whenever settings change, so
+# anything that should outlive them lives at module level
+_llm_limits: Dict[Hashable, Semaphore] = {}
+
 
 class LLMHandler(HandlerBase):
     id: ClassVar[str] = "generic_llm_handler"
 
     @abstractmethod
-    def summarize(self, feed: Feed, entry: FeedEntry, mk: str):
+    async def summarize(self, feed: Feed, entry: FeedEntry, mk: str):
         pass
 
+    @staticmethod
+    def in_flight(key: Hashable, limit: int) -> Semaphore:
+        """
+        A semaphore allowing `limit` calls at once, shared by every handler
+        that asks for the same key
+        """
+        key = (key, limit)
+
+        if key not in _llm_limits:
+            _llm_limits[key] = Semaphore(limit)
+
+        return _llm_limits[key]
+
+    async def cached_summary(
+        self,
+        model: str,
+        system: str,
+        prompt: str,
+        generate: Callable[[], Awaitable[str]],
+    ) -> str:
+        """
+        Reuse the summary of an identical request if one was made before,
+        else generate one and remember it
+        """
+        key = summary_cache.key(
+            handler_id=self.id, model=model, system=system, prompt=prompt
+        )
+
+        summary = summary_cache.get(key)
+        if summary is not None:
+            logger.info(f"Reusing cached summary from {self.id} model {model}")
+            return summary
+
+        summary = await generate()
+        if summary:
+            summary_cache.set(key, summary)
+
+        return summary
+
     def get_summarization_prompt(self, mk: str):
         prompt = f"""
 Summarize this article:
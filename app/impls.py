@@ -2,6 +2,7 @@ from logging import getLogger
 from os import environ
 from typing import Type, Union
 
+from app.content.httpx import HttpxContentRetriever
 from app.content.playwright import PlaywrightContentRetriever
 from app.content.requests import RequestsContentRetriever
 from app.db import StorageHandler
@@ -16,6 +17,8 @@ from app.notification.null import NullNotificationHandler
 from app.notification.slack import SlackNotificationHandler
 from app.storage.hybrid import HybridLMDBOfflineStorageHandler
 from app.storage.lmdb import LMDBStorageHandler
+from app.storage.metadata import MetadataCacheMixin
+from app.storage.packfile import PackfileStorageHandler
 from app.storage.tinydb import TinyDBStorageHandler
 
 logger = getLogger("uvicorn.error")
@@ -24,6 +27,7 @@ storage_handlers = {
     "tinydb": TinyDBStorageHandler,
     "lmdb": LMDBStorageHandler,
     "hybrid": HybridLMDBOfflineStorageHandler,
+    "packfile": PackfileStorageHandler,
 }
 
 notification_handlers = {
@@ -35,6 +39,7 @@ notification_handlers = {
 }
 
 content_retrieval_handlers = {
+    "httpx": HttpxContentRetriever,
     "requests": RequestsContentRetriever,
     "playwright": PlaywrightContentRetriever,
 }
@@ -73,14 +78,16 @@ class ImplMixin:
 def load_storage_config() -> Type[Union[Type[StorageHandler], ImplMixin],]:
     config_type = environ.get("PRECIS_STORAGE_HANDLER", "tinydb")
     handler_type = storage_handlers.get(config_type)
-    handler = handler_type()
 
     # for the purpose of managing settings, the db handler needs to know about
     # implementations of other handlers. Here, we modify the signature of the chosen
     # handler to include the other handler impls. Doing it this way avoids creating a
-    # circular dependency
-    handler_cls_name = handler.__class__.__name__
-    handler.__class__ = type(handler_cls_name, (handler_type, ImplMixin), {})
+    # circular dependency. Settings, handlers and feeds are also cached in front
+    # of the chosen handler, so the cache has to come first in the bases.
+    handler_cls = type(
+        handler_type.__name__, (MetadataCacheMixin, handler_type, ImplMixin), {}
+    )
+    handler = handler_cls()
 
     logger.info(f"loading storage handler of type {config_type}")
 
@@ -12,5 +12,5 @@ class DummyLLMHandler(LLMHandler, BaseModel):
     # a dummy config option
     temerity: int = 5
 
-    def summarize(self, feed: Feed, entry: FeedEntry, mk: str):
+    async def summarize(self, feed: Feed, entry: FeedEntry, mk: str):
         return "cool story bro"
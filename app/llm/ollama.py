@@ -1,36 +1,49 @@
+from functools import lru_cache, partial
 from typing import Any, ClassVar, Mapping
 
-from ollama import ChatResponse, Client, Message, Options
+from ollama import AsyncClient, ChatResponse, Message, Options
 from pydantic import BaseModel
 
 from app.handlers import LLMHandler
 from app.models import Feed, FeedEntry
 
 
+@lru_cache(maxsize=8)
+def _client(base_url: str) -> AsyncClient:
+    # one pooled client per server, reused across calls and handler objects
+    return AsyncClient(host=base_url)
+
+
 class OllamaLLMHandler(LLMHandler, BaseModel):
     base_url: str
     model: str
     system: str = None
     options: Mapping[str, Any]
+    max_in_flight: int = 1
 
     id: ClassVar[str] = "ollama"
 
-    def _make_chat_call(self, system: str, prompt: str):
-        client = Client(host=self.base_url)
+    async def _make_chat_call(self, system: str, prompt: str):
+        client = _client(self.base_url)
         system = Message(role="system", content=system)
         prompt = Message(role="user", content=prompt)
 
         options = Options(**self.options)
 
-        chat: ChatResponse = client.chat(
-            model=self.model, messages=[system, prompt], options=options
-        )
+        async with self.in_flight((self.id, self.base_url), self.max_in_flight):
+            chat: ChatResponse = await client.chat(
+                model=self.model, messages=[system, prompt], options=options
+            )
 
         return chat["message"]["content"]
 
-    def summarize(self, feed: Feed, entry: FeedEntry, mk: str):
+    async def summarize(self, feed: Feed, entry: FeedEntry, mk: str):
         system = self.system if self.system else self.summarization_system_prompt
+        prompt = self.get_summarization_prompt(mk)
 
-        return self._make_chat_call(
-            system=system, prompt=self.get_summarization_prompt(mk)
+        return await self.cached_summary(
+            model=self.model,
+            system=system,
+            prompt=prompt,
+            generate=partial(self._make_chat_call, system=system, prompt=prompt),
         )
@@ -1,29 +1,49 @@
+from functools import lru_cache, partial
 from os import environ
 from typing import ClassVar
 
-from openai import OpenAI
+from openai import AsyncOpenAI
 from pydantic import BaseModel
 
 from app.handlers import LLMHandler
 from app.models import Feed, FeedEntry
 
 
+@lru_cache(maxsize=8)
+def _client(api_key: str) -> AsyncOpenAI:
+    # one pooled client per key, reused across calls and handler objects
+    return AsyncOpenAI(api_key=api_key)
+
+
 class OpenAILLMHandler(LLMHandler, BaseModel):
     api_key: str = environ.get("OPENAI_API_KEY")
     model: str = "gpt-4o-mini"
+    max_in_flight: int = 4
 
     id: ClassVar[str] = "openai"
 
-    def summarize(self, feed: Feed, entry: FeedEntry, mk: str):
-        client = OpenAI(api_key=self.api_key)
+    async def _make_chat_call(self, system: str, prompt: str):
+        client = _client(self.api_key)
 
-        completion = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": self.summarization_system_prompt},
-                {"role": "user", "content": self.get_summarization_prompt(mk=mk)},
-            ],
-            model=self.model,
-            n=1,
-        )
+        async with self.in_flight((self.id, self.api_key), self.max_in_flight):
+            completion = await client.chat.completions.create(
+                messages=[
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": prompt},
+                ],
+                model=self.model,
+                n=1,
+            )
 
         return completion.choices[0].message.content
+
+    async def summarize(self, feed: Feed, entry: FeedEntry, mk: str):
+        system = self.summarization_system_prompt
+        prompt = self.get_summarization_prompt(mk=mk)
+
+        return await self.cached_summary(
+            model=self.model,
+            system=system,
+            prompt=prompt,
+            generate=partial(self._make_chat_call, system=system, prompt=prompt),
+        )
@@ -1,9 +1,41 @@
 from hashlib import md5
-from typing import Type
+from typing import Type, Union
 
 from feedparser import FeedParserDict, parse
 from pydantic import BaseModel
 
+from app.cache import TTLCache
+from app.constants import FEED_CACHE_TTL
+
+# parsed feeds shared between validating a new feed and first polling it
+feed_cache = TTLCache(ttl=FEED_CACHE_TTL)
+
+
+def make_id(url: str) -> str:
+    return md5(url.encode()).hexdigest()
+
+
+class FeedValidators(BaseModel):
+    etag: str = None
+    modified: str = None
+    redirect_url: str = None
+
+    def update(self, rss: Union[FeedParserDict, dict]) -> "FeedValidators":
+        """
+        Given the result of a fetch, return the validators to send next time
+        """
+        status = rss.get("status")
+        if not status:
+            # the fetch failed outright, so hold on to what we had
+            return self
+
+        return FeedValidators(
+            etag=rss.get("etag", self.etag),
+            modified=rss.get("modified", self.modified),
+            # only permanent redirects are remembered between polls
+            redirect_url=rss.get("href") if status == 301 else self.redirect_url,
+        )
+
 
 class Feed(BaseModel):
     name: str
@@ -16,18 +48,48 @@ class Feed(BaseModel):
     refresh_enabled: bool = True
     use_script: bool = False
     retrieve_content: bool = True
+    digest: bool = False
 
     @property
     def rss(self) -> Type[FeedParserDict]:
-        return parse(self.url)
+        return self.fetch()
+
+    def fetch(
+        self, validators: FeedValidators = None, cached: bool = False
+    ) -> Type[FeedParserDict]:
+        """
+        Fetch and parse the feed, sending any validators from a previous poll
+        so that an unchanged feed can answer with a 304. Given `cached`, a
+        successful fetch without validators is shared for FEED_CACHE_TTL
+        seconds, so that validating and then first polling a new feed only
+        fetches it once.
+        """
+        validators = validators or FeedValidators()
+        cached = cached and validators == FeedValidators()
+
+        if cached and (rss := feed_cache.get(self.url)) is not None:
+            return rss
+
+        rss = parse(
+            validators.redirect_url or self.url,
+            etag=validators.etag,
+            modified=validators.modified,
+        )
+
+        # a fetch that failed outright has no status
+        status = rss.get("status")
+        if cached and status and status < 400:
+            feed_cache.set(self.url, rss)
+
+        return rss
 
     @property
     def id(self) -> str:
-        return md5(self.url.encode()).hexdigest()
+        return make_id(self.url)
 
     def validate(self):
         try:
-            return bool(self.rss.entries)
+            return bool(self.fetch(cached=True).entries)
         except Exception:
             return False
 
@@ -44,7 +106,7 @@ class FeedEntry(BaseModel):
 
     @property
     def id(self) -> str:
-        return md5(self.url.encode()).hexdigest()
+        return make_id(self.url)
 
 
 class EntryContent(BaseModel):
@@ -56,7 +118,61 @@ class EntryContent(BaseModel):
 
     @property
     def id(self) -> str:
-        return md5(self.url.encode()).hexdigest()
+        return make_id(self.url)
+
+
+class FeedStats(BaseModel):
+    entry_count: int = 0
+    latest_published_at: int = None
+
+
+class PollResult(BaseModel):
+    feed_id: str
+    name: str
+    new_entries: int = 0
+    elapsed: float = 0
+    error: str = None
+
+
+class Job(BaseModel):
+    kind: str
+    key: str
+    payload: dict = {}
+    priority: int = 5
+    attempts: int = 0
+    not_before: float = 0
+    seq: int = 0
+    error: str = None
+
+    @property
+    def id(self) -> str:
+        return f"{self.kind}:{self.key}"
+
+
+class OutboxItem(BaseModel):
+    entry_id: str
+    feed_id: str
+    destination: str = None
+    digest: bool = False
+    attempts: int = 0
+    not_before: float = 0
+    error: str = None
+
+    @property
+    def id(self) -> str:
+        return self.entry_id
+
+
+class Change(BaseModel):
+    seq: int
+    kind: str
+    id: str
+    ts: int
+    deleted: bool = False
+
+    @property
+    def key(self) -> str:
+        return f"{self.kind}:{self.id}"
 
 
 class HealthCheck(BaseModel):
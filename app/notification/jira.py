@@ -1,16 +1,28 @@
+from asyncio import to_thread
+from functools import lru_cache
 from logging import getLogger
 from os import environ
 from re import sub
-from typing import ClassVar, Mapping
+from typing import ClassVar, List, Mapping, Tuple
 
-from jira import JIRA
+from jira import JIRA, JIRAError
 
+from app.errors import RateLimited
 from app.handlers import NotificationHandler
 from app.models import Feed, FeedEntry
 
 logger = getLogger("uvicorn.error")
 
 
+@lru_cache(maxsize=8)
+def _client(server: str, email: str, token: str) -> JIRA:
+    # authenticating is a round trip, so keep one client per account
+    client = JIRA(server=server, basic_auth=(email, token))
+    client._options.update({"rest_api_version": 3})
+
+    return client
+
+
 class JiraNotificationHandler(NotificationHandler):
     id: ClassVar[str] = "jira"
     token: str = environ.get("JIRA_API_TOKEN")
@@ -33,21 +45,51 @@ class JiraNotificationHandler(NotificationHandler):
             ).split()
         )
 
-    async def send_notification(self, feed: Feed, entry: FeedEntry):
-        server = JIRA(server=self.server, basic_auth=(self.email, self.token))
-        server._options.update({"rest_api_version": 3})
-
-        summary = f"{feed.name}: {entry.title}"
-
-        if feed.notify_destination:
-            project = self.routing.get(feed.notify_destination, self.project)
-            logger.info(
-                "Creating issue in project " f"{feed.notify_destination} - {project}"
-            )
+    def _project(self, destination: str) -> str:
+        if destination:
+            project = self.routing.get(destination, self.project)
+            logger.info(f"Creating issue in project {destination} - {project}")
         else:
             project = self.project
             logger.info(f"Sending notification to default project {project}")
 
+        return project
+
+    @staticmethod
+    def _link_item(text: str, href: str) -> Mapping:
+        return {
+            "type": "listItem",
+            "content": [
+                {
+                    "type": "paragraph",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": text,
+                            "marks": [{"type": "link", "attrs": {"href": href}}],
+                        },
+                    ],
+                }
+            ],
+        }
+
+    async def _create_issue(self, **fields):
+        # the jira client is synchronous, so keep it off the event loop
+        server = await to_thread(_client, self.server, self.email, self.token)
+
+        try:
+            await to_thread(server.create_issue, issuetype={"name": "Task"}, **fields)
+        except JIRAError as e:
+            if e.status_code == 429:
+                headers = e.response.headers if e.response is not None else {}
+                retry_after = headers.get("Retry-After")
+                raise RateLimited(float(retry_after) if retry_after else None)
+
+            raise
+
+    async def send_notification(self, feed: Feed, entry: FeedEntry):
+        summary = f"{feed.name}: {entry.title}"
+
         description = {
             "type": "doc",
             "version": 1,
@@ -64,61 +106,46 @@ class JiraNotificationHandler(NotificationHandler):
                 {
                     "type": "bulletList",
                     "content": [
-                        {
-                            "type": "listItem",
-                            "content": [
-                                {
-                                    "type": "paragraph",
-                                    "content": [
-                                        {
-                                            "type": "text",
-                                            "text": "Read in Precis",
-                                            "marks": [
-                                                {
-                                                    "type": "link",
-                                                    "attrs": {
-                                                        "href": self.make_read_link(
-                                                            entry
-                                                        ),
-                                                    },
-                                                }
-                                            ],
-                                        },
-                                    ],
-                                }
-                            ],
-                        },
-                        {
-                            "type": "listItem",
-                            "content": [
-                                {
-                                    "type": "paragraph",
-                                    "content": [
-                                        {
-                                            "type": "text",
-                                            "text": "Read Original",
-                                            "marks": [
-                                                {
-                                                    "type": "link",
-                                                    "attrs": {
-                                                        "href": entry.url,
-                                                    },
-                                                }
-                                            ],
-                                        },
-                                    ],
-                                }
-                            ],
-                        },
+                        self._link_item("Read in Precis", self.make_read_link(entry)),
+                        self._link_item("Read Original", entry.url),
                     ],
                 },
             ],
         }
 
-        server.create_issue(
-            project=project,
+        await self._create_issue(
+            project=self._project(feed.notify_destination),
             summary=summary,
             description=description,
-            issuetype={"name": "Task"},
             labels=[self.labelfy(feed.name), self.labelfy(feed.category)],
         )
+
+    async def send_digest(
+        self, destination: str, entries: List[Tuple[Feed, FeedEntry]]
+    ):
+        description = {
+            "type": "doc",
+            "version": 1,
+            "content": [
+                {
+                    "type": "bulletList",
+                    "content": [
+                        self._link_item(
+                            f"{feed.name}: {entry.title}", self.make_read_link(entry)
+                        )
+                        for feed, entry in entries
+                    ],
+                },
+            ],
+        }
+
+        labels = {self.labelfy(feed.name) for feed, _ in entries} | {
+            self.labelfy(feed.category) for feed, _ in entries
+        }
+
+        await self._create_issue(
+            project=self._project(destination),
+            summary=f"{len(entries)} new feed entries",
+            description=description,
+            labels=sorted(labels),
+        )
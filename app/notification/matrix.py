@@ -1,6 +1,6 @@
 from logging import getLogger
 from os import environ
-from typing import ClassVar, Mapping
+from typing import ClassVar, List, Mapping, Tuple
 
 from pydantic import BaseModel, PrivateAttr
 from simplematrixbotlib import Bot, Creds
@@ -45,17 +45,32 @@ class MatrixNotificationHandler(NotificationHandler, BaseModel):
     async def logout(self) -> None:
         await self.bot.api.async_client.logout()
 
-    async def send_notification(self, feed: Feed, entry: FeedEntry):
-        msg = f"{feed.name}: [{entry.title}]({self.make_read_link(entry)})"
-
-        if feed.notify_destination:
-            room = self.routing.get(feed.notify_destination, self.default_room)
-            logger.info(
-                "Sending notification to destination "
-                f"{feed.notify_destination} - {room}"
-            )
+    def _room(self, destination: str) -> str:
+        if destination:
+            room = self.routing.get(destination, self.default_room)
+            logger.info(f"Sending notification to destination {destination} - {room}")
         else:
             room = self.default_room
             logger.info(f"Sending notification to default {room}")
 
-        await self.bot.api.send_markdown_message(room_id=room, message=msg)
+        return room
+
+    async def send_notification(self, feed: Feed, entry: FeedEntry):
+        msg = f"{feed.name}: [{entry.title}]({self.make_read_link(entry)})"
+
+        await self.bot.api.send_markdown_message(
+            room_id=self._room(feed.notify_destination), message=msg
+        )
+
+    async def send_digest(
+        self, destination: str, entries: List[Tuple[Feed, FeedEntry]]
+    ):
+        lines = [
+            f"- {feed.name}: [{entry.title}]({self.make_read_link(entry)})"
+            for feed, entry in entries
+        ]
+        msg = "\n".join([f"{len(entries)} new entries:", *lines])
+
+        await self.bot.api.send_markdown_message(
+            room_id=self._room(destination), message=msg
+        )
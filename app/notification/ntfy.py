@@ -1,10 +1,10 @@
 from json import dumps
 from logging import getLogger
 from os import environ
-from typing import ClassVar, Mapping
-
-import requests
+from typing import ClassVar, List, Mapping, Tuple
 
+from app.content.httpx import http_client
+from app.errors import RateLimited
 from app.handlers import NotificationHandler
 from app.models import Feed, FeedEntry
 
@@ -17,15 +17,33 @@ class NtfyNotificationHandler(NotificationHandler):
     topic: str = environ.get("NTFY_TOPIC")
     routing: Mapping[str, str] = {}
 
-    async def send_notification(self, feed: Feed, entry: FeedEntry):
-
-        if feed.notify_destination:
-            topic = self.routing.get(feed.notify_destination, self.topic)
-            logger.info(f"Sending message to topic {feed.notify_destination} - {topic}")
+    def _topic(self, destination: str) -> str:
+        if destination:
+            topic = self.routing.get(destination, self.topic)
+            logger.info(f"Sending message to topic {destination} - {topic}")
         else:
             topic = self.topic
             logger.info(f"Sending message to default topic {topic}")
 
+        return topic
+
+    async def _post(self, data: Mapping):
+        logger.debug(f"request to ntfy: {data}")
+
+        req = await http_client.client.post(url=self.root_url, content=dumps(data))
+
+        logger.debug(f"response from ntfy: {req.text}: {req.reason_phrase}")
+
+        if req.status_code == 429:
+            retry_after = req.headers.get("Retry-After")
+            raise RateLimited(float(retry_after) if retry_after else None)
+
+        req.raise_for_status()
+
+    async def send_notification(self, feed: Feed, entry: FeedEntry):
+
+        topic = self._topic(feed.notify_destination)
+
         headers = {
             "title": "Precis: New Feed Entry",
             "tags": ["newspaper"],
@@ -50,8 +68,22 @@ class NtfyNotificationHandler(NotificationHandler):
             "actions": actions,
         }
 
-        logger.debug(f"request to ntfy: {data}")
+        await self._post(data)
 
-        req = requests.post(url=self.root_url, data=dumps(data))
+    async def send_digest(
+        self, destination: str, entries: List[Tuple[Feed, FeedEntry]]
+    ):
+        lines = [
+            f"- [{feed.name} - {entry.title}]({self.make_read_link(entry)})"
+            for feed, entry in entries
+        ]
+
+        data = {
+            "topic": self._topic(destination),
+            "title": f"Precis: {len(entries)} New Feed Entries",
+            "tags": ["newspaper"],
+            "markdown": True,
+            "message": "\n".join(lines),
+        }
 
-        logger.debug(f"response from ntfy: {req.text}: {req.reason}")
+        await self._post(data)
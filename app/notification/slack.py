@@ -1,15 +1,24 @@
+from functools import lru_cache
 from logging import getLogger
 from os import environ
-from typing import ClassVar, Mapping
+from typing import ClassVar, List, Mapping, Tuple
 
+from slack_sdk.errors import SlackApiError
 from slack_sdk.web.async_client import AsyncWebClient
 
+from app.errors import RateLimited
 from app.handlers import NotificationHandler
 from app.models import Feed, FeedEntry
 
 logger = getLogger("uvicorn.error")
 
 
+@lru_cache(maxsize=8)
+def _client(token: str) -> AsyncWebClient:
+    # one client per token, reused across messages and handler objects
+    return AsyncWebClient(token=token)
+
+
 class SlackNotificationHandler(NotificationHandler):
     id: ClassVar[str] = "slack"
     token: str = environ.get("SLACK_API_TOKEN")
@@ -23,20 +32,74 @@ class SlackNotificationHandler(NotificationHandler):
         # Iterate over the string and replace characters if needed
         return "".join(translation_table.get(c, c) for c in title)
 
+    def _channel(self, destination: str) -> str:
+        if destination:
+            channel = self.routing.get(destination, self.channel_name)
+            logger.info(
+                f"Sending notification to destination {destination} - {channel}"
+            )
+        else:
+            channel = self.channel_name
+            logger.info(f"Sending notification to default channel {channel}")
+
+        return channel
+
+    async def _post(self, **kwargs):
+        try:
+            await _client(self.token).chat_postMessage(**kwargs)
+        except SlackApiError as e:
+            if e.response.status_code == 429:
+                retry_after = e.response.headers.get("Retry-After")
+                raise RateLimited(float(retry_after) if retry_after else None)
+
+            raise
+
     async def send_notification(self, feed: Feed, entry: FeedEntry):
-        client = AsyncWebClient(token=self.token)
         title = self._escape_title(entry.title)
 
         msg = f"{feed.name}: <{self.make_read_link(entry)}|{title}>"
 
-        if feed.notify_destination:
-            channel = self.routing.get(feed.notify_destination, self.channel_name)
-            logger.info(
-                "Sending notification to destination "
-                f"{feed.notify_destination} - {channel}"
+        await self._post(
+            channel=self._channel(feed.notify_destination), text=msg, mrkdwn=True
+        )
+
+    async def send_digest(
+        self, destination: str, entries: List[Tuple[Feed, FeedEntry]]
+    ):
+        # slack allows 50 blocks in a message
+        shown = entries[:48]
+        lines = [
+            f"*{feed.name}*: <{self.make_read_link(entry)}|"
+            f"{self._escape_title(entry.title)}>"
+            for feed, entry in shown
+        ]
+
+        blocks = [
+            {
+                "type": "header",
+                "text": {"type": "plain_text", "text": f"{len(entries)} new entries"},
+            },
+            *[
+                {"type": "section", "text": {"type": "mrkdwn", "text": line}}
+                for line in lines
+            ],
+        ]
+
+        if len(entries) > len(shown):
+            blocks.append(
+                {
+                    "type": "context",
+                    "elements": [
+                        {
+                            "type": "mrkdwn",
+                            "text": f"and {len(entries) - len(shown)} more",
+                        }
+                    ],
+                }
             )
-        else:
-            channel = self.channel_name
-            logger.info(f"Sending notification to default channel {channel}")
 
-        await client.chat_postMessage(channel=channel, text=msg, mrkdwn=True)
+        await self._post(
+            channel=self._channel(destination),
+            text=f"{len(entries)} new entries",
+            blocks=blocks,
+        )
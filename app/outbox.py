@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+from asyncio import Event, Semaphore, Task, create_task, gather, wait_for
+from collections import defaultdict
+from functools import partial
+from logging import getLogger
+from time import time
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from app.constants import (
+    OUTBOX_DESTINATION_CONCURRENCY,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_POLL_INTERVAL,
+    OUTBOX_RETRY_BACKOFF,
+)
+from app.errors import RateLimited
+from app.handlers import NotificationHandler
+from app.models import Feed, FeedEntry, OutboxItem
+
+logger = getLogger("uvicorn.error")
+
+
+class NotificationOutbox:
+    """
+    Delivers the notifications that polling leaves in the outbox table of
+    the storage handler, so that a slow or rate limited notifier never holds
+    up ingestion. Destinations are delivered to concurrently, and each one
+    that asks us to back off is left alone until it is ready again.
+    """
+
+    def __init__(self, db, concurrency: int = OUTBOX_DESTINATION_CONCURRENCY) -> None:
+        self.db = db
+        self.concurrency = concurrency
+
+        self.wakeup: Event = None
+        self.task: Task = None
+
+        # destinations that rate limited us, and when they may be tried again
+        self.paused: Dict[str, float] = {}
+
+    def add(self, feed: Feed, entry: FeedEntry) -> None:
+        settings = self.db.get_settings()
+        digest = settings.digest or feed.digest
+
+        self.db.upsert_outbox_item(
+            OutboxItem(
+                entry_id=entry.id,
+                feed_id=feed.id,
+                destination=feed.notify_destination,
+                digest=digest,
+                # a digest waits for the rest of its window to arrive
+                not_before=time() + settings.digest_window * 60 if digest else 0,
+            )
+        )
+
+    def notify(self) -> None:
+        if self.wakeup:
+            self.wakeup.set()
+
+    def _retry(self, item: OutboxItem, error: str, delay: float) -> None:
+        item.attempts += 1
+        item.error = error
+
+        if item.attempts >= OUTBOX_MAX_ATTEMPTS:
+            logger.warning(
+                f"Giving up on notification for {item.entry_id} after "
+                f"{item.attempts} attempts: {error}"
+            )
+            self.db.delete_outbox_item(item)
+        else:
+            item.not_before = time() + delay
+            self.db.upsert_outbox_item(item)
+
+    def _resolve(
+        self, items: List[OutboxItem]
+    ) -> List[Tuple[OutboxItem, Feed, FeedEntry]]:
+        resolved = []
+
+        for item in items:
+            try:
+                feed = self.db.get_feed(id=item.feed_id)
+                entry = self.db.get_feed_entry(id=item.entry_id)
+            except Exception as e:
+                logger.info(f"Dropping notification for {item.entry_id}: {e}")
+                self.db.delete_outbox_item(item)
+                continue
+
+            resolved.append((item, feed, entry))
+
+        return resolved
+
+    async def _deliver(
+        self,
+        destination: str,
+        items: List[OutboxItem],
+        send: Callable[[List[Tuple[Feed, FeedEntry]]], Awaitable],
+        limit: Semaphore,
+    ) -> int:
+        async with limit:
+            paused_until = self.paused.get(destination, 0)
+            if paused_until > time():
+                for item in items:
+                    item.not_before = paused_until
+                    self.db.upsert_outbox_item(item)
+                return 0
+
+            resolved = self._resolve(items)
+            if not resolved:
+                return 0
+
+            try:
+                await send([(feed, entry) for _, feed, entry in resolved])
+            except RateLimited as e:
+                delay = e.retry_after or OUTBOX_RETRY_BACKOFF * 2 ** items[0].attempts
+                logger.warning(
+                    f"Destination {destination or 'default'} is rate "
+                    f"limited, pausing it for {delay}s"
+                )
+                self.paused[destination] = time() + delay
+
+                for item, _, _ in resolved:
+                    self._retry(item, error=str(e), delay=delay)
+                return 0
+            except Exception as e:
+                logger.warning(f"Failed to notify {destination or 'default'}: {e}")
+
+                for item, _, _ in resolved:
+                    self._retry(
+                        item,
+                        error=str(e),
+                        delay=OUTBOX_RETRY_BACKOFF * 2**item.attempts,
+                    )
+                return 0
+
+            for item, _, _ in resolved:
+                self.db.delete_outbox_item(item)
+
+            return len(resolved)
+
+    async def deliver(self) -> int:
+        """
+        Deliver everything in the outbox that is due, returning how many
+        entries were notified about
+        """
+        items: List[OutboxItem] = self.db.get_outbox_items(before=time())
+        if not items:
+            return 0
+
+        handler: NotificationHandler = self.db.get_settings().notification_handler
+        limits = defaultdict(lambda: Semaphore(self.concurrency))
+
+        async def send_one(entries):
+            [(feed, entry)] = entries
+            await handler.send_notification(feed=feed, entry=entry)
+
+        deliveries = [
+            self._deliver(i.destination, [i], send_one, limits[i.destination])
+            for i in items
+            if not i.digest
+        ]
+
+        # once the window of a destination's digest is up, everything waiting
+        # for that destination goes out in one message
+        destinations = {i.destination for i in items if i.digest}
+        if destinations:
+            digests = defaultdict(list)
+            for item in self.db.get_outbox_items(before=float("inf")):
+                if item.digest and item.destination in destinations:
+                    digests[item.destination].append(item)
+
+            deliveries += [
+                self._deliver(
+                    destination,
+                    digest,
+                    partial(handler.send_digest, destination),
+                    limits[destination],
+                )
+                for destination, digest in digests.items()
+            ]
+
+        delivered = sum(await gather(*deliveries))
+        logger.info(f"Delivered {delivered} of {len(items)} due notification(s)")
+
+        return delivered
+
+    async def _run(self) -> None:
+        while True:
+            self.wakeup.clear()
+
+            try:
+                await self.deliver()
+            except Exception as e:
+                logger.warning(f"Failed to deliver notifications: {e}")
+
+            try:
+                await wait_for(self.wakeup.wait(), OUTBOX_POLL_INTERVAL)
+            except TimeoutError:
+                pass
+
+    def start(self) -> None:
+        self.wakeup = Event()
+        self.task = create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+            await gather(self.task, return_exceptions=True)
+            self.task = None
+
+        self.wakeup = None
@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+from asyncio import CancelledError, Event, Task, create_task, gather, wait_for
+from logging import getLogger
+from pathlib import Path
+from struct import pack, unpack
+from time import time
+from typing import Awaitable, Callable, Dict, List, Mapping, Optional
+
+from lmdb import Environment, Transaction
+
+from app.constants import (
+    DATA_DIR,
+    QUEUE_MAX_ATTEMPTS,
+    QUEUE_POLL_INTERVAL,
+    QUEUE_RETRY_BACKOFF,
+    QUEUE_WORKERS,
+)
+from app.models import Job
+
+logger = getLogger("uvicorn.error")
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+
+
+class JobQueue:
+    """
+    A durable work queue kept in its own LMDB environment in DATA_DIR, so
+    that queued work survives a restart and can be shared with the CLI.
+    Jobs with a lower priority run first, and jobs of equal priority run in
+    the order they were queued. A job is queued at most once at a time.
+    """
+
+    names = ["pending", "delayed", "running", "dead", "ids", "meta"]
+
+    def __init__(self, path: Path = None) -> None:
+        path = path or Path(DATA_DIR, "queue")
+        path.mkdir(parents=True, exist_ok=True)
+
+        self.env = Environment(
+            path=bytes(path.resolve()),
+            map_size=1024 * 1024 * 1024,
+            create=True,
+            max_dbs=len(self.names),
+        )
+        self._dbs = {i: self.env.open_db(i.encode()) for i in self.names}
+
+        # set when a job is queued, so idle workers in this process wake up
+        self.wakeup: Optional[Event] = None
+
+    @staticmethod
+    def _pending_key(job: Job) -> bytes:
+        return pack(">BQ", job.priority, job.seq)
+
+    @staticmethod
+    def _delayed_key(job: Job) -> bytes:
+        return pack(">QQ", int(job.not_before), job.seq)
+
+    @staticmethod
+    def _running_key(job: Job) -> bytes:
+        return pack(">Q", job.seq)
+
+    def _next_seq(self, txn: Transaction) -> int:
+        seq = int(txn.get(b"seq", b"0", db=self._dbs["meta"])) + 1
+        txn.put(b"seq", str(seq).encode(), db=self._dbs["meta"])
+
+        return seq
+
+    def _put(self, txn: Transaction, job: Job) -> None:
+        if job.not_before > time():
+            txn.put(
+                self._delayed_key(job), job.json().encode(), db=self._dbs["delayed"]
+            )
+        else:
+            txn.put(
+                self._pending_key(job), job.json().encode(), db=self._dbs["pending"]
+            )
+
+        txn.put(job.id.encode(), b"", db=self._dbs["ids"])
+
+    def _promote(self, txn: Transaction, now: float) -> None:
+        # move delayed jobs whose time has come over to pending
+        cur = txn.cursor(db=self._dbs["delayed"])
+
+        while cur.first():
+            not_before, _ = unpack(">QQ", cur.key())
+            if not_before > now:
+                break
+
+            job = Job.parse_raw(bytes(cur.value()))
+            cur.delete()
+            txn.put(
+                self._pending_key(job), job.json().encode(), db=self._dbs["pending"]
+            )
+
+    def enqueue(self, *jobs: Job) -> int:
+        """
+        Queue jobs that are not already queued, returning how many were added
+        """
+        added = 0
+
+        with self.env.begin(write=True) as txn:
+            for job in jobs:
+                if txn.get(job.id.encode(), db=self._dbs["ids"]) is not None:
+                    logger.debug(f"Job {job.id} is already queued")
+                    continue
+
+                job.seq = self._next_seq(txn)
+                self._put(txn, job)
+                added += 1
+
+        if added and self.wakeup:
+            self.wakeup.set()
+
+        return added
+
+    def claim(self) -> Optional[Job]:
+        """
+        Take the next job that is ready to run, if there is one
+        """
+        with self.env.begin(write=True) as txn:
+            self._promote(txn, time())
+
+            cur = txn.cursor(db=self._dbs["pending"])
+            if not cur.first():
+                return None
+
+            job = Job.parse_raw(bytes(cur.value()))
+            cur.delete()
+            txn.put(
+                self._running_key(job), job.json().encode(), db=self._dbs["running"]
+            )
+
+        return job
+
+    def complete(self, job: Job) -> None:
+        with self.env.begin(write=True) as txn:
+            txn.delete(self._running_key(job), db=self._dbs["running"])
+            txn.delete(job.id.encode(), db=self._dbs["ids"])
+
+    def fail(self, job: Job, error: str) -> None:
+        """
+        Retry a failed job with exponential backoff, or set it aside once it
+        has used up its attempts
+        """
+        job.attempts += 1
+        job.error = error
+
+        with self.env.begin(write=True) as txn:
+            txn.delete(self._running_key(job), db=self._dbs["running"])
+
+            if job.attempts < QUEUE_MAX_ATTEMPTS:
+                job.not_before = time() + QUEUE_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+                job.seq = self._next_seq(txn)
+                self._put(txn, job)
+            else:
+                logger.warning(
+                    f"Giving up on job {job.id} after {job.attempts} attempts"
+                )
+                txn.delete(job.id.encode(), db=self._dbs["ids"])
+                txn.put(
+                    self._running_key(job), job.json().encode(), db=self._dbs["dead"]
+                )
+
+    def release(self, job: Job) -> None:
+        """
+        Put a job that was interrupted back at its place in the queue
+        """
+        with self.env.begin(write=True) as txn:
+            txn.delete(self._running_key(job), db=self._dbs["running"])
+            txn.put(
+                self._pending_key(job), job.json().encode(), db=self._dbs["pending"]
+            )
+
+    def recover(self) -> int:
+        """
+        Requeue jobs that were running when the process last stopped
+        """
+        with self.env.begin(write=True) as txn:
+            cur = txn.cursor(db=self._dbs["running"])
+            jobs = [Job.parse_raw(bytes(v)) for v in cur.iternext(keys=False)]
+
+            txn.drop(self._dbs["running"], delete=False)
+            for job in jobs:
+                txn.put(
+                    self._pending_key(job), job.json().encode(), db=self._dbs["pending"]
+                )
+
+        if jobs:
+            logger.info(f"Requeued {len(jobs)} interrupted job(s)")
+
+        return len(jobs)
+
+    def depth(self) -> Dict[str, int]:
+        with self.env.begin() as txn:
+            return {
+                i: txn.stat(self._dbs[i])["entries"]
+                for i in ["pending", "delayed", "running", "dead"]
+            }
+
+
+class JobWorkers:
+    """
+    A pool of async workers draining a JobQueue, with one handler per kind
+    of job
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: Mapping[str, Callable[[Job], Awaitable[None]]],
+        count: int = QUEUE_WORKERS,
+    ) -> None:
+        self.queue = queue
+        self.handlers = handlers
+        self.count = count
+        self.tasks: List[Task] = []
+
+    async def run_job(self, job: Job) -> None:
+        try:
+            if job.kind not in self.handlers:
+                raise KeyError(f"No handler for job kind {job.kind}")
+
+            await self.handlers[job.kind](job)
+        except CancelledError:
+            self.queue.release(job)
+            raise
+        except Exception as e:
+            logger.warning(f"Job {job.id} failed on attempt {job.attempts + 1}: {e}")
+            self.queue.fail(job, error=str(e))
+        else:
+            self.queue.complete(job)
+
+    async def _work(self) -> None:
+        while True:
+            self.queue.wakeup.clear()
+
+            job = self.queue.claim()
+            if job:
+                await self.run_job(job)
+                continue
+
+            # other processes can queue work too, so don't wait forever
+            try:
+                await wait_for(self.queue.wakeup.wait(), QUEUE_POLL_INTERVAL)
+            except TimeoutError:
+                pass
+
+    def start(self) -> None:
+        self.queue.recover()
+        self.queue.wakeup = Event()
+        self.tasks = [create_task(self._work()) for _ in range(self.count)]
+
+        logger.info(f"Started {self.count} job worker(s), queue {self.queue.depth()}")
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+
+        await gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.queue.wakeup = None
+
+    async def drain(self) -> int:
+        """
+        Run jobs until none are ready, returning how many were run
+        """
+
+        async def work() -> int:
+            done = 0
+            while job := self.queue.claim():
+                await self.run_job(job)
+                done += 1
+
+            return done
+
+        return sum(await gather(*[work() for _ in range(self.count)]))
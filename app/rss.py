@@ -1,24 +1,65 @@
+from asyncio import Semaphore, gather, sleep, to_thread
 from calendar import timegm
+from collections import defaultdict
 from datetime import datetime, timezone
-from json import dump, load
+from itertools import islice
 from logging import getLogger
 from pathlib import Path
 from tempfile import SpooledTemporaryFile
-from typing import List, Mapping
+from time import perf_counter
+from typing import IO, AsyncIterator, Callable, Iterator, List, Mapping
+from urllib.parse import urlparse
+from uuid import uuid4
 
 from opml import OpmlDocument, OpmlOutline
 from ruamel.yaml import YAML
 
-from app.constants import CONFIG_DIR, DATA_DIR
-from app.models import EntryContent, Feed, FeedEntry
+from app.backup import (
+    BACKUP_FORMAT,
+    BACKUP_VERSION,
+    RestoreCheckpoint,
+    file_suffix,
+    read_records,
+)
+from app.constants import (
+    CONFIG_DIR,
+    DATA_DIR,
+    POLL_CONCURRENCY,
+    POLL_HOST_CONCURRENCY,
+    QUEUE_MAX_ATTEMPTS,
+    RESTORE_BATCH_SIZE,
+)
+from app.models import (
+    Change,
+    EntryContent,
+    Feed,
+    FeedEntry,
+    FeedValidators,
+    Job,
+    PollResult,
+    make_id,
+)
+from app.outbox import NotificationOutbox
+from app.queue import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, JobQueue
 from app.settings import GlobalSettings
 
 logger = getLogger("uvicorn.error")
 
 
+ENTRY_CONTENT = "entry_content"
+
+
 class PrecisRSS:
-    def __init__(self, db) -> None:
+    def __init__(
+        self, db, queue: JobQueue = None, outbox: NotificationOutbox = None
+    ) -> None:
         self.db = db
+        self.queue = queue
+        self.outbox = outbox
+
+    @property
+    def job_handlers(self):
+        return {ENTRY_CONTENT: self._retrieve_entry_content}
 
     def load_feeds(self) -> None:
         feeds_path = Path(CONFIG_DIR, "feeds.yml").resolve()
@@ -50,12 +91,11 @@ class PrecisRSS:
         for k, v in configs.items():
             self.db.reconfigure_handler(id=k, config=v)
 
-    async def _process_feed_entry(
-        self, entry: Mapping, feed: Feed, start_ts: int
-    ) -> True:
-        published_time = timegm(entry.published_parsed)
+    @staticmethod
+    def _parse_feed_entry(entry: Mapping, feed: Feed) -> FeedEntry:
         content = "".join(i.get("value", "") for i in entry.get("content", []))
-        feed_entry = FeedEntry(
+
+        return FeedEntry(
             **{
                 "title": entry.title,
                 "url": entry.link,
@@ -70,77 +110,199 @@ class PrecisRSS:
             }
         )
 
-        if published_time >= (
-            start_ts if start_ts else 0
-        ) and not self.db.feed_entry_exists(feed_entry.id):
-            await self.add_feed_entry(feed=feed, entry=feed_entry)
-            return True
+    def _filter_new_entries(self, entries: List[Mapping]) -> List[Mapping]:
+        # entry ids are derived from the link, so we can skip entries we
+        # already have before paying to build any models
+        ids = [make_id(i.link) for i in entries]
+        known = self.db.feed_entries_exist(ids)
+
+        new_entries = []
+        for id, entry in zip(ids, entries):
+            if id not in known:
+                known.add(id)
+                new_entries.append(entry)
 
-    async def _check_feed(self, feed: Feed):
+        return new_entries
+
+    async def _check_feed(self, feed: Feed, manual: bool = False) -> int:
         now = int(datetime.now(tz=timezone.utc).timestamp())
         logger.info(f"Polling feed {feed.id}: {feed.name}")
 
         poll_state = self.db.get_poll_state(feed)
         logger.info(f"Retrieved poll state: {poll_state}")
+
+        # only send validators once we have a history to compare against
+        validators = (
+            self.db.get_feed_validators(feed) if poll_state else FeedValidators()
+        )
+
+        # feedparser blocks on the network, so keep it off the event loop. A
+        # new feed was most likely just fetched to validate it, so the first
+        # poll may reuse that, unless someone asked for what the feed has now
+        cached = not manual and not poll_state
+        rss = await to_thread(feed.fetch, validators, cached)
+        if rss.get("status") == 304:
+            logger.info(f"Feed {feed.name} has not changed since the last poll")
+            self.db.update_poll_state(feed=feed, now=now)
+
+            return 0
+
+        if rss.get("status") == 301:
+            logger.info(f"Feed {feed.name} has permanently moved to {rss.href}")
+
         if poll_state:
-            entries = feed.rss.entries
+            entries = rss.entries
+            start_ts = self.db.get_feed_start_ts(feed=feed)
         else:
             # if we have no history, take the first 5
-            entries = feed.rss.entries[0:5]
-            earliest_init_entry = min(
-                [timegm(i.published_parsed) for i in entries] + [now]
-            )
-            self.db.set_feed_start_ts(feed=feed, start_ts=earliest_init_entry)
+            entries = rss.entries[0:5]
+            start_ts = min([timegm(i.published_parsed) for i in entries] + [now])
 
         logger.info("Starting feed entry retrieval")
-        counter = 0
-        start_ts = self.db.get_feed_start_ts(feed=feed)
-        for entry in entries:
-            processed = await self._process_feed_entry(
-                entry=entry, feed=feed, start_ts=start_ts
+        new_entries = [
+            entry
+            for entry in (
+                self._parse_feed_entry(entry=i, feed=feed)
+                for i in self._filter_new_entries(entries)
+            )
+            if entry.published_at >= (start_ts if start_ts else 0)
+        ]
+
+        notify = self.outbox and new_entries and self._should_notify(feed)
+
+        # record everything this poll learned in one commit, and only then do
+        # the slow part of fetching content and sending notifications
+        with self.db.batch():
+            if not poll_state:
+                self.db.set_feed_start_ts(feed=feed, start_ts=start_ts)
+
+            for entry in new_entries:
+                logger.info(
+                    f"Upserting entry from {feed.name}: {entry.title} - id {entry.id}"
+                )
+                self.db.upsert_feed_entry(feed=feed, entry=entry)
+
+                if notify:
+                    self.outbox.add(feed=feed, entry=entry)
+
+            self.db.update_poll_state(feed=feed, now=now)
+            self.db.update_feed_validators(feed=feed, validators=validators.update(rss))
+
+        if notify:
+            self.outbox.notify()
+
+        if self.queue and not feed.preview_only:
+            # someone is waiting on a manual refresh, so its content goes first
+            priority = PRIORITY_HIGH if manual else PRIORITY_NORMAL
+            self.queue.enqueue(
+                *[self._entry_content_job(i, priority) for i in new_entries]
             )
-            if processed:
-                counter += 1
 
-        self.db.update_poll_state(feed=feed, now=now)
+        for entry in new_entries:
+            await self._handle_new_entry(feed=feed, entry=entry)
 
+        counter = len(new_entries)
         logger.info(f"Found {counter} new item(s) for feed {feed.name}")
 
-    async def check_feeds(self) -> List:
+        return counter
+
+    async def _timed_check_feed(self, feed: Feed, manual: bool = False) -> PollResult:
+        result = PollResult(feed_id=feed.id, name=feed.name)
+        start = perf_counter()
+
+        try:
+            result.new_entries = await self._check_feed(feed=feed, manual=manual)
+        except Exception as e:
+            logger.warning(f"Failed to poll feed {feed.name}: {e}")
+            result.error = str(e)
+
+        result.elapsed = perf_counter() - start
+        logger.info(f"Polled feed {feed.name} in {result.elapsed:.2f}s")
+
+        return result
+
+    async def check_feeds(self) -> List[PollResult]:
         now = int(datetime.now(tz=timezone.utc).timestamp())
         logger.info(f"Checking feeds starting at time {now}")
+        start = perf_counter()
 
-        for feed in self.db.get_feeds():
-            feed: Feed
-            if feed.refresh_enabled:
-                await self._check_feed(feed=feed)
+        limit = Semaphore(POLL_CONCURRENCY)
+        host_limits = defaultdict(lambda: Semaphore(POLL_HOST_CONCURRENCY))
+
+        async def poll(feed: Feed) -> PollResult:
+            # take the host slot first so waiting feeds don't hog global slots
+            async with host_limits[urlparse(feed.url).netloc], limit:
+                return await self._timed_check_feed(feed=feed)
 
-    async def check_feed_by_id(self, id: str) -> List:
+        feeds = [feed for feed in self.db.get_feeds() if feed.refresh_enabled]
+        results = await gather(*[poll(feed) for feed in feeds])
+
+        logger.info(
+            f"Checked {len(feeds)} feed(s) in {perf_counter() - start:.2f}s, "
+            f"found {sum(i.new_entries for i in results)} new item(s)"
+        )
+
+        if self.queue:
+            logger.info(f"Job queue depth: {self.queue.depth()}")
+
+        return results
+
+    async def check_feed_by_id(self, id: str) -> PollResult:
         feed = self.db.get_feed(id=id)
 
         logger.info(f"Manual refresh requested for feed {feed.name}")
 
-        await self._check_feed(feed=feed)
-
-    async def add_feed_entry(self, feed: Feed, entry: FeedEntry) -> None:
-        logger.info(f"Upserting entry from {feed.name}: {entry.title} - id {entry.id}")
+        return await self._timed_check_feed(feed=feed, manual=True)
 
-        self.db.upsert_feed_entry(feed=feed, entry=entry)
+    def _should_notify(self, feed: Feed) -> bool:
+        if not feed.notify:
+            return False
 
         settings: GlobalSettings = self.db.get_settings()
+        if not settings.send_notification:
+            logger.info(
+                f"skipping notifications for {feed.name} because of global setting"
+            )
+
+        return settings.send_notification
 
-        if not feed.preview_only:
+    async def _handle_new_entry(self, feed: Feed, entry: FeedEntry) -> None:
+        # with a queue, content is retrieved by the workers instead
+        if not feed.preview_only and not self.queue:
             await self.db.get_entry_content(entry=entry)
 
-        if feed.notify:
-            if settings.send_notification:
-                await settings.notification_handler.send_notification(
-                    feed=feed, entry=entry
-                )
-            else:
-                logger.info(
-                    f"skipping notification for {entry.id} because of global setting"
-                )
+        # and with an outbox, notifications are delivered by its worker
+        if not self.outbox and self._should_notify(feed):
+            settings: GlobalSettings = self.db.get_settings()
+            await settings.notification_handler.send_notification(
+                feed=feed, entry=entry
+            )
+
+    @staticmethod
+    def _entry_content_job(entry: FeedEntry, priority: int = PRIORITY_NORMAL) -> Job:
+        return Job(
+            kind=ENTRY_CONTENT,
+            key=entry.id,
+            payload={"entry_id": entry.id},
+            priority=priority,
+        )
+
+    async def _retrieve_entry_content(self, job: Job) -> None:
+        entry_id = job.payload["entry_id"]
+
+        if not self.db.feed_entry_exists(entry_id):
+            logger.info(
+                f"Skipping content for entry {entry_id}, which no longer exists"
+            )
+            return
+
+        entry = self.db.get_feed_entry(id=entry_id)
+
+        # failures are raised so that the queue retries the job, until the
+        # last attempt, which records the entry as unretrievable
+        await self.db.get_entry_content(
+            entry=entry, raise_errors=job.attempts + 1 < QUEUE_MAX_ATTEMPTS
+        )
 
     @staticmethod
     async def get_entry_html(url: str, settings: GlobalSettings) -> str:
@@ -190,70 +352,264 @@ class PrecisRSS:
             settings.finished_onboarding = True
             self.db.upsert_settings(settings=settings)
 
-    async def backup(self):
-        feeds = self.db.get_feeds()
-        settings: GlobalSettings = self.db.get_settings()
-        handlers = self.db.get_handlers()
-
-        backup = {
-            "settings": settings.dict(exclude={"db"}),
-            "handlers": {k: v.dict() for k, v in handlers.items() if v},
-            "feeds": [i.dict() for i in feeds],
-            "feed_entries": {},
-            "entry_content": {},
-            "poll_state": {},
+    async def backup(
+        self, since: int = None, since_ts: int = None
+    ) -> AsyncIterator[Mapping]:
+        """
+        Yield the state of Precis as a series of backup records, one feed at
+        a time. Only content that is already stored is included; nothing is
+        fetched to fill the gaps.
+
+        Given a change sequence number or a timestamp, only what changed
+        after it is included, along with tombstones for what was deleted.
+        The header carries the sequence number to pass as `since` for the
+        next backup in the chain.
+        """
+        header = {
+            "type": "header",
+            "format": BACKUP_FORMAT,
+            "version": BACKUP_VERSION,
+            "id": uuid4().hex,
+            "created_at": int(datetime.now(timezone.utc).timestamp()),
+            "seq": self.db.get_change_seq(),
         }
 
-        for feed in feeds:
-            feed: Feed
-            backup["poll_state"][feed.id] = self.db.get_poll_state(feed)
-            entries = [i["entry"] for i in self.db.get_entries(feed)]
-            entry_content = {i.id: await self.db.get_entry_content(i) for i in entries}
-            backup["feed_entries"][feed.id] = [i.dict() for i in entries]
-            backup["entry_content"][feed.id] = {
-                k: v.dict() for k, v in entry_content.items()
-            }
+        if since is None and since_ts is None:
+            yield header
+            records = self._full_backup()
+        else:
+            changes = self.db.get_changes(after=since or 0)
 
-        str_now = datetime.now().strftime("%Y%m%d%H%M%S")
-        file_name = f"precis_backup_{str_now}.json"
-        out_path = Path(DATA_DIR, file_name).resolve()
+            # a time is turned into the last change logged before it. Only the
+            # latest change to each record is kept, so this may be earlier
+            # than the change that really came last, never later
+            if since_ts is not None:
+                since = max((i.seq for i in changes if i.ts < since_ts), default=0)
+                changes = [i for i in changes if i.ts >= since_ts]
 
-        logger.info(f"writing backup to {out_path}")
+            # the chain is unbroken as long as this backup starts at or
+            # before where the previous one ended
+            header["since"] = since
 
-        with open(out_path, "w+") as fp:
-            dump(backup, fp)
+            yield header
+            records = self._incremental_backup(changes)
 
-        return out_path, file_name
+        count = 0
+        async for record in records:
+            yield record
 
-    async def restore(self, file: SpooledTemporaryFile):
-        bk = load(file)
+            if record["type"] == "entry":
+                count += 1
 
-        settings = GlobalSettings(db=self.db, **bk.get("settings", {}))
-        settings.finished_onboarding = True
+            # let the rest of the app run while a large backup streams
+            await sleep(0)
 
-        handlers = [
-            self.db.reconfigure_handler(id=k, config=v)
-            for k, v in bk.get("handlers", {}).items()
-        ]
-        feeds = [Feed(**i) for i in bk.get("feeds", [])]
+        yield {"type": "end", "count": count}
 
-        for handler in handlers:
-            self.db.upsert_handler(handler=handler)
+    def _feed_record(self, feed: Feed) -> Mapping:
+        return {
+            "type": "feed",
+            "feed": feed.dict(),
+            "poll_state": self.db.get_poll_state(feed),
+        }
 
-        self.db.upsert_settings(settings)
+    def _content_record(self, entry: FeedEntry) -> Mapping | None:
+        if self.db.entry_content_exists(entry):
+            content = self.db.retrieve_entry_content(entry)
+            return {"type": "content", "content": content.dict()}
 
-        for feed in feeds:
-            self.db.upsert_feed(feed)
+    async def _full_backup(self) -> AsyncIterator[Mapping]:
+        # settings refer to handlers, so the handlers have to be restored first
+        for k, v in self.db.get_handlers().items():
+            if v:
+                yield {"type": "handler", "id": k, "config": v.dict()}
+
+        settings: GlobalSettings = self.db.get_settings()
+        yield {"type": "settings", "settings": settings.dict(exclude={"db"})}
+
+        for feed in self.db.get_feeds():
+            yield self._feed_record(feed)
+
+            for i in self.db.get_entries(feed):
+                entry: FeedEntry = i["entry"]
+                yield {"type": "entry", "entry": entry.dict()}
+
+                if content := self._content_record(entry):
+                    yield content
+
+    async def _incremental_backup(
+        self, changes: List[Change]
+    ) -> AsyncIterator[Mapping]:
+        # records are written in dependency order rather than change order, so
+        # that handlers come before the settings that name them, and a feed
+        # before its entries and they before their content. Deletions come
+        # last, entries before their feeds
+        kinds = ["handler", "settings", "feed", "entry", "content"]
+        upserts = sorted(
+            (i for i in changes if not i.deleted),
+            key=lambda i: (kinds.index(i.kind), i.seq),
+        )
+        deletes = sorted(
+            (i for i in changes if i.deleted),
+            key=lambda i: (-kinds.index(i.kind), i.seq),
+        )
 
-        feed_entries: dict = bk.get("feed_entries", {})
-        for feed, entries in feed_entries.items():
-            feed_obj = self.db.get_feed(id=feed)
-            for entry in entries:
-                entry_obj = FeedEntry(**entry)
-                self.db.upsert_feed_entry(feed=feed_obj, entry=entry_obj)
-
-        content: dict = bk.get("entry_content", {})
-        for contents in content.values():
-            for i in contents.values():
-                content_obj = EntryContent(**i)
-                await self.db.upsert_entry_content(content=content_obj)
+        handlers = self.db.get_handlers()
+        feeds = {i.id: i for i in self.db.get_feeds()}
+
+        # changed records are read as they are now, and skipped if they have
+        # gone since the change was logged
+        for change in upserts:
+            if change.kind == "settings":
+                settings: GlobalSettings = self.db.get_settings()
+                yield {"type": "settings", "settings": settings.dict(exclude={"db"})}
+            elif change.kind == "handler" and handlers.get(change.id):
+                config = handlers[change.id].dict()
+                yield {"type": "handler", "id": change.id, "config": config}
+            elif change.kind == "feed" and change.id in feeds:
+                yield self._feed_record(feeds[change.id])
+            elif change.kind in ("entry", "content"):
+                if not self.db.feed_entry_exists(change.id):
+                    continue
+
+                entry = self.db.get_feed_entry(change.id)
+                if change.kind == "entry":
+                    yield {"type": "entry", "entry": entry.dict()}
+                elif content := self._content_record(entry):
+                    yield content
+
+        for change in deletes:
+            yield {"type": "delete", "kind": change.kind, "id": change.id}
+
+    @staticmethod
+    def backup_file_name(compression: str = "none") -> str:
+        str_now = datetime.now().strftime("%Y%m%d%H%M%S")
+
+        return f"precis_backup_{str_now}{file_suffix(compression)}"
+
+    async def restore(self, *files: IO, progress: Callable[[int], None] = None) -> int:
+        """
+        Restore a backup, or a full backup followed by a chain of incremental
+        ones, record by record. RESTORE_BATCH_SIZE records are written per
+        transaction, checkpointing after each so that restoring the same
+        backup again resumes where an interrupted attempt stopped.
+        Returns the number of records restored.
+        """
+        backups = [read_records(i) for i in files]
+        headers = [next(i, {}) for i in backups]
+
+        for previous, header in zip(headers, headers[1:]):
+            if header.get("since") is None:
+                raise ValueError("Only incremental backups can follow another backup")
+
+            if previous.get("seq") is not None and header["since"] > previous["seq"]:
+                raise ValueError(
+                    f"Backup {header.get('id')} starts after change {header['since']}"
+                    f" but the backup before it ends at change {previous['seq']}"
+                )
+
+        total = 0
+        for records, header in zip(backups, headers):
+            total += await self._restore_backup(records, header, total, progress)
+
+        return total
+
+    async def _restore_backup(
+        self,
+        records: Iterator[Mapping],
+        header: Mapping,
+        offset: int = 0,
+        progress: Callable[[int], None] = None,
+    ) -> int:
+        checkpoint = RestoreCheckpoint(header.get("id"))
+        restored = checkpoint.load()
+        if restored:
+            logger.info(f"resuming restore after {restored} records")
+
+        feeds: Mapping[str, Feed] = {}
+        position = 0
+
+        while chunk := list(islice(records, RESTORE_BATCH_SIZE)):
+            if position + len(chunk) <= restored:
+                position += len(chunk)
+                continue
+
+            with self.db.batch():
+                for record in chunk:
+                    position += 1
+                    if position > restored:
+                        await self._restore_record(position, record, feeds)
+
+            if self.queue:
+                self._queue_restored_content(chunk, feeds)
+
+            checkpoint.save(position)
+            logger.info(f"restored {position} records")
+            if progress:
+                progress(offset + position)
+
+            # let the rest of the app run between batches
+            await sleep(0)
+
+        checkpoint.clear()
+
+        return position
+
+    def _queue_restored_content(
+        self, records: List[Mapping], feeds: Mapping[str, Feed]
+    ) -> None:
+        # content the backup did not have is fetched again, behind anything
+        # more pressing
+        entries = [FeedEntry(**i["entry"]) for i in records if i.get("type") == "entry"]
+
+        self.queue.enqueue(
+            *[
+                self._entry_content_job(i, PRIORITY_LOW)
+                for i in entries
+                if (feed := feeds.get(i.feed_id))
+                and not feed.preview_only
+                and not self.db.entry_content_exists(i)
+            ]
+        )
+
+    async def _restore_record(
+        self, position: int, record: Mapping, feeds: Mapping[str, Feed]
+    ) -> None:
+        kind = record.get("type")
+
+        try:
+            if kind == "settings":
+                settings = GlobalSettings(db=self.db, **record["settings"])
+                settings.finished_onboarding = True
+                self.db.upsert_settings(settings)
+            elif kind == "handler":
+                handler = self.db.reconfigure_handler(
+                    id=record["id"], config=record["config"]
+                )
+                self.db.upsert_handler(handler=handler)
+            elif kind == "feed":
+                feed = Feed(**record["feed"])
+                self.db.upsert_feed(feed)
+                feeds[feed.id] = feed
+            elif kind == "entry":
+                entry = FeedEntry(**record["entry"])
+                if entry.feed_id not in feeds:
+                    feeds[entry.feed_id] = self.db.get_feed(id=entry.feed_id)
+                self.db.upsert_feed_entry(feed=feeds[entry.feed_id], entry=entry)
+            elif kind == "content":
+                content = EntryContent(**record["content"])
+                await self.db.upsert_entry_content(content=content)
+            elif kind == "delete":
+                self._restore_delete(record["kind"], record["id"], feeds)
+        except (IndexError, KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid {kind} record at position {position}") from e
+
+    def _restore_delete(self, kind: str, id: str, feeds: Mapping[str, Feed]) -> None:
+        if kind == "feed":
+            feed = feeds.pop(id, None) or next(
+                (i for i in self.db.get_feeds() if i.id == id), None
+            )
+            if feed:
+                self.db.delete_feed(feed)
+        elif kind == "entry" and self.db.feed_entry_exists(id):
+            self.db.delete_feed_entry(self.db.get_feed_entry(id))
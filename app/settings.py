@@ -27,13 +27,17 @@ class Themes(str, Enum):
 class GlobalSettings(BaseModel):
 
     send_notification: bool = True
+    # send one message per destination for everything found in a window of
+    # this many minutes, instead of one per entry
+    digest: bool = False
+    digest_window: int = 15
     theme: Themes = Themes.forest
     refresh_interval: int = 5
     reading_speed: int = 238
 
     notification_handler_key: str = "null_notification"
     llm_handler_key: str = "null_llm"
-    content_retrieval_handler_key: str = "playwright"
+    content_retrieval_handler_key: str = "httpx"
     recent_hours: int = 36
 
     finished_onboarding: bool = False
@@ -1,12 +1,12 @@
+from asyncio import to_thread
+from contextlib import contextmanager
 from logging import getLogger
-from os import remove
 from pathlib import Path
-from pickle import dump, load
-from typing import Union
 
 from app.constants import DATA_DIR
 from app.models import EntryContent, FeedEntry
 from app.storage.lmdb import LMDBStorageHandler
+from app.storage.media import MediaStore
 
 logger = getLogger("uvicorn.error")
 
@@ -15,35 +15,61 @@ class HybridLMDBOfflineStorageHandler(LMDBStorageHandler):
     def __init__(self) -> None:
         super().__init__()
 
-        self.offline_media_path = Path(DATA_DIR, "media")
-        self.offline_media_path.mkdir(parents=True, exist_ok=True)
+        self.media = MediaStore(Path(DATA_DIR, "media"))
 
-    def _content_path(self, content: Union[EntryContent, FeedEntry]):
-        logger.debug(f"Making content path for {content}")
-        return self.offline_media_path.joinpath(content.id).with_suffix(".pickle")
+    @contextmanager
+    def batch(self):
+        if getattr(self._batch_state(), "contents", None) is not None:
+            yield
+            return
+
+        # hold content files back until the lmdb side commits, so that a
+        # failed batch leaves neither behind
+        self._batch.contents = {}
+
+        try:
+            with super().batch():
+                yield
+
+            self.media.write_many(self._batch.contents.values())
+        finally:
+            self._batch.contents = None
 
     async def upsert_entry_content(self, content: EntryContent):
 
-        content_path = self._content_path(content)
+        pending = getattr(self._batch_state(), "contents", None)
 
-        with open(content_path.resolve(), "wb") as fp:
-            dump(content, fp)
+        if pending is not None:
+            pending[content.id] = content
+        else:
+            # the write syncs the file and its directory, so keep it off the
+            # event loop
+            await to_thread(self.media.write, content)
+
+        with self._write() as txn:
+            self._log_change(txn, "content", content.id)
 
     def entry_content_exists(self, entry: FeedEntry):
 
-        content_path = self._content_path(entry)
+        if entry.id in (getattr(self._batch_state(), "contents", None) or {}):
+            return True
 
-        return content_path.exists() and content_path.stat().st_size > 0
+        return self.media.exists(entry.id)
 
     def retrieve_entry_content(self, entry: FeedEntry) -> EntryContent:
 
-        content_path = self._content_path(entry)
-        with open(content_path, "rb") as fp:
-            content: EntryContent = load(fp)
+        pending = getattr(self._batch_state(), "contents", None) or {}
+        if entry.id in pending:
+            return pending[entry.id]
+
+        content = self.media.read(entry.id)
+        if content is None:
+            raise IndexError(f"No entry content with id {entry.id}")
 
-            return content
+        return content
 
     def delete_entry_content(self, entry: EntryContent):
 
-        content_path = self._content_path(entry)
-        remove(content_path)
+        (getattr(self._batch_state(), "contents", None) or {}).pop(entry.id, None)
+
+        self.media.delete(entry.id)
@@ -1,18 +1,32 @@
 from __future__ import annotations
 
+from asyncio import Task, current_task
+from contextlib import contextmanager
+from contextvars import ContextVar
 from enum import Enum
 from json import JSONDecodeError, dumps, loads
 from logging import getLogger
 from pathlib import Path
-from typing import Any, List, Mapping
+from struct import pack, unpack
+from threading import local
+from time import time
+from typing import Any, Iterable, List, Mapping, Optional, Set
 
-from lmdb import Environment
+from lmdb import Environment, Transaction
 from pydantic import BaseModel
 
 from app.constants import DATA_DIR
 from app.db import StorageHandler
 from app.handlers import HandlerBase
-from app.models import EntryContent, Feed, FeedEntry
+from app.models import (
+    Change,
+    EntryContent,
+    Feed,
+    FeedEntry,
+    FeedStats,
+    FeedValidators,
+    OutboxItem,
+)
 from app.settings import GlobalSettings
 
 logger = getLogger("uvicorn.error")
@@ -21,16 +35,56 @@ logger = getLogger("uvicorn.error")
 class Named(Enum):
     feed = "feed"
     poll = "poll"
+    validators = "validators"
     feed_start = "feed_start"
     entry = "entry"
     entry_content = "entry_content"
     handler = "handler"
     settings = "settings"
+    feed_stats = "feed_stats"
+    outbox = "outbox"
+
+    # the latest change to each record, and those changes by sequence number
+    change_log = "change_log"
+    si_change_seq = "si_change_seq"
 
     # secondary indices
+    si_feed_published = "si_feed_published"
+    si_published = "si_published"
+
+    # legacy json-list index of entries by feed, migrated on open
     si_feed_entry = "si_feed_entry"
 
 
+def _current_task() -> Optional[Task]:
+    try:
+        return current_task()
+    except RuntimeError:
+        return None
+
+
+class Snapshot:
+    """
+    A read transaction shared by everything that runs inside a snapshot
+    context. Writes made through the handler renew it so that the holder
+    still reads its own writes.
+    """
+
+    def __init__(self, env: Environment) -> None:
+        self.env = env
+        self.txn: Transaction = env.begin()
+
+    def renew(self) -> None:
+        if self.txn:
+            self.txn.abort()
+            self.txn = self.env.begin()
+
+    def close(self) -> None:
+        if self.txn:
+            self.txn.abort()
+            self.txn = None
+
+
 class LMDBStorageHandler(StorageHandler):
     def __init__(self) -> None:
         super().__init__()
@@ -44,6 +98,19 @@ class LMDBStorageHandler(StorageHandler):
             max_dbs=32,
         )
 
+        # opening a named db is not free, so do it once for all of them
+        self._dbs = {i: self.db.open_db(i.value.encode()) for i in Named}
+        self._snapshot: ContextVar[Snapshot] = ContextVar(
+            f"lmdb_snapshot_{id(self)}", default=None
+        )
+
+        # lmdb transactions belong to the thread that opened them, so each
+        # thread gets its own batch. Tasks on an event loop share a thread,
+        # so a batch also records the task that opened it
+        self._batch = local()
+
+        self._migrate_indexes()
+
     @staticmethod
     def _deserialize(val: Any):
 
@@ -76,159 +143,440 @@ class LMDBStorageHandler(StorageHandler):
 
     def _db(self, db: Named):
 
-        return self.db.open_db(db.value.encode())
+        return self._dbs[db]
+
+    @staticmethod
+    def _published_key(published_at: int, entry_id: str = "") -> bytes:
+        # big-endian so that keys sort in publish time order
+        return pack(">Q", max(int(published_at), 0)) + entry_id.encode()
+
+    @classmethod
+    def _feed_index_key(
+        cls, feed_id: str, published_at: int, entry_id: str = ""
+    ) -> bytes:
+        # feed id first, so that a feed's entries are contiguous and sorted by time
+        return feed_id.encode() + cls._published_key(published_at, entry_id)
+
+    def _index_entry(self, txn: Transaction, feed_id: str, entry: FeedEntry) -> None:
+        txn.put(
+            self._feed_index_key(feed_id, entry.published_at, entry.id),
+            b"",
+            db=self._db(Named.si_feed_published),
+        )
+        txn.put(
+            self._published_key(entry.published_at, entry.id),
+            b"",
+            db=self._db(Named.si_published),
+        )
+
+    def _unindex_entry(self, txn: Transaction, entry: FeedEntry) -> None:
+        txn.delete(
+            self._feed_index_key(entry.feed_id, entry.published_at, entry.id),
+            db=self._db(Named.si_feed_published),
+        )
+        txn.delete(
+            self._published_key(entry.published_at, entry.id),
+            db=self._db(Named.si_published),
+        )
+
+    def _latest_published(self, txn: Transaction, feed_id: str) -> int | None:
+        prefix = feed_id.encode()
+        cur = txn.cursor(db=self._db(Named.si_feed_published))
+
+        # seek just past the last possible key for the feed and step back
+        if cur.set_range(prefix + b"\xff"):
+            found = cur.prev()
+        else:
+            found = cur.last()
+
+        if found and cur.key().startswith(prefix):
+            return unpack(">Q", cur.key()[len(prefix) : len(prefix) + 8])[0]
+
+    def _adjust_feed_stats(self, txn: Transaction, feed_id: str, delta: int) -> None:
+        value = txn.get(self._serialize(feed_id), db=self._db(Named.feed_stats))
+        stats = FeedStats(**self._deserialize(value)) if value else FeedStats()
+
+        stats.entry_count = max(stats.entry_count + delta, 0)
+        stats.latest_published_at = self._latest_published(txn, feed_id)
+
+        txn.replace(
+            self._serialize(feed_id),
+            self._serialize(stats),
+            db=self._db(Named.feed_stats),
+        )
+
+    def _log_change(
+        self, txn: Transaction, kind: str, id: str, deleted: bool = False
+    ) -> None:
+        cur = txn.cursor(db=self._db(Named.si_change_seq))
+        seq = unpack(">Q", cur.key())[0] + 1 if cur.last() else 1
+
+        change = Change(seq=seq, kind=kind, id=id, ts=int(time()), deleted=deleted)
+
+        # only the latest change to a record is kept, so the log grows with
+        # the number of records rather than the number of writes
+        previous = txn.get(change.key.encode(), db=self._db(Named.change_log))
+        if previous:
+            previous_seq = Change(**self._deserialize(previous)).seq
+            txn.delete(pack(">Q", previous_seq), db=self._db(Named.si_change_seq))
+
+        txn.put(
+            change.key.encode(),
+            self._serialize(change),
+            db=self._db(Named.change_log),
+        )
+        txn.put(pack(">Q", seq), change.key.encode(), db=self._db(Named.si_change_seq))
+
+    def _migrate_indexes(self) -> None:
+
+        with self._write() as txn:
+            legacy = txn.cursor(db=self._db(Named.si_feed_entry))
+            if legacy.first():
+                logger.info("Migrating feed entry index to composite keys")
+
+                for k, v in legacy.iternext():
+                    feed_id = bytes(k).decode()
+
+                    for entry_id in set(self._deserialize(v)):
+                        value = txn.get(
+                            self._serialize(entry_id), db=self._db(Named.entry)
+                        )
+                        if value:
+                            entry = FeedEntry(**self._deserialize(value))
+                            txn.put(
+                                self._feed_index_key(
+                                    feed_id, entry.published_at, entry.id
+                                ),
+                                b"",
+                                db=self._db(Named.si_feed_published),
+                            )
+
+                txn.drop(self._db(Named.si_feed_entry), delete=False)
+
+            published = txn.stat(self._db(Named.si_published))["entries"]
+            entries = txn.stat(self._db(Named.entry))["entries"]
+            if entries and not published:
+                logger.info("Building publish time index for feed entries")
+
+                for _, v in txn.cursor(db=self._db(Named.entry)).iternext():
+                    entry = FeedEntry(**self._deserialize(v))
+                    txn.put(
+                        self._published_key(entry.published_at, entry.id),
+                        b"",
+                        db=self._db(Named.si_published),
+                    )
+
+            stats = txn.stat(self._db(Named.feed_stats))["entries"]
+            indexed = txn.stat(self._db(Named.si_feed_published))["entries"]
+            if indexed and not stats:
+                logger.info("Counting entries for feed stats")
+
+                counts = {}
+                cur = txn.cursor(db=self._db(Named.si_feed_published))
+                for key in cur.iternext(values=False):
+                    # feed ids are md5 hex digests, so always 32 characters
+                    feed_id = bytes(key[:32]).decode()
+                    counts[feed_id] = counts.get(feed_id, 0) + 1
+
+                for feed_id, count in counts.items():
+                    self._adjust_feed_stats(txn, feed_id=feed_id, delta=count)
+
+    @contextmanager
+    def snapshot(self):
+        if self._snapshot.get():
+            yield
+            return
+
+        snapshot = Snapshot(self.db)
+        token = self._snapshot.set(snapshot)
+
+        try:
+            yield
+        finally:
+            self._snapshot.reset(token)
+            snapshot.close()
+
+    def _batch_state(self) -> local:
+        # a batch held open across an await would take in the writes of any
+        # other task that ran meanwhile, and roll them back with its own
+        task = getattr(self._batch, "task", None)
+        if task and task is not _current_task():
+            raise RuntimeError("A storage batch was held open across an await")
+
+        return self._batch
+
+    @contextmanager
+    def batch(self):
+        if getattr(self._batch_state(), "txn", None):
+            yield
+            return
+
+        with self.db.begin(write=True) as txn:
+            self._batch.txn = txn
+            self._batch.task = _current_task()
+
+            try:
+                yield
+            finally:
+                self._batch.txn = None
+                self._batch.task = None
+
+        snapshot = self._snapshot.get()
+        if snapshot:
+            snapshot.renew()
+
+    @contextmanager
+    def _read(self):
+        batch = getattr(self._batch_state(), "txn", None)
+        snapshot = self._snapshot.get()
+
+        if batch:
+            yield batch
+        elif snapshot and snapshot.txn:
+            yield snapshot.txn
+        else:
+            with self.db.begin() as txn:
+                yield txn
+
+    @contextmanager
+    def _write(self):
+        batch = getattr(self._batch_state(), "txn", None)
+
+        if batch:
+            yield batch
+            return
+
+        with self.db.begin(write=True) as txn:
+            yield txn
+
+        snapshot = self._snapshot.get()
+        if snapshot:
+            snapshot.renew()
 
     def clear_active_feeds(self) -> None:
 
-        db = self._db(Named.feed)
-        with self.db.begin(write=True, db=db) as txn:
-            txn.drop(delete=False)
+        with self._write() as txn:
+            cur = txn.cursor(db=self._db(Named.feed))
+            for key in cur.iternext(values=False):
+                self._log_change(txn, "feed", bytes(key).decode(), deleted=True)
+
+            txn.drop(self._db(Named.feed), delete=False)
 
     def upsert_feed(self, feed: Feed) -> None:
 
-        db = self._db(Named.feed)
-        with self.db.begin(write=True, db=db) as txn:
-            txn.replace(self._serialize(feed.id), self._serialize(feed))
+        with self._write() as txn:
+            txn.replace(
+                self._serialize(feed.id), self._serialize(feed), db=self._db(Named.feed)
+            )
+            self._log_change(txn, "feed", feed.id)
 
     def insert_feed(self, feed: Feed) -> None:
 
-        with self.db.begin(write=True, db=self._db(Named.feed)) as txn:
-            txn.put(self._serialize(feed.id), self._serialize(feed))
+        with self._write() as txn:
+            txn.put(
+                self._serialize(feed.id), self._serialize(feed), db=self._db(Named.feed)
+            )
+            self._log_change(txn, "feed", feed.id)
 
     def get_feed(self, id: str) -> Feed:
-        with self.db.begin(db=self._db(Named.feed)) as txn:
-            value = txn.get(self._serialize(id))
+        with self._read() as txn:
+            value = txn.get(self._serialize(id), db=self._db(Named.feed))
 
         return Feed(**self._deserialize(value))
 
     def get_feeds(self) -> List[Feed]:
-        with self.db.begin(self._db(Named.feed)) as txn:
-
-            cur = txn.cursor()
+        with self._read() as txn:
+            cur = txn.cursor(db=self._db(Named.feed))
             feed_cfgs = list(cur.iternext())
 
         return [Feed(**self._deserialize(i[1])) for i in feed_cfgs]
 
     def get_poll_state(self, feed: Feed) -> int | None:
 
-        with self.db.begin(db=self._db(Named.poll)) as txn:
-            value = txn.get(self._serialize(feed.id))
+        with self._read() as txn:
+            value = txn.get(self._serialize(feed.id), db=self._db(Named.poll))
 
         if value:
             return self._deserialize(value)
 
     def set_feed_start_ts(self, feed: Feed, start_ts: int) -> None:
 
-        with self.db.begin(db=self._db(Named.feed_start), write=True) as txn:
-            txn.replace(self._serialize(feed.id), self._serialize(start_ts))
+        with self._write() as txn:
+            txn.replace(
+                self._serialize(feed.id),
+                self._serialize(start_ts),
+                db=self._db(Named.feed_start),
+            )
 
     def get_feed_start_ts(self, feed: Feed) -> int:
 
-        with self.db.begin(db=self._db(Named.feed_start)) as txn:
-            value = txn.get(self._serialize(feed.id))
+        with self._read() as txn:
+            value = txn.get(self._serialize(feed.id), db=self._db(Named.feed_start))
 
         return self._deserialize(value)
 
     def update_poll_state(self, feed: Feed, now: int) -> None:
 
-        with self.db.begin(db=self._db(Named.poll), write=True) as txn:
-            txn.replace(self._serialize(feed.id), self._serialize(now))
+        with self._write() as txn:
+            txn.replace(
+                self._serialize(feed.id), self._serialize(now), db=self._db(Named.poll)
+            )
+
+    def get_feed_validators(self, feed: Feed) -> FeedValidators:
+
+        with self._read() as txn:
+            value = txn.get(self._serialize(feed.id), db=self._db(Named.validators))
+
+        if value:
+            return FeedValidators(**self._deserialize(value))
+        else:
+            return FeedValidators()
+
+    def update_feed_validators(self, feed: Feed, validators: FeedValidators) -> None:
+
+        with self._write() as txn:
+            txn.replace(
+                self._serialize(feed.id),
+                self._serialize(validators),
+                db=self._db(Named.validators),
+            )
 
     def upsert_feed_entry(self, feed: Feed, entry: FeedEntry) -> None:
 
-        with self.db.begin(db=self._db(Named.entry), write=True) as txn:
-            txn.replace(self._serialize(entry.id), self._serialize(entry))
+        with self._write() as txn:
+            previous = txn.get(self._serialize(entry.id), db=self._db(Named.entry))
+            if previous:
+                previous_entry = FeedEntry(**self._deserialize(previous))
+                self._unindex_entry(txn, previous_entry)
+                self._adjust_feed_stats(txn, feed_id=previous_entry.feed_id, delta=-1)
+
+            txn.replace(
+                self._serialize(entry.id),
+                self._serialize(entry),
+                db=self._db(Named.entry),
+            )
 
-        with self.db.begin(db=self._db(Named.si_feed_entry), write=True) as txn:
-            value = txn.get(self._serialize(feed.id))
+            self._index_entry(txn, feed_id=feed.id, entry=entry)
+            self._adjust_feed_stats(txn, feed_id=feed.id, delta=1)
+            self._log_change(txn, "entry", entry.id)
 
-            if value:
-                entries = self._deserialize(value)
-                entries.append(entry.id)
-            else:
-                entries = [entry.id]
+    def _entry_ids(
+        self, txn: Transaction, feed: Feed = None, after: int = 0
+    ) -> List[bytes]:
+        if feed:
+            prefix = feed.id.encode()
+            cur = txn.cursor(db=self._db(Named.si_feed_published))
+            start = self._feed_index_key(feed.id, int(after) + 1)
+        else:
+            prefix = b""
+            cur = txn.cursor(db=self._db(Named.si_published))
+            start = self._published_key(int(after) + 1)
+
+        # keys are ordered by publish time, so older entries are skipped by
+        # seeking rather than deserializing them
+        if not cur.set_range(start):
+            return []
+
+        entry_ids = []
+        for key in cur.iternext(values=False):
+            if not key.startswith(prefix):
+                break
+
+            entry_ids.append(key[len(prefix) + 8 :])
+
+        entry_ids.reverse()
 
-            txn.replace(self._serialize(feed.id), self._serialize(entries))
+        return entry_ids
 
     def get_entries(
         self, feed: Feed = None, after: int = 0
     ) -> Mapping[str, FeedEntry | str]:
-        entries = []
 
-        if feed:
-            with self.db.begin(db=self._db(Named.si_feed_entry)) as txn:
-                _entries = txn.get(self._serialize(feed.id))
-                entry_ids = []
-                if _entries:
-                    entry_ids = self._deserialize(_entries)
-
-                with self.db.begin(db=self._db(Named.entry)) as txn:
-                    cur = txn.cursor()
-                    entries = cur.getmulti([self._serialize(i) for i in entry_ids])
-        else:
-            with self.db.begin(db=self._db(Named.entry)) as txn:
-                cur = txn.cursor()
-                entries = list(cur.iternext())
+        with self._read() as txn:
+            entry_ids = self._entry_ids(txn=txn, feed=feed, after=after)
+
+            cur = txn.cursor(db=self._db(Named.entry))
+            entries = cur.getmulti(entry_ids)
 
         out = []
-        for entry in entries if entries else []:
+        for entry in entries:
             k, v = entry
             feed_entry = FeedEntry(**self._deserialize(v))
-            if feed_entry.published_at > after:
-                out.append(
-                    {
-                        "entry": feed_entry,
-                        "feed_id": feed_entry.feed_id,
-                        "id": self._deserialize(k),
-                    }
-                )
+            out.append(
+                {
+                    "entry": feed_entry,
+                    "feed_id": feed_entry.feed_id,
+                    "id": bytes(k).decode(),
+                }
+            )
 
         return out
 
+    def get_feed_stats(self) -> Mapping[str, FeedStats]:
+
+        with self._read() as txn:
+            cur = txn.cursor(db=self._db(Named.feed_stats))
+            stats = list(cur.iternext())
+
+        return {bytes(k).decode(): FeedStats(**self._deserialize(v)) for k, v in stats}
+
     def get_feed_entry(self, id: str) -> FeedEntry:
 
-        with self.db.begin(db=self._db(Named.entry)) as txn:
-            entry = txn.get(self._serialize(id))
+        with self._read() as txn:
+            entry = txn.get(self._serialize(id), db=self._db(Named.entry))
 
         return FeedEntry(**self._deserialize(entry))
 
     def feed_entry_exists(self, id: str) -> bool:
 
-        with self.db.begin(db=self._db(Named.entry)) as txn:
-            cur = txn.cursor()
+        with self._read() as txn:
+            cur = txn.cursor(db=self._db(Named.entry))
 
             return cur.set_key(self._serialize(id))
 
+    def feed_entries_exist(self, ids: Iterable[str]) -> Set[str]:
+
+        with self._read() as txn:
+            cur = txn.cursor(db=self._db(Named.entry))
+            found = cur.getmulti([self._serialize(i) for i in ids])
+
+        return {bytes(k).decode() for k, _ in found}
+
     def entry_content_exists(self, entry: FeedEntry):
 
-        with self.db.begin(db=self._db(Named.entry_content)) as txn:
-            cur = txn.cursor()
+        with self._read() as txn:
+            cur = txn.cursor(db=self._db(Named.entry_content))
             exists = cur.set_key(self._serialize(entry.id))
 
             return exists
 
     def retrieve_entry_content(self, entry: FeedEntry):
 
-        with self.db.begin(db=self._db(Named.entry_content)) as txn:
-            content = txn.get(self._serialize(entry.id))
+        with self._read() as txn:
+            content = txn.get(
+                self._serialize(entry.id), db=self._db(Named.entry_content)
+            )
             return EntryContent(**self._deserialize(content))
 
     async def upsert_entry_content(self, content: EntryContent):
 
-        with self.db.begin(db=self._db(Named.entry_content), write=True) as txn:
+        with self._write() as txn:
             txn.replace(
                 self._serialize(content.id),
                 self._serialize(content),
+                db=self._db(Named.entry_content),
             )
+            self._log_change(txn, "content", content.id)
 
     def upsert_handler(self, handler: type[HandlerBase]) -> None:
 
-        with self.db.begin(self._db(Named.handler), write=True) as txn:
-
+        with self._write() as txn:
             txn.replace(
                 self._serialize(handler.id),
                 self._serialize(handler.json(exclude_none=True)),
+                db=self._db(Named.handler),
             )
+            self._log_change(txn, "handler", handler.id)
 
     def _make_handler_obj(self, id: str, config: Mapping):
 
@@ -236,9 +584,8 @@ class LMDBStorageHandler(StorageHandler):
 
     def get_handlers(self) -> Mapping[str, HandlerBase]:
 
-        with self.db.begin(self._db(Named.handler)) as txn:
-
-            cur = txn.cursor()
+        with self._read() as txn:
+            cur = txn.cursor(db=self._db(Named.handler))
             handler_cfgs = list(cur.iternext())
 
         handlers = {i: None for i in self.handler_map.keys()}
@@ -252,8 +599,8 @@ class LMDBStorageHandler(StorageHandler):
 
     def get_handler(self, id: str) -> HandlerBase:
 
-        with self.db.begin(db=self._db(Named.handler)) as txn:
-            cfg = txn.get(self._serialize(id))
+        with self._read() as txn:
+            cfg = txn.get(self._serialize(id), db=self._db(Named.handler))
 
         if cfg:
             handler_obj = self._make_handler_obj(
@@ -266,8 +613,8 @@ class LMDBStorageHandler(StorageHandler):
 
     def get_settings(self) -> GlobalSettings:
 
-        with self.db.begin(db=self._db(Named.settings)) as txn:
-            cfg = txn.get("settings".encode())
+        with self._read() as txn:
+            cfg = txn.get("settings".encode(), db=self._db(Named.settings))
 
         if cfg:
             return GlobalSettings(db=self, **self._deserialize(cfg))
@@ -276,11 +623,13 @@ class LMDBStorageHandler(StorageHandler):
 
     def upsert_settings(self, settings: GlobalSettings) -> None:
 
-        with self.db.begin(db=self._db(Named.settings), write=True) as txn:
+        with self._write() as txn:
             txn.replace(
                 "settings".encode(),
                 self._serialize(settings.json(exclude={"db"}, exclude_none=True)),
+                db=self._db(Named.settings),
             )
+            self._log_change(txn, "settings", "settings")
 
         self.upsert_handler(settings.notification_handler)
         self.upsert_handler(settings.llm_handler)
@@ -288,34 +637,89 @@ class LMDBStorageHandler(StorageHandler):
 
     def delete_feed(self, feed: Feed) -> None:
 
-        with self.db.begin(db=self._db(Named.feed), write=True) as txn:
-            txn.delete(self._serialize(feed.id))
+        named = [
+            Named.feed,
+            Named.poll,
+            Named.validators,
+            Named.feed_start,
+            Named.feed_stats,
+        ]
 
-        with self.db.begin(db=self._db(Named.si_feed_entry), write=True) as txn:
-            txn.delete(self._serialize(feed.id))
+        with self._write() as txn:
+            for db in named:
+                txn.delete(self._serialize(feed.id), db=self._db(db))
 
-        with self.db.begin(db=self._db(Named.poll), write=True) as txn:
-            txn.delete(self._serialize(feed.id))
+            self._log_change(txn, "feed", feed.id, deleted=True)
 
-        with self.db.begin(db=self._db(Named.feed_start), write=True) as txn:
-            txn.delete(self._serialize(feed.id))
+            prefix = feed.id.encode()
+            cur = txn.cursor(db=self._db(Named.si_feed_published))
+            if cur.set_range(prefix):
+                while cur.key().startswith(prefix):
+                    if not cur.delete():
+                        break
 
     def delete_entry_content(self, entry: FeedEntry) -> None:
 
-        with self.db.begin(db=self._db(Named.entry_content), write=True) as txn:
-            txn.delete(self._serialize(entry.id))
+        with self._write() as txn:
+            txn.delete(self._serialize(entry.id), db=self._db(Named.entry_content))
 
     def delete_feed_entry(self, feed_entry: FeedEntry) -> None:
 
         self.delete_entry_content(feed_entry)
 
-        with self.db.begin(db=self._db(Named.entry), write=True) as txn:
-            txn.delete(self._serialize(feed_entry.id))
+        with self._write() as txn:
+            value = txn.get(self._serialize(feed_entry.id), db=self._db(Named.entry))
+            if value:
+                feed_entry = FeedEntry(**self._deserialize(value))
+                txn.delete(self._serialize(feed_entry.id), db=self._db(Named.entry))
+                self._unindex_entry(txn, feed_entry)
+                self._adjust_feed_stats(txn, feed_id=feed_entry.feed_id, delta=-1)
+                self._log_change(txn, "entry", feed_entry.id, deleted=True)
+
+    def upsert_outbox_item(self, item: OutboxItem) -> None:
+
+        with self._write() as txn:
+            txn.replace(
+                self._serialize(item.id),
+                self._serialize(item),
+                db=self._db(Named.outbox),
+            )
+
+    def get_outbox_items(self, before: float) -> List[OutboxItem]:
+
+        with self._read() as txn:
+            cur = txn.cursor(db=self._db(Named.outbox))
+            items = [
+                OutboxItem(**self._deserialize(v)) for v in cur.iternext(keys=False)
+            ]
+
+        return sorted(
+            (i for i in items if i.not_before <= before), key=lambda i: i.not_before
+        )
+
+    def delete_outbox_item(self, item: OutboxItem) -> None:
+
+        with self._write() as txn:
+            txn.delete(self._serialize(item.id), db=self._db(Named.outbox))
+
+    def get_changes(self, after: int = 0) -> List[Change]:
+
+        with self._read() as txn:
+            cur = txn.cursor(db=self._db(Named.si_change_seq))
+            if not cur.set_range(pack(">Q", after + 1)):
+                return []
+
+            keys = list(cur.iternext(keys=False))
+            changes = txn.cursor(db=self._db(Named.change_log)).getmulti(keys)
+
+        return sorted(
+            (Change(**self._deserialize(v)) for _, v in changes),
+            key=lambda i: i.seq,
+        )
 
-        with self.db.begin(db=self._db(Named.si_feed_entry), write=True) as txn:
-            value = txn.get(self._serialize(feed_entry.feed_id))
+    def get_change_seq(self) -> int:
 
-            entries: List[str] = self._deserialize(value)
-            entries.remove(feed_entry.id)
+        with self._read() as txn:
+            cur = txn.cursor(db=self._db(Named.si_change_seq))
 
-            txn.replace(self._serialize(feed_entry.feed_id), self._serialize(entries))
+            return unpack(">Q", cur.key())[0] if cur.last() else 0
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from logging import getLogger
+from os import O_RDONLY, close, fsync
+from os import open as os_open
+from pathlib import Path
+from pickle import load
+from typing import Callable, Iterable, List, Optional
+from uuid import uuid4
+
+from zstandard import ZstdCompressor, ZstdDecompressor
+
+from app.models import EntryContent
+
+logger = getLogger("uvicorn.error")
+
+
+class MediaStore:
+    """
+    Entry content kept on disk as zstd-compressed json, one file per entry.
+    Files are sharded into two levels of directories by the leading
+    characters of the entry id, so that no one directory grows too large.
+    Writes go to a temporary file that is renamed into place, so a reader
+    never sees half a file, and a batch of writes shares its fsyncs.
+
+    Older stores kept pickles in one flat directory; those are still read,
+    and `migrate` moves them into the sharded layout.
+    """
+
+    suffix = ".json.zst"
+    legacy_suffix = ".pickle"
+
+    def __init__(self, path: Path, level: int = 3) -> None:
+        self.path = path
+        self.level = level
+
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, id: str) -> Path:
+        return self.path.joinpath(id[:2], id[2:4], f"{id}{self.suffix}")
+
+    def _legacy_path(self, id: str) -> Path:
+        return self.path.joinpath(f"{id}{self.legacy_suffix}")
+
+    @staticmethod
+    def _fsync(path: Path) -> None:
+        fd = os_open(path, O_RDONLY)
+        try:
+            fsync(fd)
+        finally:
+            close(fd)
+
+    def write(self, content: EntryContent) -> None:
+        self.write_many([content])
+
+    def write_many(self, contents: Iterable[EntryContent]) -> None:
+        # compressors are not safe to share between threads, and cheap to make
+        compressor = ZstdCompressor(level=self.level)
+        written: List[tuple[str, Path, Path]] = []
+
+        try:
+            for content in contents:
+                path = self._path(content.id)
+                path.parent.mkdir(parents=True, exist_ok=True)
+
+                tmp = path.with_name(f".{path.name}.{uuid4().hex}.tmp")
+                tmp.write_bytes(compressor.compress(content.json().encode()))
+                written.append((content.id, tmp, path))
+
+            # sync every file, then move them all into place and sync each
+            # directory once, rather than paying for both on every file
+            for _, tmp, _ in written:
+                self._fsync(tmp)
+
+            for id, tmp, path in written:
+                tmp.replace(path)
+                self._legacy_path(id).unlink(missing_ok=True)
+        except BaseException:
+            for _, tmp, _ in written:
+                tmp.unlink(missing_ok=True)
+            raise
+
+        for directory in {path.parent for _, _, path in written}:
+            self._fsync(directory)
+
+    def read(self, id: str) -> Optional[EntryContent]:
+        try:
+            data = self._path(id).read_bytes()
+        except FileNotFoundError:
+            return self._read_legacy(id)
+
+        return EntryContent.parse_raw(ZstdDecompressor().decompress(data))
+
+    def _read_legacy(self, id: str) -> Optional[EntryContent]:
+        path = self._legacy_path(id)
+
+        if not path.exists() or not path.stat().st_size:
+            return None
+
+        with open(path, "rb") as fp:
+            return load(fp)
+
+    def exists(self, id: str) -> bool:
+        if self._path(id).exists():
+            return True
+
+        legacy = self._legacy_path(id)
+
+        return legacy.exists() and legacy.stat().st_size > 0
+
+    def delete(self, id: str) -> None:
+        self._path(id).unlink(missing_ok=True)
+        self._legacy_path(id).unlink(missing_ok=True)
+
+    def migrate(
+        self, batch_size: int = 1000, progress: Callable[[int], None] = None
+    ) -> int:
+        """
+        Move legacy pickled content into the sharded layout, batch_size files
+        at a time. Returns the number of files migrated.
+        """
+        migrated = 0
+        batch: List[EntryContent] = []
+
+        def flush():
+            nonlocal migrated
+
+            # writing the new file removes the pickle it replaces
+            self.write_many(batch)
+            migrated += len(batch)
+            batch.clear()
+
+            logger.info(f"migrated {migrated} media files")
+            if progress:
+                progress(migrated)
+
+        for path in list(self.path.glob(f"*{self.legacy_suffix}")):
+            content = self._read_legacy(path.name[: -len(self.legacy_suffix)])
+
+            if content is None:
+                path.unlink(missing_ok=True)
+                continue
+
+            batch.append(content)
+            if len(batch) >= batch_size:
+                flush()
+
+        if batch:
+            flush()
+
+        return migrated
@@ -0,0 +1,139 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from typing import Any, Callable, Hashable, List, Mapping, Type
+
+from app.cache import TTLCache
+from app.constants import METADATA_CACHE_TTL
+from app.handlers import HandlerBase
+from app.models import Feed
+from app.settings import GlobalSettings
+
+_missing = object()
+
+
+class MetadataCacheMixin:
+    """
+    Serve settings, handlers and feeds from memory. These are read on nearly
+    every request but rarely written, so every cached value is tagged with
+    a version that is bumped by any write through this handler, and expires
+    after METADATA_CACHE_TTL seconds to pick up writes from other processes.
+    """
+
+    _metadata_version: int = 0
+
+    @property
+    def metadata_cache(self) -> TTLCache:
+        # created on first use so the mixin doesn't need to take part in the
+        # storage handler's __init__
+        if "_metadata_cache" not in self.__dict__:
+            self._metadata_cache = TTLCache(ttl=METADATA_CACHE_TTL)
+
+        return self._metadata_cache
+
+    @property
+    def snapshot_version(self) -> ContextVar:
+        # the metadata version current when this context's snapshot was opened
+        if "_snapshot_version" not in self.__dict__:
+            self._snapshot_version = ContextVar(
+                f"metadata_snapshot_{id(self)}", default=None
+            )
+
+        return self._snapshot_version
+
+    @contextmanager
+    def snapshot(self):
+        if self.snapshot_version.get() is not None:
+            with super().snapshot():
+                yield
+            return
+
+        token = self.snapshot_version.set(self._metadata_version)
+
+        try:
+            with super().snapshot():
+                yield
+        finally:
+            self.snapshot_version.reset(token)
+
+    def invalidate_metadata(self) -> None:
+        self._metadata_version += 1
+        self.metadata_cache.clear()
+
+        # a write made inside a snapshot renews it, so it is current again
+        if self.snapshot_version.get() is not None:
+            self.snapshot_version.set(self._metadata_version)
+
+    def _cached(self, key: Hashable, load: Callable[[], Any]) -> Any:
+        version = self._metadata_version
+
+        # a snapshot opened before the latest write reads what was there
+        # before it, which must not be cached as current
+        opened = self.snapshot_version.get()
+        if opened is not None and opened != version:
+            return load()
+
+        hit = self.metadata_cache.get(key)
+        if hit and hit[0] == version:
+            return hit[1]
+
+        value = load()
+        self.metadata_cache.set(key, (version, value))
+
+        return value
+
+    def get_settings(self) -> GlobalSettings:
+        settings = self._cached("settings", super().get_settings)
+
+        # db is excluded from copies, so hand it back explicitly
+        return settings.copy(update={"db": self})
+
+    def upsert_settings(self, settings: GlobalSettings) -> None:
+        super().upsert_settings(settings)
+        self.invalidate_metadata()
+
+    # handler objects are handed out as-is so that they can hold on to
+    # clients and connections between calls
+    def get_handlers(self) -> Mapping[str, Type[HandlerBase]]:
+        return dict(self._cached("handlers", super().get_handlers))
+
+    def get_handler(self, id: str) -> Type[HandlerBase]:
+        def load():
+            try:
+                return super(MetadataCacheMixin, self).get_handler(id=id)
+            except IndexError:
+                return _missing
+
+        handler = self._cached(("handler", id), load)
+        if handler is _missing:
+            raise IndexError
+
+        return handler
+
+    def upsert_handler(self, handler: Type[HandlerBase]) -> None:
+        super().upsert_handler(handler)
+        self.invalidate_metadata()
+
+    def get_feeds(self) -> List[Feed]:
+        return [i.copy() for i in self._cached("feeds", super().get_feeds)]
+
+    def get_feed(self, id: str) -> Feed:
+        feed = self._cached(("feed", id), partial(super().get_feed, id=id))
+
+        return feed.copy()
+
+    def upsert_feed(self, feed: Feed) -> None:
+        super().upsert_feed(feed)
+        self.invalidate_metadata()
+
+    def insert_feed(self, feed: Feed) -> None:
+        super().insert_feed(feed)
+        self.invalidate_metadata()
+
+    def delete_feed(self, feed: Feed) -> None:
+        super().delete_feed(feed)
+        self.invalidate_metadata()
+
+    def clear_active_feeds(self) -> None:
+        super().clear_active_feeds()
+        self.invalidate_metadata()
@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+from asyncio import Task, create_task, gather, sleep, to_thread
+from contextlib import contextmanager
+from logging import getLogger
+from mmap import ACCESS_READ, mmap
+from os import fsync
+from pathlib import Path
+from struct import pack, unpack
+from threading import Lock
+from typing import BinaryIO, Dict, List, Optional, Set, Tuple
+
+from lmdb import Transaction
+
+from app.constants import (
+    DATA_DIR,
+    PACKFILE_COMPACT_INTERVAL,
+    PACKFILE_COMPACT_RATIO,
+    PACKFILE_SEGMENT_SIZE,
+)
+from app.models import EntryContent, FeedEntry
+from app.storage.lmdb import LMDBStorageHandler, Named
+
+logger = getLogger("uvicorn.error")
+
+# where a record's payload sits: segment number, offset and length
+Location = Tuple[int, int, int]
+
+LOCATION = ">IQI"
+RECORD_HEADER = ">HI"
+
+# how many records the compactor moves per write transaction
+COMPACT_BATCH_SIZE = 1000
+
+
+class Segments:
+    """
+    A directory of append-only segment files. Records are appended to the
+    newest segment until it reaches `segment_size`, when a new one is started.
+    Each record is its id and payload behind a small length header, so that a
+    segment can be read back without the index. Payloads are read through a
+    read-only mmap of their segment, which is widened as the newest one grows.
+    """
+
+    def __init__(self, path: Path, segment_size: int = PACKFILE_SEGMENT_SIZE) -> None:
+        self.path = path
+        self.segment_size = segment_size
+
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        numbers = self.numbers()
+        self.active = numbers[-1] if numbers else 1
+
+        self._fp: Optional[BinaryIO] = None
+        self._maps: Dict[int, mmap] = {}
+        self._lock = Lock()
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.path.joinpath(f"{segment:08d}.pack")
+
+    def numbers(self) -> List[int]:
+        return sorted(int(i.stem) for i in self.path.glob("*.pack"))
+
+    def size(self, segment: int) -> int:
+        return self._segment_path(segment).stat().st_size
+
+    def append(self, id: str, data: bytes, sync: bool = False) -> Location:
+        key = id.encode()
+        header = pack(RECORD_HEADER, len(key), len(data))
+
+        with self._lock:
+            if not self._fp:
+                # unbuffered, so that appended records can be mapped right away
+                self._fp = open(self._segment_path(self.active), "ab", buffering=0)
+
+            offset = self._fp.tell()
+            if (
+                offset
+                and offset + len(header) + len(key) + len(data) > self.segment_size
+            ):
+                self._sync()
+                self._fp.close()
+
+                self.active += 1
+                self._fp = open(self._segment_path(self.active), "ab", buffering=0)
+                offset = 0
+
+            self._fp.write(header + key + data)
+
+            if sync:
+                self._sync()
+
+            # read under the lock, as another thread may start a new segment
+            segment = self.active
+
+        return segment, offset + len(header) + len(key), len(data)
+
+    def _sync(self) -> None:
+        if self._fp:
+            fsync(self._fp.fileno())
+
+    def sync(self) -> None:
+        with self._lock:
+            self._sync()
+
+    def read(self, segment: int, offset: int, length: int) -> bytes:
+        end = offset + length
+        mapped = self._maps.get(segment)
+
+        if mapped is None or len(mapped) < end:
+            with self._lock:
+                with open(self._segment_path(segment), "rb") as fp:
+                    mapped = mmap(fp.fileno(), 0, access=ACCESS_READ)
+
+                self._maps[segment] = mapped
+
+        return mapped[offset:end]
+
+    def remove(self, segment: int) -> None:
+        with self._lock:
+            # readers may still hold the old map, so leave it to be collected
+            self._maps.pop(segment, None)
+            self._segment_path(segment).unlink(missing_ok=True)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fp:
+                self._sync()
+                self._fp.close()
+                self._fp = None
+
+            self._maps.clear()
+
+
+class PackfileStorageHandler(LMDBStorageHandler):
+    """
+    An LMDB handler that keeps entry content out of LMDB, in append-only
+    segment files under DATA_DIR/packs. LMDB holds where each entry's content
+    sits, and how many live bytes each segment holds. Overwritten and deleted
+    content is left behind in its segment until the compactor, started with
+    start(), copies the live records out of mostly-dead segments.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        self.segments = Segments(Path(DATA_DIR, "packs"))
+
+        self._index_db = self.db.open_db(b"pack_index")
+        self._live_db = self.db.open_db(b"pack_live")
+        self._segment_db = self.db.open_db(b"si_pack_segment")
+
+        # compacted segments are removed one pass later, so that a snapshot
+        # taken before they were compacted can still read from them
+        self._retired: Set[int] = set()
+        self._compactor: Optional[Task] = None
+
+    @contextmanager
+    def batch(self):
+        if getattr(self._batch_state(), "txn", None):
+            yield
+            return
+
+        # appended content has to be on disk before the index that points
+        # at it commits
+        with super().batch():
+            yield
+            self.segments.sync()
+
+    def _locate(self, txn: Transaction, id: str) -> Optional[Location]:
+        value = txn.get(id.encode(), db=self._index_db)
+
+        if value:
+            return unpack(LOCATION, value)
+
+    def _adjust_live(self, txn: Transaction, segment: int, delta: int) -> None:
+        key = pack(">I", segment)
+        value = txn.get(key, db=self._live_db)
+        live = unpack(">Q", value)[0] if value else 0
+
+        txn.put(key, pack(">Q", max(live + delta, 0)), db=self._live_db)
+
+    def _relocate(
+        self, txn: Transaction, id: str, location: Optional[Location]
+    ) -> None:
+        previous = self._locate(txn, id)
+        if previous:
+            segment, offset, length = previous
+            txn.delete(pack(">IQ", segment, offset), db=self._segment_db)
+            self._adjust_live(txn, segment, -length)
+
+        if location:
+            segment, offset, length = location
+            txn.put(id.encode(), pack(LOCATION, *location), db=self._index_db)
+            txn.put(pack(">IQ", segment, offset), id.encode(), db=self._segment_db)
+            self._adjust_live(txn, segment, length)
+        else:
+            txn.delete(id.encode(), db=self._index_db)
+
+    async def upsert_entry_content(self, content: EntryContent):
+
+        data = content.json().encode()
+
+        if getattr(self._batch_state(), "txn", None):
+            # the batch syncs once, before it commits
+            location = self.segments.append(content.id, data)
+        else:
+            # syncing is slow, so keep it off the event loop
+            location = await to_thread(self.segments.append, content.id, data, True)
+
+        with self._write() as txn:
+            self._relocate(txn, content.id, location)
+            self._log_change(txn, "content", content.id)
+
+            # content written before switching to this handler lives in lmdb
+            txn.delete(self._serialize(content.id), db=self._db(Named.entry_content))
+
+    def entry_content_exists(self, entry: FeedEntry):
+
+        with self._read() as txn:
+            if self._locate(txn, entry.id):
+                return True
+
+        return super().entry_content_exists(entry)
+
+    def retrieve_entry_content(self, entry: FeedEntry) -> EntryContent:
+
+        with self._read() as txn:
+            location = self._locate(txn, entry.id)
+
+        if not location:
+            return super().retrieve_entry_content(entry)
+
+        return EntryContent.parse_raw(self.segments.read(*location))
+
+    def delete_entry_content(self, entry: FeedEntry) -> None:
+
+        with self._write() as txn:
+            self._relocate(txn, entry.id, None)
+
+        super().delete_entry_content(entry)
+
+    def _segment_ids(self, txn: Transaction, segment: int) -> List[bytes]:
+        prefix = pack(">I", segment)
+        cur = txn.cursor(db=self._segment_db)
+
+        ids = []
+        if cur.set_range(prefix):
+            for key, value in cur.iternext():
+                if not key.startswith(prefix) or len(ids) >= COMPACT_BATCH_SIZE:
+                    break
+
+                ids.append(value)
+
+        return ids
+
+    def _compact_segment(self, segment: int) -> int:
+        moved = 0
+
+        while True:
+            with self._write() as txn:
+                ids = [bytes(i).decode() for i in self._segment_ids(txn, segment)]
+
+                for id in ids:
+                    data = self.segments.read(*self._locate(txn, id))
+                    self._relocate(txn, id, self.segments.append(id, data))
+
+                self.segments.sync()
+
+            moved += len(ids)
+            if len(ids) < COMPACT_BATCH_SIZE:
+                return moved
+
+    def compact(self, ratio: float = PACKFILE_COMPACT_RATIO) -> int:
+        """
+        Copy the live records out of every full segment where less than
+        `ratio` of the bytes are live, and remove the segments compacted on
+        the previous pass. Returns the number of records moved.
+        """
+        for segment in self._retired:
+            self.segments.remove(segment)
+
+        self._retired = set()
+        moved = 0
+
+        for segment in self.segments.numbers():
+            # the segment being appended to is never compacted
+            if segment >= self.segments.active:
+                continue
+
+            with self._read() as txn:
+                value = txn.get(pack(">I", segment), db=self._live_db)
+                live = unpack(">Q", value)[0] if value else 0
+
+            size = self.segments.size(segment)
+            if size and live / size >= ratio:
+                continue
+
+            moved += self._compact_segment(segment)
+
+            with self._write() as txn:
+                txn.delete(pack(">I", segment), db=self._live_db)
+
+            self._retired.add(segment)
+            logger.info(f"compacted packfile segment {segment}")
+
+        return moved
+
+    async def _compact_periodically(self) -> None:
+        while True:
+            await sleep(PACKFILE_COMPACT_INTERVAL)
+
+            try:
+                moved = await to_thread(self.compact)
+                if moved:
+                    logger.info(f"moved {moved} records out of packfile segments")
+            except Exception as e:
+                logger.warning(f"Failed to compact packfile segments: {e}")
+
+    def start(self) -> None:
+        self._compactor = create_task(self._compact_periodically())
+
+    async def stop(self) -> None:
+        if self._compactor:
+            self._compactor.cancel()
+            await gather(self._compactor, return_exceptions=True)
+            self._compactor = None
+
+        self.segments.close()
@@ -1,44 +1,265 @@
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
 from logging import getLogger
 from pathlib import Path
-from typing import List, Mapping, Optional, Type
+from time import time
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple, Type
 
-from tinydb import Query, TinyDB
+from tinydb import TinyDB
+from tinydb.storages import JSONStorage
+from tinydb.table import Document
 
 from app.constants import DATA_DIR
 from app.db import StorageHandler
 from app.handlers import ContentRetrievalHandler, LLMHandler, NotificationHandler
-from app.models import EntryContent, Feed, FeedEntry
+from app.models import (
+    Change,
+    EntryContent,
+    Feed,
+    FeedEntry,
+    FeedStats,
+    FeedValidators,
+    OutboxItem,
+)
 from app.settings import GlobalSettings
 
 logger = getLogger("uvicorn.error")
 
 
+class TrackingJSONStorage(JSONStorage):
+    """
+    A JSONStorage that remembers what the file looked like after its own
+    writes, so that in-memory indexes can tell when another process (such
+    as the CLI) has changed it underneath them. While batching, writes are
+    held in memory and the file is only rewritten once, at the end
+    """
+
+    def __init__(self, path: str, **kwargs) -> None:
+        super().__init__(path, **kwargs)
+
+        self.path = Path(path)
+        self.signature = self.stat()
+
+        self.batching = False
+        self.pending: Optional[Dict] = None
+
+    def stat(self) -> Tuple[int, int]:
+        stat = self.path.stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    def read(self) -> Optional[Dict]:
+        if self.pending is not None:
+            return self.pending
+
+        return super().read()
+
+    def write(self, data: Dict) -> None:
+        if self.batching:
+            self.pending = data
+            return
+
+        super().write(data)
+        self.signature = self.stat()
+
+    @contextmanager
+    def batch(self):
+        self.batching = True
+
+        try:
+            yield
+        except BaseException:
+            self.pending = None
+            raise
+        finally:
+            self.batching = False
+
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            self.write(pending)
+
+    def changed(self) -> bool:
+        return self.stat() != self.signature
+
+
 class TinyDBStorageHandler(StorageHandler):
     """
     Use this class to encapsulate DB interactions
     """
 
+    # every table is keyed by the id field of its rows
+    tables = [
+        "feeds",
+        "poll",
+        "feed_start",
+        "entries",
+        "entry_contents",
+        "handler",
+        "settings",
+        "outbox",
+        "changes",
+    ]
+
     def __init__(self):
         super().__init__()
 
         DATA_DIR.mkdir(parents=True, exist_ok=True)
         db_path = Path(DATA_DIR, "db.json").resolve()
-        self.db = TinyDB(db_path)
+        self.db = TinyDB(db_path, storage=TrackingJSONStorage)
+
+        # TinyDB has no indexes of its own, so we keep hash indexes from the id
+        # of each row to its doc id, and where each entry sits by id. Entries
+        # are also kept sorted by (published_at, doc_id), both overall and per
+        # feed, so a feed's latest entry is the last of its list. Changes are
+        # kept by (seq, doc_id), in sequence order
+        self._ids: Dict[str, Dict[str, int]] = {}
+        self._feed_published: Dict[str, List[Tuple[int, int]]] = {}
+        self._published: List[Tuple[int, int]] = []
+        self._entry_docs: Dict[str, Tuple[int, int, str]] = {}
+        self._changes: List[Tuple[int, int]] = []
+        self._build_indexes()
+
+    def _build_indexes(self) -> None:
+        self._ids = {i: {} for i in self.tables}
+        self._feed_published = {}
+        self._published = []
+        self._entry_docs = {}
+        self._changes = []
+
+        for name in self.tables:
+            for i in self.db.table(name).all():
+                if "id" not in i:
+                    continue
+
+                self._ids[name][i["id"]] = i.doc_id
+
+                if name == "entries":
+                    self._index_entry(
+                        id=i["id"],
+                        feed_id=i["feed_id"],
+                        published_at=i["entry"]["published_at"],
+                        doc_id=i.doc_id,
+                    )
+
+                if name == "changes":
+                    self._changes.append((i["change"]["seq"], i.doc_id))
+
+        self._changes.sort()
+        self.db.storage.signature = self.db.storage.stat()
+
+    def _check_indexes(self) -> None:
+        if self.db.storage.changed():
+            logger.info("db.json changed outside this process, rebuilding indexes")
+            self._build_indexes()
+
+    def _index_entry(self, id: str, feed_id: str, published_at: int, doc_id: int):
+        self._unindex_entry(id)
+
+        self._entry_docs[id] = (published_at, doc_id, feed_id)
+        insort(self._published, (published_at, doc_id))
+        insort(self._feed_published.setdefault(feed_id, []), (published_at, doc_id))
+
+    @staticmethod
+    def _discard(items: List[Tuple[int, int]], item: Tuple[int, int]) -> None:
+        position = bisect_left(items, item)
+
+        if position < len(items) and items[position] == item:
+            del items[position]
+
+    def _unindex_entry(self, id: str) -> None:
+        position = self._entry_docs.pop(id, None)
+        if not position:
+            return
+
+        published_at, doc_id, feed_id = position
+        self._discard(self._published, (published_at, doc_id))
+        self._discard(self._feed_published[feed_id], (published_at, doc_id))
+
+    def _log_change(self, kind: str, id: str, deleted: bool = False) -> None:
+        self._check_indexes()
+
+        seq = self._changes[-1][0] + 1 if self._changes else 1
+        change = Change(seq=seq, kind=kind, id=id, ts=int(time()), deleted=deleted)
+
+        # only the latest change to a record is kept
+        previous = self._get("changes", change.key)
+        if previous:
+            self._changes.remove((previous["change"]["seq"], previous.doc_id))
+
+        doc_id = self._upsert("changes", {"id": change.key, "change": change.dict()})
+        self._changes.append((seq, doc_id))
+
+    @contextmanager
+    def batch(self):
+        if self.db.storage.batching:
+            yield
+            return
+
+        try:
+            with self.db.storage.batch():
+                yield
+        except BaseException:
+            # the batched writes were dropped, so our indexes are ahead of
+            # the file and have to be rebuilt from it
+            self._build_indexes()
+            raise
+
+    def _doc_id(self, table: str, id: str) -> Optional[int]:
+        self._check_indexes()
+
+        return self._ids[table].get(id)
+
+    def _get(self, table: str, id: str) -> Optional[Document]:
+        doc_id = self._doc_id(table, id)
+
+        if doc_id is not None:
+            return self.db.table(table).get(doc_id=doc_id)
+
+    def _upsert(self, table: str, row: Mapping) -> int:
+        doc_id = self._doc_id(table, row["id"])
+
+        if doc_id is not None:
+            self.db.table(table).update(row, doc_ids=[doc_id])
+        else:
+            doc_id = self.db.table(table).insert(row)
+            self._ids[table][row["id"]] = doc_id
+
+        return doc_id
+
+    def _remove(self, table: str, id: str) -> None:
+        doc_id = self._doc_id(table, id)
+
+        if doc_id is not None:
+            self.db.table(table).remove(doc_ids=[doc_id])
+            del self._ids[table][id]
 
     def clear_active_feeds(self) -> None:
-        self.db.drop_table("feeds")
+        self._check_indexes()
+
+        with self.batch():
+            for id in list(self._ids["feeds"]):
+                self._log_change("feed", id, deleted=True)
+
+            self.db.drop_table("feeds")
+            self._ids["feeds"] = {}
 
     def insert_feed(self, feed: Feed):
         table = self.db.table("feeds")
-        table.insert({"id": feed.id, "feed": feed.dict()})
+
+        self._check_indexes()
+
+        with self.batch():
+            self._ids["feeds"][feed.id] = table.insert(
+                {"id": feed.id, "feed": feed.dict()}
+            )
+            self._log_change("feed", feed.id)
 
     def get_feed(self, id: str) -> Feed:
-        table = self.db.table("feeds")
+        feed = self._get("feeds", id)
 
-        query = Query()
-        feed = table.search(query.id == id)[0]["feed"]
+        if not feed:
+            raise IndexError(f"No feed with id {id}")
 
-        return Feed(**feed)
+        return Feed(**feed["feed"])
 
     def get_feeds(self) -> List[Feed]:
         table = self.db.table("feeds")
@@ -46,127 +267,140 @@ class TinyDBStorageHandler(StorageHandler):
         return [Feed(**i["feed"]) for i in table.all()]
 
     def get_poll_state(self, feed: Feed) -> Optional[int]:
-        table = self.db.table("poll")
-
-        query = Query().id.matches(feed.id)
-
-        results = table.search(query)
+        result = self._get("poll", feed.id)
 
-        if results:
-            return results[0]["last_polled_at"]
+        if result:
+            return result.get("last_polled_at")
 
     def set_feed_start_ts(self, feed: Feed, start_ts: int):
-        table = self.db.table("feed_start")
-
-        query = Query().id.matches(feed.id)
-        table.upsert({"id": feed.id, "start_ts": start_ts}, cond=query)
+        self._upsert("feed_start", {"id": feed.id, "start_ts": start_ts})
 
     def get_feed_start_ts(self, feed: Feed) -> int:
-        table = self.db.table("feed_start")
-
-        query = Query().id.matches(feed.id)
-        results = table.search(query)
+        result = self._get("feed_start", feed.id)
 
-        if results:
-            return results[0]["start_ts"]
+        if result:
+            return result["start_ts"]
 
     def update_poll_state(self, feed: Feed, now: int):
-        table = self.db.table("poll")
+        self._upsert("poll", {"id": feed.id, "last_polled_at": now})
 
-        query = Query().id.matches(feed.id)
-        table.upsert({"id": feed.id, "last_polled_at": now}, cond=query)
+    def get_feed_validators(self, feed: Feed) -> FeedValidators:
+        result = self._get("poll", feed.id)
 
-    def upsert_feed(self, feed: Feed):
-        table = self.db.table("feeds")
+        if result:
+            return FeedValidators(**result)
+        else:
+            return FeedValidators()
 
+    def update_feed_validators(self, feed: Feed, validators: FeedValidators):
+        self._upsert("poll", {"id": feed.id, **validators.dict()})
+
+    def upsert_feed(self, feed: Feed):
         row = {
             "id": feed.id,
             "feed": feed.dict(),
         }
 
-        query = Query().id.matches(feed.id)
-        table.upsert(row, cond=query)
+        with self.batch():
+            self._upsert("feeds", row)
+            self._log_change("feed", feed.id)
 
     def upsert_feed_entry(self, feed: Feed, entry: FeedEntry):
-        table = self.db.table("entries")
-
         row = {
             "id": entry.id,
             "feed_id": feed.id,
             "entry": entry.dict(),
         }
 
-        query = Query().id.matches(entry.id)
-        table.upsert(row, cond=query)
+        with self.batch():
+            doc_id = self._upsert("entries", row)
+            self._log_change("entry", entry.id)
+
+        self._index_entry(
+            id=entry.id,
+            feed_id=feed.id,
+            published_at=entry.published_at,
+            doc_id=doc_id,
+        )
 
     def get_entries(self, feed: Feed = None, after: int = 0):
         table = self.db.table("entries")
+        self._check_indexes()
 
-        if feed:
-            query = Query().feed_id.matches(feed.id)
-            entries = table.search(query)
-        else:
-            entries = table.all()
+        published = self._feed_published.get(feed.id, []) if feed else self._published
+
+        # only read the documents published in the window we care about
+        start = bisect_right(published, (int(after), float("inf")))
+        doc_ids = [doc_id for _, doc_id in published[start:]]
+
+        entries = table.get(doc_ids=doc_ids) if doc_ids else []
+        entries = sorted(
+            (i for i in entries if i["entry"]["published_at"] > after),
+            key=lambda i: i["entry"]["published_at"],
+            reverse=True,
+        )
 
         return [
             {"entry": FeedEntry(**i["entry"]), "feed_id": i["feed_id"], "id": i["id"]}
             for i in entries
-            if i["entry"]["published_at"] > after
         ]
 
+    def get_feed_stats(self) -> Mapping[str, FeedStats]:
+        self._check_indexes()
+
+        return {
+            k: FeedStats(entry_count=len(v), latest_published_at=v[-1][0])
+            for k, v in self._feed_published.items()
+            if v
+        }
+
     def get_feed_entry(self, id: str):
-        table = self.db.table("entries")
+        entry = self._get("entries", id)
 
-        query = Query().id.matches(id)
-        entry = table.search(query)[0]
+        if not entry:
+            raise IndexError(f"No feed entry with id {id}")
 
         return FeedEntry(**entry["entry"])
 
     def feed_entry_exists(self, id: str):
-        table = self.db.table("entries")
+        return self._doc_id("entries", id) is not None
 
-        query = Query().id.matches(id)
-        if table.search(query):
-            return True
-        else:
-            return False
+    def feed_entries_exist(self, ids: Iterable[str]) -> Set[str]:
+        self._check_indexes()
+
+        return {i for i in ids if i in self._ids["entries"]}
 
     def retrieve_entry_content(self, entry: FeedEntry) -> EntryContent:
-        table = self.db.table("entry_contents")
-        query = Query().id.matches(entry.id)
-        existing = table.search(query)[0]
+        existing = self._get("entry_contents", entry.id)
+
+        if not existing:
+            raise IndexError(f"No entry content with id {entry.id}")
 
         return EntryContent(**existing["entry_contents"])
 
     def entry_content_exists(self, entry: FeedEntry) -> bool:
-        table = self.db.table("entry_contents")
-        query = Query().id.matches(entry.id)
-        existing = table.search(query)
-
-        return bool(existing)
+        return self._doc_id("entry_contents", entry.id) is not None
 
     async def upsert_entry_content(self, content: EntryContent):
-        table = self.db.table("entry_contents")
-        query = Query().id.matches(content.id)
-
-        table.upsert(
-            {"id": content.id, "entry_contents": content.dict()},
-            cond=query,
-        )
+        with self.batch():
+            self._upsert(
+                "entry_contents",
+                {"id": content.id, "entry_contents": content.dict()},
+            )
+            self._log_change("content", content.id)
 
     def upsert_handler(
         self,
         handler: Type[LLMHandler | NotificationHandler | ContentRetrievalHandler],
     ) -> None:
-        table = self.db.table("handler")
-
         row = {
             "id": handler.id,
             "handler": handler.dict(),
         }
 
-        query = Query().id.matches(handler.id)
-        table.upsert(row, cond=query)
+        with self.batch():
+            self._upsert("handler", row)
+            self._log_change("handler", handler.id)
 
     def _make_handler_obj(self, id: str, config: Mapping):
         return self.handler_map[id](**config)
@@ -188,10 +422,11 @@ class TinyDBStorageHandler(StorageHandler):
     def get_handler(
         self, id: str
     ) -> Type[LLMHandler | NotificationHandler | ContentRetrievalHandler]:
-        table = self.db.table("handler")
         logger.info(f"requested handler {id}")
-        query = Query().id.matches(id)
-        handler = table.search(query)[0]
+        handler = self._get("handler", id)
+
+        if not handler:
+            raise IndexError(f"No handler with id {id}")
 
         handler_obj = self._make_handler_obj(
             id=handler["id"], config=handler["handler"]
@@ -200,45 +435,69 @@ class TinyDBStorageHandler(StorageHandler):
         return handler_obj
 
     def get_settings(self) -> GlobalSettings:
-        table = self.db.table("settings")
         GlobalSettings.update_forward_refs()
+        settings = self._get("settings", "settings")
 
-        try:
-            settings = table.all()[0]
+        if settings:
             return GlobalSettings(db=self, **settings["settings"])
-        except IndexError:
+        else:
             return GlobalSettings(db=self)
 
     def upsert_settings(self, settings: GlobalSettings) -> None:
-        table = self.db.table("settings")
-
         row = {
             "id": "settings",
             "settings": settings.dict(exclude={"db"}),
         }
 
-        query = Query().id.matches("settings")
-        table.upsert(row, cond=query)
+        with self.batch():
+            self._upsert("settings", row)
+            self._log_change("settings", "settings")
 
-        self.upsert_handler(settings.notification_handler)
-        self.upsert_handler(settings.llm_handler)
-        self.upsert_handler(settings.content_retrieval_handler)
+            self.upsert_handler(settings.notification_handler)
+            self.upsert_handler(settings.llm_handler)
+            self.upsert_handler(settings.content_retrieval_handler)
 
     def delete_feed(self, feed: Feed) -> None:
-        feeds = self.db.table("feeds")
-        query = Query().id.matches(feed.id)
-        feeds.remove(query)
-
-        feed_start = self.db.table("feed_start")
-        feed_start.remove(query)
+        with self.batch():
+            for table in ["feeds", "feed_start", "poll"]:
+                self._remove(table, feed.id)
 
-        poll = self.db.table("poll")
-        poll.remove(query)
+            self._log_change("feed", feed.id, deleted=True)
 
     def delete_feed_entry(self, feed_entry: FeedEntry) -> None:
-        entry_contents = self.db.table("entry_contents")
-        query = Query().id.matches(feed_entry.id)
-        entry_contents.remove(query)
+        with self.batch():
+            self._remove("entry_contents", feed_entry.id)
+            self._remove("entries", feed_entry.id)
+            self._log_change("entry", feed_entry.id, deleted=True)
+
+        self._unindex_entry(feed_entry.id)
+
+    def upsert_outbox_item(self, item: OutboxItem) -> None:
+        self._upsert("outbox", {"id": item.id, "item": item.dict()})
+
+    def get_outbox_items(self, before: float) -> List[OutboxItem]:
+        table = self.db.table("outbox")
+
+        items = [OutboxItem(**i["item"]) for i in table.all()]
+
+        return sorted(
+            (i for i in items if i.not_before <= before), key=lambda i: i.not_before
+        )
+
+    def delete_outbox_item(self, item: OutboxItem) -> None:
+        self._remove("outbox", item.id)
+
+    def get_changes(self, after: int = 0) -> List[Change]:
+        self._check_indexes()
+
+        start = bisect_right(self._changes, (int(after), float("inf")))
+        doc_ids = [doc_id for _, doc_id in self._changes[start:]]
+
+        changes = self.db.table("changes").get(doc_ids=doc_ids) if doc_ids else []
+
+        return sorted((Change(**i["change"]) for i in changes), key=lambda i: i.seq)
+
+    def get_change_seq(self) -> int:
+        self._check_indexes()
 
-        entries = self.db.table("entries")
-        entries.remove(query)
+        return self._changes[-1][0] if self._changes else 0
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from hashlib import sha256
+from json import dumps
+from logging import getLogger
+from pathlib import Path
+from struct import pack
+from threading import Lock
+from typing import Optional
+
+from lmdb import Environment, Transaction
+
+from app.constants import DATA_DIR, SUMMARY_CACHE_SIZE
+
+logger = getLogger("uvicorn.error")
+
+
+class SummaryCache:
+    """
+    A persistent cache of llm summaries in its own LMDB environment in
+    DATA_DIR, keyed by everything that goes into a summary. The least
+    recently used summaries are evicted once there are more than `maxsize`.
+    """
+
+    def __init__(self, path: Path = None, maxsize: int = SUMMARY_CACHE_SIZE) -> None:
+        self.path = path
+        self.maxsize = maxsize
+
+        self._env: Environment = None
+        self._dbs = {}
+        self._lock = Lock()
+
+    @property
+    def env(self) -> Environment:
+        # opened on first use, so that DATA_DIR can be set up beforehand
+        with self._lock:
+            if not self._env:
+                path = self.path or Path(DATA_DIR, "summaries")
+                path.mkdir(parents=True, exist_ok=True)
+
+                # losing the last few writes of a cache to a crash is harmless
+                self._env = Environment(
+                    path=bytes(path.resolve()),
+                    map_size=1024 * 1024 * 1024,
+                    create=True,
+                    max_dbs=4,
+                    sync=False,
+                )
+                self._dbs = {
+                    i: self._env.open_db(i.encode())
+                    for i in ["summaries", "used", "recency", "meta"]
+                }
+
+        return self._env
+
+    @staticmethod
+    def key(handler_id: str, model: str, system: str, prompt: str) -> bytes:
+        return (
+            sha256(dumps([handler_id, model, system, prompt]).encode())
+            .hexdigest()
+            .encode()
+        )
+
+    def _touch(self, txn: Transaction, key: bytes) -> None:
+        # every use moves a summary to the end of the recency index, which is
+        # keyed by a counter that goes up with each use
+        previous = txn.get(key, db=self._dbs["used"])
+        if previous:
+            txn.delete(previous, db=self._dbs["recency"])
+
+        tick = int(txn.get(b"tick", b"0", db=self._dbs["meta"])) + 1
+        txn.put(b"tick", str(tick).encode(), db=self._dbs["meta"])
+
+        txn.put(pack(">Q", tick), key, db=self._dbs["recency"])
+        txn.put(key, pack(">Q", tick), db=self._dbs["used"])
+
+    def get(self, key: bytes) -> Optional[str]:
+        with self.env.begin(write=True) as txn:
+            value = txn.get(key, db=self._dbs["summaries"])
+
+            if value is not None:
+                self._touch(txn, key)
+                return bytes(value).decode()
+
+    def set(self, key: bytes, summary: str) -> None:
+        with self.env.begin(write=True) as txn:
+            txn.put(key, summary.encode(), db=self._dbs["summaries"])
+            self._touch(txn, key)
+
+            excess = txn.stat(self._dbs["summaries"])["entries"] - self.maxsize
+            if excess > 0:
+                self._evict(txn, excess)
+
+    def _evict(self, txn: Transaction, count: int) -> None:
+        cur = txn.cursor(db=self._dbs["recency"])
+
+        while count > 0 and cur.first():
+            key = bytes(cur.value())
+            cur.delete()
+            txn.delete(key, db=self._dbs["used"])
+            txn.delete(key, db=self._dbs["summaries"])
+            count -= 1
+
+        logger.debug("Evicted least recently used summaries")
+
+    def __len__(self) -> int:
+        with self.env.begin() as txn:
+            return txn.stat(self._dbs["summaries"])["entries"]
+
+
+summary_cache = SummaryCache()
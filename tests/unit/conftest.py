@@ -0,0 +1,68 @@
+import pytest
+from feedparser import FeedParserDict
+
+from app.impls import load_storage_config, storage_handlers
+from app.models import Feed
+from tests.unit.helpers import dummy_items
+
+# modules that read DATA_DIR when a storage handler is created
+DATA_DIR_MODULES = [
+    "app.backup",
+    "app.storage.tinydb",
+    "app.storage.lmdb",
+    "app.storage.hybrid",
+    "app.storage.packfile",
+]
+
+
+@pytest.fixture
+def use_data_dir(monkeypatch):
+    def use(path):
+        path.mkdir(exist_ok=True)
+
+        for module in DATA_DIR_MODULES:
+            monkeypatch.setattr(f"{module}.DATA_DIR", path)
+
+    return use
+
+
+@pytest.fixture(params=storage_handlers.keys())
+def handler_type(request, monkeypatch):
+    monkeypatch.setenv("PRECIS_STORAGE_HANDLER", request.param)
+
+    return storage_handlers[request.param]
+
+
+@pytest.fixture
+def db(handler_type, tmp_path, use_data_dir):
+    use_data_dir(tmp_path / "source")
+
+    yield load_storage_config()
+
+
+@pytest.fixture
+def restore_db(db, tmp_path, use_data_dir):
+    use_data_dir(tmp_path / "restored")
+
+    yield load_storage_config()
+
+
+@pytest.fixture
+def tinydb(tmp_path, monkeypatch, use_data_dir):
+    monkeypatch.setenv("PRECIS_STORAGE_HANDLER", "tinydb")
+    use_data_dir(tmp_path / "source")
+
+    yield load_storage_config()
+
+
+@pytest.fixture
+def fetched_items(mocker):
+    """
+    Have every feed fetch answer with three new entries
+    """
+    items = dummy_items("https://feed.local", 3)
+    mocker.patch.object(
+        Feed, "fetch", return_value=FeedParserDict(status=200, entries=items)
+    )
+
+    return items
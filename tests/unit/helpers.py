@@ -0,0 +1,43 @@
+from feedparser import FeedParserDict
+
+from app.models import Feed, FeedEntry
+
+
+def dummy_feeds():
+    feed_1 = Feed(name="Hello World", url="https://not-a-url.local")
+    feed_2 = Feed(name="FizzBuzz", url="https://also-not-a-url.local")
+    feed_3 = Feed(name="LinkedList", url="https://linked-list.local")
+
+    return feed_1, feed_2, feed_3
+
+
+def dummy_entries(id: str, count: int, url: str, offset: int = 0):
+    _time = 1732670009 - (offset * 60)
+    return [
+        FeedEntry(
+            feed_id=id,
+            title="Hello World",
+            url=f"{url}/{i}",
+            published_at=_time + i,
+            updated_at=_time + i,
+            authors=["Albert Einstein", "J Robert Oppenheimer"],
+        )
+        for i in range(count)
+    ]
+
+
+def dummy_items(url: str, count: int):
+    """
+    Entries as feedparser hands them over, for polling a feed
+    """
+    published = (2024, 11, 27, 0, 0, 0, 2, 332, 0)
+    return [
+        FeedParserDict(
+            title=f"Entry {i}",
+            link=f"{url}/{i}",
+            summary="",
+            published_parsed=published,
+            updated_parsed=published,
+        )
+        for i in range(count)
+    ]
@@ -12,30 +12,8 @@ from app.db import GlobalSettings
 from app.errors import InvalidFeedException
 from app.impls import load_storage_config
 from app.llm.dummy import DummyLLMHandler
-from app.models import Feed, FeedEntry
-
-
-def dummy_feeds():
-    feed_1 = Feed(name="Hello World", url="https://not-a-url.local")
-    feed_2 = Feed(name="FizzBuzz", url="https://also-not-a-url.local")
-    feed_3 = Feed(name="LinkedList", url="https://linked-list.local")
-
-    return feed_1, feed_2, feed_3
-
-
-def dummy_entries(id: str, count: int, url: str, offset: int = 0):
-    _time = 1732670009 - (offset * 60)
-    return [
-        FeedEntry(
-            feed_id=id,
-            title="Hello World",
-            url=f"{url}/{i}",
-            published_at=_time,
-            updated_at=_time,
-            authors=["Albert Einstein", "J Robert Oppenheimer"],
-        )
-        for i in range(count)
-    ]
+from app.models import Feed
+from tests.unit.helpers import dummy_entries, dummy_feeds
 
 
 @pytest.fixture
@@ -259,6 +237,23 @@ async def test_update_handler(setup):
     assert handler_after.temerity == 100
 
 
+def test_list_entries_resolves_feeds_once(setup, mocker):
+    db, backend = setup
+    feed_1, feed_2, _ = dummy_feeds()
+
+    for feed in [feed_1, feed_2]:
+        db.upsert_feed(feed)
+        for entry in dummy_entries(id=feed.id, count=5, url=feed.url):
+            db.upsert_feed_entry(feed=feed, entry=entry)
+
+    get_feed = mocker.spy(db, "get_feed")
+    entries = list(backend.list_entries())
+
+    assert len(entries) == 10
+    assert {i["feed_name"] for i in entries} == {feed_1.name, feed_2.name}
+    assert get_feed.call_count == 0
+
+
 @pytest.mark.skip
 @pytest.mark.asyncio
 async def test_delete_feed(setup):
@@ -0,0 +1,298 @@
+import gzip
+import json
+from io import BytesIO
+
+import pytest
+
+from app.backup import encode_records, parse_since, read_records
+from app.models import EntryContent, Feed, FeedEntry
+from app.rss import PrecisRSS
+from tests.unit.helpers import dummy_entries, dummy_feeds
+
+
+async def populate(db):
+    feed, _, _ = dummy_feeds()
+    db.upsert_feed(feed)
+
+    entries = dummy_entries(feed.id, 3, feed.url)
+    for entry in entries:
+        db.upsert_feed_entry(feed=feed, entry=entry)
+
+    await db.upsert_entry_content(
+        EntryContent(url=entries[0].url, content="hello", summary="hi")
+    )
+
+    return feed, entries
+
+
+async def write_backup(rss: PrecisRSS, compression: str) -> BytesIO:
+    out = BytesIO()
+    async for chunk in encode_records(rss.backup(), compression):
+        out.write(chunk)
+
+    out.seek(0)
+    return out
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+async def test_backup_round_trip(db, restore_db, compression):
+    feed, entries = await populate(db)
+
+    backup = await write_backup(PrecisRSS(db), compression)
+    if compression == "gzip":
+        assert backup.getvalue()[:2] == b"\x1f\x8b"
+
+    await PrecisRSS(restore_db).restore(backup)
+
+    assert [i.id for i in restore_db.get_feeds()] == [feed.id]
+    assert {i["entry"].id for i in restore_db.get_entries(feed)} == {
+        i.id for i in entries
+    }
+    assert restore_db.retrieve_entry_content(entries[0]).summary == "hi"
+    assert not restore_db.entry_content_exists(entries[1])
+
+
+@pytest.mark.asyncio
+async def test_backup_round_trip_with_handlers(db, restore_db):
+    from app.llm.ollama import OllamaLLMHandler
+
+    await populate(db)
+    handler = OllamaLLMHandler(
+        base_url="http://ollama.local:11434", model="llama3", options={}
+    )
+    db.upsert_handler(handler)
+
+    settings = db.get_settings()
+    settings.llm_handler_key = handler.id
+    db.upsert_settings(settings)
+
+    backup = await write_backup(PrecisRSS(db), "none")
+    await PrecisRSS(restore_db).restore(backup)
+
+    restored = restore_db.get_settings()
+    assert restored.llm_handler_key == "ollama"
+    assert restored.llm_handler == handler
+
+
+@pytest.mark.asyncio
+async def test_backup_records(db, mocker):
+    await populate(db)
+    get_entry_content = mocker.spy(db, "get_entry_content")
+
+    records = [i async for i in PrecisRSS(db).backup()]
+    kinds = [i["type"] for i in records]
+
+    assert kinds[0] == "header"
+    assert kinds[-1] == "end"
+    assert records[-1]["count"] == 3
+    assert kinds.count("entry") == 3
+    # only stored content is written out, nothing is fetched for the backup
+    assert kinds.count("content") == 1
+    get_entry_content.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_restore_legacy_backup(db, restore_db):
+    feed, entries = await populate(db)
+
+    legacy = {
+        "settings": {"llm_handler_key": "ollama"},
+        "handlers": {
+            "ollama": {
+                "base_url": "http://ollama.local:11434",
+                "model": "llama3",
+                "options": {},
+            }
+        },
+        "feeds": [feed.dict()],
+        "feed_entries": {feed.id: [i.dict() for i in entries]},
+        "entry_content": {
+            feed.id: {
+                entries[0].id: EntryContent(url=entries[0].url, content="x").dict()
+            }
+        },
+        "poll_state": {},
+    }
+
+    backup = BytesIO(gzip.compress(json.dumps(legacy).encode()))
+    await PrecisRSS(restore_db).restore(backup)
+
+    assert len(restore_db.get_entries(feed)) == 3
+    assert restore_db.retrieve_entry_content(entries[0]).content == "x"
+    assert restore_db.get_settings().llm_handler.model == "llama3"
+
+
+def test_read_records_rejects_newer_versions():
+    backup = BytesIO(b'{"type": "header", "version": 99}\n')
+
+    with pytest.raises(ValueError):
+        list(read_records(backup))
+
+
+@pytest.mark.asyncio
+async def test_restore_in_batches(db, restore_db, monkeypatch):
+    monkeypatch.setattr("app.rss.RESTORE_BATCH_SIZE", 2)
+    await populate(db)
+    backup = await write_backup(PrecisRSS(db), "none")
+
+    progress = []
+
+    restored = await PrecisRSS(restore_db).restore(backup, progress=progress.append)
+
+    # settings, feed, 3 entries, 1 content and the end marker
+    assert restored == 7
+    assert progress == [2, 4, 6, 7]
+
+
+@pytest.mark.asyncio
+async def test_restore_resumes(db, restore_db, tmp_path, mocker, monkeypatch):
+    monkeypatch.setattr("app.rss.RESTORE_BATCH_SIZE", 2)
+    feed, entries = await populate(db)
+    backup = await write_backup(PrecisRSS(db), "none")
+
+    rss = PrecisRSS(restore_db)
+    upsert = mocker.patch.object(
+        restore_db,
+        "upsert_feed_entry",
+        side_effect=[None, RuntimeError("boom")],
+    )
+
+    with pytest.raises(RuntimeError):
+        await rss.restore(backup)
+
+    assert list(tmp_path.glob("restored/restore_*.json"))
+
+    # the first batch (settings and feed) is not written again
+    upsert_feed = mocker.spy(restore_db, "upsert_feed")
+    upsert.side_effect = None
+    backup.seek(0)
+
+    assert await rss.restore(backup) == 7
+    upsert_feed.assert_not_called()
+    assert upsert.call_count == 2 + 3
+    assert not list(tmp_path.glob("restored/restore_*.json"))
+
+
+@pytest.mark.asyncio
+async def test_restore_queues_missing_content(db, restore_db, tmp_path):
+    from app.queue import PRIORITY_LOW, JobQueue
+
+    _, entries = await populate(db)
+    backup = await write_backup(PrecisRSS(db), "none")
+
+    queue = JobQueue(path=tmp_path / "queue")
+    await PrecisRSS(restore_db, queue=queue).restore(backup)
+
+    # only the entries whose content was not in the backup are fetched
+    jobs = [queue.claim() for _ in range(2)]
+    assert {i.key for i in jobs} == {i.id for i in entries[1:]}
+    assert all(i.priority == PRIORITY_LOW for i in jobs)
+    assert queue.claim() is None
+
+
+@pytest.mark.asyncio
+async def test_restore_reports_invalid_records(restore_db):
+    backup = BytesIO(
+        b'{"type": "header", "version": 1, "id": null}\n'
+        b'{"type": "feed", "feed": {"name": "no url"}}\n'
+    )
+
+    with pytest.raises(ValueError, match="feed record at position 1"):
+        await PrecisRSS(restore_db).restore(backup)
+
+
+@pytest.mark.asyncio
+async def test_incremental_backup_chain(db, restore_db):
+    feed, entries = await populate(db)
+    rss = PrecisRSS(db)
+
+    full = await write_backup(rss, "gzip")
+    since = next(read_records(full))["seq"]
+    full.seek(0)
+
+    added = Feed(name="Added", url="https://added.local")
+    db.upsert_feed(added)
+    entry = FeedEntry(
+        feed_id=added.id,
+        title="New",
+        url=f"{added.url}/new",
+        published_at=1732680009,
+        updated_at=1732680009,
+    )
+    db.upsert_feed_entry(feed=added, entry=entry)
+    db.delete_feed_entry(entries[2])
+
+    records = [i async for i in rss.backup(since=since)]
+    assert records[0]["since"] == since
+    assert [i["type"] for i in records[1:]] == ["feed", "entry", "delete", "end"]
+
+    incremental = BytesIO(b"".join(json.dumps(i).encode() + b"\n" for i in records))
+    await PrecisRSS(restore_db).restore(full, incremental)
+
+    assert {i.id for i in restore_db.get_feeds()} == {feed.id, added.id}
+    assert restore_db.feed_entry_exists(entry.id)
+    assert not restore_db.feed_entry_exists(entries[2].id)
+    assert restore_db.retrieve_entry_content(entries[0]).summary == "hi"
+
+
+@pytest.mark.asyncio
+async def test_incremental_backup_of_record_changed_twice(db, restore_db):
+    feed, _ = await populate(db)
+    rss = PrecisRSS(db)
+
+    full = await write_backup(rss, "none")
+    since = next(read_records(full))["seq"]
+    full.seek(0)
+
+    # only the second change to the feed survives in the change log
+    feed.category = "first"
+    db.upsert_feed(feed)
+    feed.category = "second"
+    db.upsert_feed(feed)
+
+    records = [i async for i in rss.backup(since=since)]
+    assert records[0]["since"] == since
+
+    incremental = BytesIO(b"".join(json.dumps(i).encode() + b"\n" for i in records))
+    await PrecisRSS(restore_db).restore(full, incremental)
+
+    assert restore_db.get_feed(feed.id).category == "second"
+
+
+@pytest.mark.asyncio
+async def test_incremental_backup_since_time(db):
+    await populate(db)
+    rss = PrecisRSS(db)
+
+    records = [i async for i in rss.backup(since_ts=2**40)]
+    assert [i["type"] for i in records] == ["header", "end"]
+    assert records[0]["since"] == db.get_change_seq()
+
+    records = [i async for i in rss.backup(since_ts=0)]
+    assert [i["type"] for i in records].count("entry") == 3
+    assert records[0]["since"] == 0
+
+
+@pytest.mark.asyncio
+async def test_restore_rejects_gaps(restore_db):
+    def backup(header):
+        return BytesIO(json.dumps({"type": "header", "version": 1, **header}).encode())
+
+    with pytest.raises(ValueError, match="starts after change 5"):
+        await PrecisRSS(restore_db).restore(
+            backup({"id": "a", "seq": 3}), backup({"id": "b", "since": 5, "seq": 9})
+        )
+
+    with pytest.raises(ValueError, match="Only incremental"):
+        await PrecisRSS(restore_db).restore(
+            backup({"id": "a", "seq": 3}), backup({"id": "b", "seq": 9})
+        )
+
+
+def test_parse_since():
+    assert parse_since("42") == (42, None)
+    assert parse_since("2024-11-27T00:00:00+00:00") == (None, 1732665600)
+
+    with pytest.raises(ValueError):
+        parse_since("yesterday")
@@ -0,0 +1,50 @@
+from time import sleep
+
+from app.cache import TTLCache
+
+
+def test_ttl_cache():
+    cache = TTLCache(ttl=60)
+
+    assert cache.get("missing") is None
+    assert cache.get("missing", "default") == "default"
+
+    cache.set("hello", "world")
+    assert cache.get("hello") == "world"
+
+    cache.pop("hello")
+    assert cache.get("hello") is None
+
+
+def test_ttl_cache_expires():
+    cache = TTLCache(ttl=0.01)
+
+    cache.set("hello", "world")
+    sleep(0.02)
+
+    assert cache.get("hello") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_set_drops_expired():
+    cache = TTLCache(ttl=0.01)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    sleep(0.02)
+    cache.set("c", 3)
+
+    assert len(cache) == 1
+
+
+def test_ttl_cache_maxsize():
+    cache = TTLCache(ttl=60, maxsize=2)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
@@ -0,0 +1,91 @@
+import asyncio
+from time import sleep
+
+import pytest
+
+from app.extraction import ExtractionPool
+from app.handlers import ContentRetrievalHandler
+
+
+def double(x):
+    return x * 2
+
+
+def nap(seconds):
+    sleep(seconds)
+
+
+def slow_double(x):
+    sleep(1.5)
+    return x * 2
+
+
+def divide(x, y):
+    return x / y
+
+
+@pytest.mark.asyncio
+async def test_extraction_pool():
+    pool = ExtractionPool(workers=2, timeout=10)
+
+    try:
+        assert await pool.run(double, 21) == 42
+    finally:
+        pool.close()
+
+
+@pytest.mark.asyncio
+async def test_extraction_pool_timeout():
+    pool = ExtractionPool(workers=2, timeout=2)
+
+    try:
+        # start-up is not covered by the timeout
+        await pool.start()
+        workers = set(pool._workers)
+
+        async def late():
+            await asyncio.sleep(1)
+            return await pool.run(slow_double, 21)
+
+        stuck, other = await asyncio.gather(
+            pool.run(nap, 30), late(), return_exceptions=True
+        )
+
+        # only the stuck worker is killed, the job running beside it finishes
+        assert isinstance(stuck, TimeoutError)
+        assert other == 42
+
+        killed = workers - pool._workers
+        assert len(killed) == 1
+        assert not killed.pop().process.is_alive()
+
+        assert await pool.run(double, 21) == 42
+        assert await pool.run(double, 21) == 42
+    finally:
+        pool.close()
+
+
+@pytest.mark.asyncio
+async def test_extraction_pool_errors():
+    pool = ExtractionPool(workers=1, timeout=10)
+
+    try:
+        with pytest.raises(ZeroDivisionError):
+            await pool.run(divide, 1, 0)
+
+        # an error in the job leaves its worker in service
+        workers = set(pool._workers)
+        assert await pool.run(double, 21) == 42
+        assert pool._workers == workers
+    finally:
+        pool.close()
+
+
+@pytest.mark.asyncio
+async def test_extract_main_content_limits(mocker):
+    run = mocker.patch("app.handlers.extraction_pool.run")
+    mocker.patch("app.handlers.EXTRACT_MAX_SIZE", 10)
+
+    assert await ContentRetrievalHandler.extract_main_content(None) is None
+    assert await ContentRetrievalHandler.extract_main_content("x" * 11) is None
+    run.assert_not_called()
@@ -1,13 +1,16 @@
+from asyncio import gather, sleep
+
 import pytest
 
 from app.handlers import ContentRetrievalHandler, LLMHandler
+from app.models import Feed, FeedEntry
 
 
 def test_llm_handler():
     class TestLLMHandler(LLMHandler):
         id = "test_llm_handler"
 
-        def summarize(self, feed, entry, mk):
+        async def summarize(self, feed, entry, mk):
             return "hello world"
 
     handler = TestLLMHandler()
@@ -30,3 +33,94 @@ def test_content_retrieval_handler_get_main_content():
     fn = ContentRetrievalHandler.get_main_content
 
     assert fn("hello world")
+
+
+@pytest.mark.asyncio
+async def test_llm_handler_in_flight():
+    running = []
+    peak = []
+
+    async def call():
+        async with LLMHandler.in_flight("test_in_flight", 2):
+            running.append(1)
+            peak.append(len(running))
+            await sleep(0.01)
+            running.pop()
+
+    await gather(*[call() for _ in range(6)])
+
+    assert max(peak) == 2
+    assert LLMHandler.in_flight("test_in_flight", 2) is LLMHandler.in_flight(
+        "test_in_flight", 2
+    )
+
+
+@pytest.mark.asyncio
+async def test_content_retrieval_handler_awaits_summarizer(mocker):
+    class TestContentRetrievalHandler(ContentRetrievalHandler):
+        id = "test_content_retrieval_handler"
+
+        async def get_html(self, url, use_script=False):
+            return "<p>hello world</p>"
+
+    async def summarizer(feed, entry, mk):
+        return f"summary of {mk}"
+
+    mocker.patch.object(
+        ContentRetrievalHandler, "extract_main_content", return_value="hello world"
+    )
+    feed = Feed(name="Feed", url="https://feed.local/rss")
+    entry = FeedEntry(
+        feed_id=feed.id,
+        title="Entry",
+        url="https://feed.local/1",
+        published_at=1732670009,
+        updated_at=1732670009,
+    )
+
+    content = await TestContentRetrievalHandler().get_content(
+        entry=entry, feed=feed, summarizer=summarizer
+    )
+
+    assert content.content == "hello world"
+    assert "summary of hello world" in content.summary
+
+
+@pytest.mark.asyncio
+async def test_notification_handler_send_digest(mocker, monkeypatch):
+    from app.handlers import NotificationHandler
+    from app.notification.slack import SlackNotificationHandler
+
+    monkeypatch.setenv("RSS_BASE_URL", "https://precis.local")
+    feed = Feed(name="Feed", url="https://feed.local/rss")
+    entries = [
+        (
+            feed,
+            FeedEntry(
+                feed_id=feed.id,
+                title=f"Entry {i}",
+                url=f"https://feed.local/{i}",
+                published_at=1732670009,
+                updated_at=1732670009,
+            ),
+        )
+        for i in range(60)
+    ]
+
+    # handlers that can't batch send one message per entry
+    send = mocker.patch.object(NotificationHandler, "send_notification")
+    await NotificationHandler().send_digest(destination=None, entries=entries[:3])
+    assert send.await_count == 3
+
+    client = mocker.MagicMock(chat_postMessage=mocker.AsyncMock())
+    mocker.patch("app.notification.slack._client", return_value=client)
+    handler = SlackNotificationHandler(
+        token="token", channel_name="default", routing={"news": "news-channel"}
+    )
+
+    await handler.send_digest(destination="news", entries=entries)
+
+    kwargs = client.chat_postMessage.await_args.kwargs
+    assert kwargs["channel"] == "news-channel"
+    assert len(kwargs["blocks"]) == 50
+    assert kwargs["blocks"][-1]["elements"][0]["text"] == "and 12 more"
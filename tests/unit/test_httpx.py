@@ -0,0 +1,50 @@
+import pytest
+from httpx import AsyncClient, HTTPStatusError, MockTransport, Response
+
+from app.content.httpx import HttpxContentRetriever, http_client
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    def handler(request):
+        if request.url.path == "/large":
+            return Response(200, content=b"x" * 2048)
+        if request.url.path == "/missing":
+            return Response(404)
+        if request.url.path == "/down":
+            return Response(503)
+
+        return Response(
+            200,
+            content="<p>héllo</p>".encode(),
+            headers={"content-type": "text/html; charset=utf-8"},
+        )
+
+    monkeypatch.setattr(
+        http_client, "_client", AsyncClient(transport=MockTransport(handler))
+    )
+    monkeypatch.setattr("app.content.httpx.HTTP_MAX_BODY_SIZE", 1024)
+
+
+@pytest.mark.asyncio
+async def test_get_html(transport):
+    retriever = HttpxContentRetriever()
+
+    assert await retriever.get_html("https://site.local/page") == "<p>héllo</p>"
+    assert await retriever.get_html("https://site.local/large") is None
+    assert await retriever.get_html("https://site.local/missing") is None
+
+    # the server may be back later, so the error is left to the caller
+    with pytest.raises(HTTPStatusError):
+        await retriever.get_html("https://site.local/down")
+
+
+@pytest.mark.asyncio
+async def test_client_is_shared():
+    client = http_client.client
+
+    assert http_client.client is client
+
+    await http_client.close()
+    assert http_client.client is not client
+    await http_client.close()
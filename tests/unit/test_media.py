@@ -0,0 +1,71 @@
+from pickle import dump
+
+import pytest
+
+from app.models import EntryContent
+from app.storage.media import MediaStore
+
+
+def make_contents(count: int):
+    return [
+        EntryContent(url=f"https://hello-world.local/{i}", content=f"Entry {i}")
+        for i in range(count)
+    ]
+
+
+def test_round_trip(tmp_path):
+    store = MediaStore(tmp_path)
+    content = make_contents(1)[0]
+
+    assert not store.exists(content.id)
+    assert store.read(content.id) is None
+
+    store.write(content)
+
+    path = tmp_path / content.id[:2] / content.id[2:4] / f"{content.id}.json.zst"
+    assert path.read_bytes()[:4] == b"\x28\xb5\x2f\xfd"
+    assert store.exists(content.id)
+    assert store.read(content.id) == content
+
+    store.delete(content.id)
+    assert not store.exists(content.id)
+
+
+def test_write_many_shares_fsyncs(tmp_path, mocker):
+    store = MediaStore(tmp_path)
+    contents = make_contents(20)
+    fsync = mocker.spy(MediaStore, "_fsync")
+
+    store.write_many(contents)
+
+    shards = {(i.id[:2], i.id[2:4]) for i in contents}
+    assert fsync.call_count == len(contents) + len(shards)
+    assert all(store.read(i.id) == i for i in contents)
+    assert not list(tmp_path.rglob("*.tmp"))
+
+
+def test_failed_write_leaves_nothing(tmp_path, mocker):
+    store = MediaStore(tmp_path)
+    contents = make_contents(3)
+    mocker.patch.object(MediaStore, "_fsync", side_effect=OSError("disk full"))
+
+    with pytest.raises(OSError):
+        store.write_many(contents)
+
+    assert not [i for i in tmp_path.rglob("*") if i.is_file()]
+
+
+def test_migrate_legacy_pickles(tmp_path):
+    store = MediaStore(tmp_path)
+    contents = make_contents(5)
+
+    for content in contents:
+        with open(tmp_path / f"{content.id}.pickle", "wb") as fp:
+            dump(content, fp)
+
+    # legacy files are still readable before they are migrated
+    assert store.read(contents[0].id) == contents[0]
+
+    assert store.migrate(batch_size=2) == 5
+    assert not list(tmp_path.glob("*.pickle"))
+    assert all(store.read(i.id) == i for i in contents)
@@ -1,6 +1,7 @@
 import pytest
+from feedparser import FeedParserDict
 
-from app.models import EntryContent, Feed, FeedEntry
+from app.models import EntryContent, Feed, FeedEntry, FeedValidators
 
 
 @pytest.mark.skip
@@ -54,3 +55,53 @@ def test_entry_content():
 
     assert content
     assert content.id == "8a5faf510cc4194205442a2734fd6f2f"
+
+
+def test_feed_validators():
+    validators = FeedValidators()
+
+    updated = validators.update(
+        {"status": 200, "etag": '"abc"', "modified": "Wed, 27 Nov 2024 01:13:29 GMT"}
+    )
+    assert updated.etag == '"abc"'
+    assert updated.modified == "Wed, 27 Nov 2024 01:13:29 GMT"
+    assert not updated.redirect_url
+
+    moved = updated.update({"status": 301, "href": "https://new.local/rss"})
+    assert moved.redirect_url == "https://new.local/rss"
+    assert moved.etag == '"abc"'
+
+    temporary = moved.update({"status": 302, "href": "https://elsewhere.local"})
+    assert temporary.redirect_url == "https://new.local/rss"
+
+    failed = moved.update({"bozo": True})
+    assert failed == moved
+
+
+def test_feed_fetch_is_cached(mocker):
+    parse = mocker.patch(
+        "app.models.parse",
+        return_value=FeedParserDict(status=200, entries=[{"title": "Hi"}]),
+    )
+    feed = Feed(name="Cached Website", url="https://cached.notatld")
+
+    assert feed.validate()
+    assert feed.validate()
+    feed.fetch(cached=True)
+    assert parse.call_count == 1
+
+    # only plain fetches that ask for it are shared
+    feed.fetch()
+    feed.fetch(FeedValidators(etag='"abc"'), cached=True)
+    assert parse.call_count == 3
+
+
+def test_failed_feed_fetch_is_not_cached(mocker):
+    parse = mocker.patch(
+        "app.models.parse", return_value=FeedParserDict(bozo=True, entries=[])
+    )
+    feed = Feed(name="Broken Website", url="https://broken.notatld")
+
+    assert not feed.validate()
+    assert not feed.validate()
+    assert parse.call_count == 2
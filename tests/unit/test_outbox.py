@@ -0,0 +1,120 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.errors import RateLimited
+from app.models import Feed, FeedEntry
+from app.outbox import NotificationOutbox
+
+
+def add_entries(db, outbox, destination, count):
+    feed = Feed(
+        name=f"Feed {destination}",
+        url=f"https://{destination}.local/rss",
+        notify_destination=destination,
+    )
+    db.upsert_feed(feed)
+
+    entries = [
+        FeedEntry(
+            feed_id=feed.id,
+            title=f"Entry {i}",
+            url=f"{feed.url}/{i}",
+            published_at=1732670009,
+            updated_at=1732670009,
+        )
+        for i in range(count)
+    ]
+
+    for entry in entries:
+        db.upsert_feed_entry(feed=feed, entry=entry)
+        outbox.add(feed=feed, entry=entry)
+
+    return entries
+
+
+def use_handler(db, mocker, send_notification, send_digest=None, digest=False):
+    handler = SimpleNamespace(
+        send_notification=send_notification, send_digest=send_digest
+    )
+    settings = SimpleNamespace(
+        notification_handler=handler, digest=digest, digest_window=15
+    )
+    mocker.patch.object(db, "get_settings", return_value=settings)
+
+
+@pytest.mark.asyncio
+async def test_deliver(db, mocker):
+    outbox = NotificationOutbox(db=db)
+    send = mocker.AsyncMock()
+    use_handler(db, mocker, send)
+
+    add_entries(db, outbox, "a", 3)
+    add_entries(db, outbox, "b", 2)
+
+    assert await outbox.deliver() == 5
+    assert send.await_count == 5
+    assert db.get_outbox_items(before=float("inf")) == []
+
+
+@pytest.mark.asyncio
+async def test_deliver_rate_limited(db, mocker):
+    outbox = NotificationOutbox(db=db, concurrency=1)
+
+    async def send(feed, entry):
+        if feed.notify_destination == "slow":
+            raise RateLimited(retry_after=60)
+
+    use_handler(db, mocker, send)
+    add_entries(db, outbox, "slow", 3)
+    add_entries(db, outbox, "fast", 2)
+
+    assert await outbox.deliver() == 2
+
+    # the whole destination waits, but only one attempt was spent on it
+    remaining = db.get_outbox_items(before=float("inf"))
+    assert len(remaining) == 3
+    assert all(i.destination == "slow" for i in remaining)
+    assert sum(i.attempts for i in remaining) == 1
+    assert await outbox.deliver() == 0
+
+
+@pytest.mark.asyncio
+async def test_deliver_gives_up(db, mocker):
+    mocker.patch("app.outbox.OUTBOX_MAX_ATTEMPTS", 2)
+    mocker.patch("app.outbox.OUTBOX_RETRY_BACKOFF", 0)
+    outbox = NotificationOutbox(db=db)
+    send = mocker.AsyncMock(side_effect=ValueError("boom"))
+    use_handler(db, mocker, send)
+
+    add_entries(db, outbox, "a", 1)
+
+    await outbox.deliver()
+    [item] = db.get_outbox_items(before=float("inf"))
+    assert item.attempts == 1
+    assert item.error == "boom"
+
+    await outbox.deliver()
+    assert db.get_outbox_items(before=float("inf")) == []
+
+
+@pytest.mark.asyncio
+async def test_deliver_digest(db, mocker):
+    outbox = NotificationOutbox(db=db)
+    send = mocker.AsyncMock()
+    send_digest = mocker.AsyncMock()
+    use_handler(db, mocker, send, send_digest, digest=True)
+
+    add_entries(db, outbox, "a", 3)
+    add_entries(db, outbox, "b", 2)
+
+    # nothing goes out until the window is up
+    assert await outbox.deliver() == 0
+
+    mocker.patch("app.outbox.time", return_value=10**10)
+    assert await outbox.deliver() == 5
+
+    send.assert_not_awaited()
+    assert send_digest.await_count == 2
+    sizes = {i.args[0]: len(i.args[1]) for i in send_digest.await_args_list}
+    assert sizes == {"a": 3, "b": 2}
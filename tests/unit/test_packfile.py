@@ -0,0 +1,115 @@
+import pytest
+
+from app.models import EntryContent, FeedEntry
+from app.storage.packfile import PackfileStorageHandler
+
+
+@pytest.fixture
+def packfile(tmp_path, use_data_dir):
+    use_data_dir(tmp_path)
+
+    db = PackfileStorageHandler()
+    yield db
+
+    db.segments.close()
+
+
+def make_entry(i: int):
+    return FeedEntry(
+        feed_id="feed",
+        title=f"Entry {i}",
+        url=f"https://hello-world.local/{i}",
+        published_at=1732670009,
+        updated_at=1732670009,
+    )
+
+
+def make_content(i: int, body: str = "hello"):
+    return EntryContent(url=f"https://hello-world.local/{i}", content=body * 10)
+
+
+@pytest.mark.asyncio
+async def test_segments_rotate(packfile):
+    packfile.segments.segment_size = 1024
+
+    for i in range(20):
+        await packfile.upsert_entry_content(make_content(i))
+
+    assert len(packfile.segments.numbers()) > 1
+    assert all(
+        packfile.retrieve_entry_content(make_entry(i)) == make_content(i)
+        for i in range(20)
+    )
+
+
+@pytest.mark.asyncio
+async def test_compact(packfile):
+    packfile.segments.segment_size = 1024
+
+    for i in range(20):
+        await packfile.upsert_entry_content(make_content(i))
+
+    first = packfile.segments.numbers()[0]
+
+    with packfile.db.begin() as txn:
+        in_first = [
+            i for i in range(20) if packfile._locate(txn, make_entry(i).id)[0] == first
+        ]
+
+    # overwrite half of what is in the first segment, and delete the rest
+    for i in in_first:
+        if i % 2:
+            packfile.delete_entry_content(make_entry(i))
+        else:
+            await packfile.upsert_entry_content(make_content(i, "again"))
+
+    packfile.segments.segment_size = 1024 * 1024
+    await packfile.upsert_entry_content(make_content(99))
+
+    # nothing in the first segment is live, so there is nothing to move
+    assert packfile.compact() == 0
+    assert first in packfile.segments.numbers()
+
+    # the compacted segment is only removed on the next pass
+    packfile.compact()
+    assert first not in packfile.segments.numbers()
+
+    for i in in_first:
+        entry = make_entry(i)
+        assert packfile.entry_content_exists(entry) == (not i % 2)
+        if not i % 2:
+            assert packfile.retrieve_entry_content(entry).content.startswith("again")
+
+
+@pytest.mark.asyncio
+async def test_compact_moves_live_records(packfile):
+    packfile.segments.segment_size = 1024
+
+    for i in range(20):
+        await packfile.upsert_entry_content(make_content(i))
+
+    first = packfile.segments.numbers()[0]
+    packfile.segments.segment_size = 1024 * 1024
+    await packfile.upsert_entry_content(make_content(99))
+
+    assert packfile.compact(ratio=1.1) > 0
+    assert all(
+        packfile.retrieve_entry_content(make_entry(i)) == make_content(i)
+        for i in range(20)
+    )
+
+    packfile.compact(ratio=0)
+    assert first not in packfile.segments.numbers()
+    assert all(
+        packfile.retrieve_entry_content(make_entry(i)) == make_content(i)
+        for i in range(20)
+    )
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_not_indexed(packfile):
+    with pytest.raises(RuntimeError), packfile.batch():
+        await packfile.upsert_entry_content(make_content(1))
+        raise RuntimeError("boom")
+
+    assert not packfile.entry_content_exists(make_entry(1))
@@ -0,0 +1,78 @@
+import pytest
+
+from app.content.playwright import BrowserPool
+
+
+@pytest.fixture
+def playwright(mocker):
+    def new_browser():
+        browser = mocker.MagicMock()
+        browser.is_connected.return_value = True
+        browser.close = mocker.AsyncMock()
+
+        context = mocker.MagicMock()
+        context.route = mocker.AsyncMock()
+        context.new_page = mocker.AsyncMock(
+            side_effect=lambda: mocker.MagicMock(
+                is_closed=mocker.MagicMock(return_value=False),
+                close=mocker.AsyncMock(),
+            )
+        )
+        browser.new_context = mocker.AsyncMock(return_value=context)
+
+        return browser
+
+    pw = mocker.MagicMock()
+    pw.chromium.launch = mocker.AsyncMock(side_effect=lambda: new_browser())
+    pw.stop = mocker.AsyncMock()
+
+    start = mocker.MagicMock()
+    start.start = mocker.AsyncMock(return_value=pw)
+    mocker.patch("app.content.playwright.async_playwright", return_value=start)
+
+    return pw
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_reuses_pages(playwright):
+    pool = BrowserPool(size=2, max_uses=10)
+
+    async with pool.page() as first:
+        pass
+    async with pool.page() as second:
+        pass
+    async with pool.page(use_script=True) as scripted:
+        pass
+
+    assert first is second
+    assert scripted is not first
+    assert playwright.chromium.launch.call_count == 1
+
+    await pool.close()
+    playwright.stop.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_recycles(playwright):
+    pool = BrowserPool(size=2, max_uses=2)
+
+    for _ in range(5):
+        async with pool.page():
+            pass
+
+    assert playwright.chromium.launch.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_drops_failed_pages(playwright):
+    pool = BrowserPool(size=2, max_uses=10)
+
+    with pytest.raises(ValueError):
+        async with pool.page() as failed:
+            raise ValueError("boom")
+
+    async with pool.page() as page:
+        pass
+
+    failed.close.assert_awaited_once()
+    assert page is not failed
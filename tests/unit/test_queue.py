@@ -0,0 +1,80 @@
+import pytest
+
+from app.models import Job
+from app.queue import PRIORITY_HIGH, PRIORITY_LOW, JobQueue, JobWorkers
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(path=tmp_path)
+
+
+def test_enqueue_and_claim_in_order(queue):
+    added = queue.enqueue(
+        Job(kind="test", key="1"),
+        Job(kind="test", key="2", priority=PRIORITY_LOW),
+        Job(kind="test", key="3", priority=PRIORITY_HIGH),
+        Job(kind="test", key="4"),
+    )
+
+    assert added == 4
+    assert [queue.claim().key for _ in range(4)] == ["3", "1", "4", "2"]
+    assert queue.claim() is None
+
+
+def test_enqueue_is_idempotent(queue):
+    assert queue.enqueue(Job(kind="test", key="1")) == 1
+    assert queue.enqueue(Job(kind="test", key="1")) == 0
+
+    job = queue.claim()
+    assert queue.enqueue(Job(kind="test", key="1")) == 0
+
+    queue.complete(job)
+    assert queue.enqueue(Job(kind="test", key="1")) == 1
+
+
+def test_fail_retries_then_gives_up(queue, mocker):
+    mocker.patch("app.queue.QUEUE_MAX_ATTEMPTS", 2)
+    queue.enqueue(Job(kind="test", key="1"))
+
+    queue.fail(queue.claim(), error="boom")
+
+    # the retry waits out its backoff
+    assert queue.claim() is None
+    assert queue.depth()["delayed"] == 1
+
+    mocker.patch("app.queue.time", return_value=10**10)
+    job = queue.claim()
+    assert job.attempts == 1
+    assert job.error == "boom"
+
+    queue.fail(job, error="boom")
+    assert queue.depth() == {"pending": 0, "delayed": 0, "running": 0, "dead": 1}
+
+
+def test_recover(queue):
+    queue.enqueue(Job(kind="test", key="1"))
+    queue.claim()
+
+    assert queue.depth()["running"] == 1
+    assert queue.recover() == 1
+    assert queue.claim().key == "1"
+
+
+@pytest.mark.asyncio
+async def test_workers_drain(queue):
+    seen = []
+
+    async def handle(job: Job):
+        if job.key == "bad":
+            raise ValueError("boom")
+        seen.append(job.key)
+
+    queue.enqueue(*[Job(kind="test", key=str(i)) for i in range(5)])
+    queue.enqueue(Job(kind="test", key="bad"), Job(kind="unknown", key="1"))
+
+    workers = JobWorkers(queue=queue, handlers={"test": handle}, count=2)
+
+    assert await workers.drain() == 7
+    assert sorted(seen) == ["0", "1", "2", "3", "4"]
+    assert queue.depth()["delayed"] == 2
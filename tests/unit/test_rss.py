@@ -0,0 +1,190 @@
+from asyncio import sleep
+from time import perf_counter
+
+import pytest
+from feedparser import FeedParserDict
+
+from app.models import Feed, make_id
+from app.queue import PRIORITY_HIGH, PRIORITY_NORMAL
+from app.rss import PrecisRSS
+
+
+class FakeDB:
+    def __init__(self, feeds):
+        self.feeds = feeds
+
+    def get_feeds(self):
+        return self.feeds
+
+    def feed_entries_exist(self, ids):
+        return {make_id("https://feed.local/1")} & set(ids)
+
+
+@pytest.mark.asyncio
+async def test_check_feeds_concurrently(mocker):
+    feeds = [
+        Feed(name=f"Feed {i}", url=f"https://feed-{i}.local/rss") for i in range(10)
+    ]
+    rss = PrecisRSS(db=FakeDB(feeds))
+
+    async def check_feed(feed, manual=False):
+        await sleep(0.2)
+        return 1
+
+    mocker.patch.object(rss, "_check_feed", side_effect=check_feed)
+
+    start = perf_counter()
+    results = await rss.check_feeds()
+    elapsed = perf_counter() - start
+
+    assert len(results) == 10
+    assert all(i.new_entries == 1 and not i.error for i in results)
+    assert elapsed < 1
+
+
+@pytest.mark.asyncio
+async def test_check_feeds_reports_errors(mocker):
+    feeds = [
+        Feed(name="Good", url="https://good.local/rss"),
+        Feed(name="Bad", url="https://bad.local/rss"),
+    ]
+    rss = PrecisRSS(db=FakeDB(feeds))
+
+    async def check_feed(feed, manual=False):
+        if feed.name == "Bad":
+            raise ValueError("boom")
+        return 2
+
+    mocker.patch.object(rss, "_check_feed", side_effect=check_feed)
+
+    results = {i.name: i for i in await rss.check_feeds()}
+
+    assert results["Good"].new_entries == 2
+    assert results["Bad"].error == "boom"
+    assert results["Bad"].new_entries == 0
+
+
+def test_filter_new_entries():
+    rss = PrecisRSS(db=FakeDB([]))
+    entries = [FeedParserDict(link=f"https://feed.local/{i}") for i in [0, 1, 2, 2, 1]]
+
+    new_entries = rss._filter_new_entries(entries)
+
+    assert [i.link for i in new_entries] == [
+        "https://feed.local/0",
+        "https://feed.local/2",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_check_feed_batches_writes(tinydb, fetched_items, mocker):
+    from tinydb.storages import JSONStorage
+
+    rss = PrecisRSS(db=tinydb)
+    feed = Feed(
+        name="Feed", url="https://feed.local/rss", notify=False, preview_only=True
+    )
+    tinydb.upsert_feed(feed)
+    write = mocker.spy(JSONStorage, "write")
+
+    assert await rss._check_feed(feed) == 3
+    assert write.call_count == 1
+    assert len(tinydb.get_entries(feed=feed)) == 3
+    assert tinydb.get_poll_state(feed)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "manual, priority", [(False, PRIORITY_NORMAL), (True, PRIORITY_HIGH)]
+)
+async def test_check_feed_queues_content(
+    tinydb, fetched_items, tmp_path, mocker, manual, priority
+):
+    from app.queue import JobQueue, JobWorkers
+
+    queue = JobQueue(path=tmp_path / "queue")
+    rss = PrecisRSS(db=tinydb, queue=queue)
+    feed = Feed(name="Feed", url="https://feed.local/rss", notify=False)
+    tinydb.upsert_feed(feed)
+    get_entry_content = mocker.patch.object(tinydb, "get_entry_content")
+
+    assert await rss._check_feed(feed, manual=manual) == 3
+    assert get_entry_content.call_count == 0
+    assert queue.depth()["pending"] == 3
+
+    job = queue.claim()
+    assert job.priority == priority
+    queue.release(job)
+
+    workers = JobWorkers(queue=queue, handlers=rss.job_handlers)
+    assert await workers.drain() == 3
+    assert get_entry_content.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_content_jobs_retry_failed_fetches(
+    tinydb, fetched_items, tmp_path, monkeypatch, mocker
+):
+    from httpx import AsyncClient, MockTransport, Response
+
+    from app.content.httpx import http_client
+    from app.queue import JobQueue, JobWorkers
+
+    monkeypatch.setattr("app.rss.QUEUE_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr("app.queue.QUEUE_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(
+        http_client,
+        "_client",
+        AsyncClient(transport=MockTransport(lambda request: Response(503))),
+    )
+
+    queue = JobQueue(path=tmp_path / "queue")
+    rss = PrecisRSS(db=tinydb, queue=queue)
+    workers = JobWorkers(queue=queue, handlers=rss.job_handlers)
+    feed = Feed(name="Feed", url="https://feed.local/rss", notify=False)
+    tinydb.upsert_feed(feed)
+
+    assert await rss._check_feed(feed) == 3
+    entries = [i["entry"] for i in tinydb.get_entries(feed=feed)]
+
+    # a failed fetch is retried later rather than stored as unretrievable
+    assert await workers.drain() == 3
+    assert queue.depth()["delayed"] == 3
+    assert not any(tinydb.entry_content_exists(i) for i in entries)
+
+    # and the last attempt gives up on the entry for good
+    mocker.patch("app.queue.time", return_value=10**10)
+    assert await workers.drain() == 3
+    assert queue.depth() == {"pending": 0, "delayed": 0, "running": 0, "dead": 0}
+    assert all(tinydb.retrieve_entry_content(i).unretrievable for i in entries)
+
+
+@pytest.mark.asyncio
+async def test_check_feed_fills_outbox(tinydb, fetched_items, mocker):
+    from app.outbox import NotificationOutbox
+
+    outbox = NotificationOutbox(db=tinydb)
+    rss = PrecisRSS(db=tinydb, outbox=outbox)
+    feed = Feed(name="Feed", url="https://feed.local/rss", preview_only=True)
+    tinydb.upsert_feed(feed)
+    send = mocker.patch(
+        "app.notification.null.NullNotificationHandler.send_notification"
+    )
+
+    assert await rss._check_feed(feed) == 3
+    send.assert_not_called()
+    assert len(tinydb.get_outbox_items(before=float("inf"))) == 3
+
+
+@pytest.mark.asyncio
+async def test_manual_refresh_skips_feed_cache(mocker):
+    feed = Feed(name="Feed", url="https://feed.local/rss")
+    db = mocker.Mock()
+    db.get_feed.return_value = feed
+
+    rss = PrecisRSS(db=db)
+    check_feed = mocker.patch.object(rss, "_check_feed", return_value=0)
+
+    await rss.check_feed_by_id(feed.id)
+
+    check_feed.assert_called_once_with(feed=feed, manual=True)
@@ -0,0 +1,392 @@
+import asyncio
+from contextvars import Context
+
+import pytest
+
+from tests.unit.helpers import dummy_entries, dummy_feeds
+
+
+def test_feed_entries_exist(db):
+    feed, _, _ = dummy_feeds()
+    db.upsert_feed(feed)
+
+    entries = dummy_entries(feed.id, 5, feed.url)
+    for entry in entries[:3]:
+        db.upsert_feed_entry(feed=feed, entry=entry)
+
+    ids = [i.id for i in entries]
+
+    assert db.feed_entries_exist(ids) == set(ids[:3])
+    assert db.feed_entries_exist([]) == set()
+    assert db.feed_entries_exist(["nope"]) == set()
+
+
+def test_snapshot(db):
+    feed_1, feed_2, _ = dummy_feeds()
+    db.upsert_feed(feed_1)
+
+    with db.snapshot():
+        assert [i.id for i in db.get_feeds()] == [feed_1.id]
+
+        # writes made inside the snapshot are visible to it
+        db.upsert_feed(feed_2)
+        assert {i.id for i in db.get_feeds()} == {feed_1.id, feed_2.id}
+
+        with db.snapshot():
+            assert db.get_feed(feed_2.id).name == "FizzBuzz"
+
+    assert len(db.get_feeds()) == 2
+
+
+def test_get_entries_after(db):
+    feed_1, feed_2, _ = dummy_feeds()
+
+    for feed in [feed_1, feed_2]:
+        db.upsert_feed(feed)
+        for entry in dummy_entries(feed.id, 10, feed.url):
+            db.upsert_feed_entry(feed=feed, entry=entry)
+            # upserting twice must not duplicate the entry
+            db.upsert_feed_entry(feed=feed, entry=entry)
+
+    assert len(db.get_entries(feed=feed_1)) == 10
+    assert len(db.get_entries()) == 20
+
+    recent = db.get_entries(feed=feed_1, after=1732670009 + 4)
+    assert len(recent) == 5
+    assert all(i["feed_id"] == feed_1.id for i in recent)
+
+    entry = dummy_entries(feed_1.id, 1, feed_1.url)[0]
+    db.delete_feed_entry(entry)
+    assert len(db.get_entries(feed=feed_1)) == 9
+    assert not db.feed_entry_exists(entry.id)
+
+
+def test_migrate_lmdb_feed_index(tmp_path, monkeypatch):
+    from app.storage.lmdb import LMDBStorageHandler, Named
+
+    monkeypatch.setattr("app.storage.lmdb.DATA_DIR", tmp_path)
+    db = LMDBStorageHandler()
+    feed, _, _ = dummy_feeds()
+    entries = dummy_entries(feed.id, 3, feed.url)
+
+    with db._write() as txn:
+        for entry in entries:
+            txn.put(
+                db._serialize(entry.id), db._serialize(entry), db=db._db(Named.entry)
+            )
+        txn.put(
+            db._serialize(feed.id),
+            db._serialize([i.id for i in entries] + [entries[0].id]),
+            db=db._db(Named.si_feed_entry),
+        )
+    db.db.close()
+
+    db = LMDBStorageHandler()
+
+    assert len(db.get_entries(feed=feed)) == 3
+    with db._read() as txn:
+        assert not txn.stat(db._db(Named.si_feed_entry))["entries"]
+
+
+def test_get_entries_ordered(db):
+    feed_1, feed_2, _ = dummy_feeds()
+
+    for offset, feed in [(2, feed_1), (0, feed_2)]:
+        db.upsert_feed(feed)
+        for entry in dummy_entries(feed.id, 5, feed.url, offset=offset):
+            db.upsert_feed_entry(feed=feed, entry=entry)
+
+    entries = db.get_entries()
+    published = [i["entry"].published_at for i in entries]
+    assert published == sorted(published, reverse=True)
+    assert len(entries) == 10
+
+    recent = db.get_entries(after=1732670009)
+    assert [i["entry"].published_at for i in recent] == [
+        1732670009 + i for i in [4, 3, 2, 1]
+    ]
+    assert all(i["feed_id"] == feed_2.id for i in recent)
+
+    # moving an entry in time moves it in the index
+    entry = dummy_entries(feed_1.id, 1, feed_1.url)[0]
+    entry.published_at = 1732670009 + 1000
+    db.upsert_feed_entry(feed=feed_1, entry=entry)
+
+    assert db.get_entries()[0]["id"] == entry.id
+    assert len(db.get_entries()) == 10
+    assert len(db.get_entries(after=1732670009 + 999)) == 1
+
+
+def test_tinydb_indexes_follow_other_writers(tmp_path, monkeypatch):
+    from app.storage.tinydb import TinyDBStorageHandler
+
+    monkeypatch.setattr("app.storage.tinydb.DATA_DIR", tmp_path)
+    db = TinyDBStorageHandler()
+    other = TinyDBStorageHandler()
+
+    feed, _, _ = dummy_feeds()
+    for entry in dummy_entries(feed.id, 3, feed.url):
+        other.upsert_feed_entry(feed=feed, entry=entry)
+
+    assert len(db.get_entries()) == 3
+
+
+def test_lookups_by_id(db):
+    feed_1, feed_2, _ = dummy_feeds()
+
+    for feed in [feed_1, feed_2]:
+        db.upsert_feed(feed)
+        db.update_poll_state(feed, 1732670009)
+
+    entry = dummy_entries(feed_1.id, 1, feed_1.url)[0]
+    db.upsert_feed_entry(feed=feed_1, entry=entry)
+
+    db.delete_feed(feed_2)
+
+    assert db.get_feed(feed_1.id).id == feed_1.id
+    assert db.get_poll_state(feed_1) == 1732670009
+    assert db.get_poll_state(feed_2) is None
+    assert db.get_feed_entry(entry.id).id == entry.id
+    assert db.feed_entry_exists(entry.id)
+
+    db.delete_feed_entry(entry)
+
+    assert not db.feed_entry_exists(entry.id)
+
+
+def test_tinydb_indexes_survive_reopen(tmp_path, monkeypatch):
+    from app.storage.tinydb import TinyDBStorageHandler
+
+    monkeypatch.setattr("app.storage.tinydb.DATA_DIR", tmp_path)
+    db = TinyDBStorageHandler()
+
+    feed, _, _ = dummy_feeds()
+    db.upsert_feed(feed)
+    for entry in dummy_entries(feed.id, 3, feed.url):
+        db.upsert_feed_entry(feed=feed, entry=entry)
+
+    db = TinyDBStorageHandler()
+    db.upsert_feed(feed)
+
+    assert len(db.get_feeds()) == 1
+    assert len(db.get_entries(feed=feed)) == 3
+    assert db.get_feed_stats()[feed.id].entry_count == 3
+
+    db.delete_feed(feed)
+    with pytest.raises(IndexError):
+        db.get_feed(feed.id)
+
+
+@pytest.mark.asyncio
+async def test_batch(db):
+    from app.models import EntryContent
+
+    feed, _, _ = dummy_feeds()
+    entries = dummy_entries(feed.id, 3, feed.url)
+
+    with db.batch():
+        db.upsert_feed(feed)
+
+        with db.batch():
+            for entry in entries:
+                db.upsert_feed_entry(feed=feed, entry=entry)
+
+            await db.upsert_entry_content(
+                EntryContent(url=entries[0].url, content="<p>hi</p>")
+            )
+
+        # writes are visible inside the batch that made them
+        assert len(db.get_entries(feed=feed)) == 3
+        assert db.entry_content_exists(entries[0])
+
+    assert db.get_feed(feed.id).id == feed.id
+    assert db.get_feed_stats()[feed.id].entry_count == 3
+    assert db.retrieve_entry_content(entries[0]).content == "<p>hi</p>"
+
+
+def test_batch_rolls_back(db):
+    feed, _, _ = dummy_feeds()
+    db.upsert_feed(feed)
+
+    with pytest.raises(ValueError), db.batch():
+        for entry in dummy_entries(feed.id, 3, feed.url):
+            db.upsert_feed_entry(feed=feed, entry=entry)
+
+        raise ValueError("boom")
+
+    assert db.get_entries() == []
+    assert db.get_feed_stats() == {}
+    assert not db.feed_entries_exist(
+        [i.id for i in dummy_entries(feed.id, 3, feed.url)]
+    )
+
+
+@pytest.mark.asyncio
+async def test_lmdb_batch_is_not_shared_between_tasks(tmp_path, monkeypatch):
+    from app.storage.lmdb import LMDBStorageHandler
+
+    monkeypatch.setattr("app.storage.lmdb.DATA_DIR", tmp_path)
+    db = LMDBStorageHandler()
+    feed_1, feed_2, _ = dummy_feeds()
+
+    async def hold_batch():
+        with pytest.raises(ValueError), db.batch():
+            db.upsert_feed(feed_1)
+            await asyncio.sleep(0.1)
+            raise ValueError("boom")
+
+    async def write_meanwhile():
+        await asyncio.sleep(0)
+
+        # rather than joining the other task's batch and rolling back with it
+        with pytest.raises(RuntimeError):
+            db.upsert_feed(feed_2)
+
+    await asyncio.gather(hold_batch(), write_meanwhile())
+
+    db.upsert_feed(feed_2)
+    assert [i.id for i in db.get_feeds()] == [feed_2.id]
+
+
+def test_tinydb_batch_writes_once(tmp_path, monkeypatch, mocker):
+    from tinydb.storages import JSONStorage
+
+    from app.storage.tinydb import TinyDBStorageHandler
+
+    monkeypatch.setattr("app.storage.tinydb.DATA_DIR", tmp_path)
+    db = TinyDBStorageHandler()
+    write = mocker.spy(JSONStorage, "write")
+
+    feed, _, _ = dummy_feeds()
+    with db.batch():
+        db.upsert_feed(feed)
+        for entry in dummy_entries(feed.id, 10, feed.url):
+            db.upsert_feed_entry(feed=feed, entry=entry)
+
+    assert write.call_count == 1
+    assert len(TinyDBStorageHandler().get_entries(feed=feed)) == 10
+
+
+def test_get_feed_stats(db):
+    feed_1, feed_2, _ = dummy_feeds()
+
+    for count, feed in [(3, feed_1), (5, feed_2)]:
+        db.upsert_feed(feed)
+        for entry in dummy_entries(feed.id, count, feed.url):
+            db.upsert_feed_entry(feed=feed, entry=entry)
+            db.upsert_feed_entry(feed=feed, entry=entry)
+
+    stats = db.get_feed_stats()
+    assert stats[feed_1.id].entry_count == 3
+    assert stats[feed_1.id].latest_published_at == 1732670009 + 2
+    assert stats[feed_2.id].entry_count == 5
+
+    latest = dummy_entries(feed_1.id, 3, feed_1.url)[2]
+    db.delete_feed_entry(latest)
+
+    stats = db.get_feed_stats()
+    assert stats[feed_1.id].entry_count == 2
+    assert stats[feed_1.id].latest_published_at == 1732670009 + 1
+
+
+def test_metadata_cache(db, handler_type, mocker):
+    get_settings = mocker.spy(handler_type, "get_settings")
+    get_feeds = mocker.spy(handler_type, "get_feeds")
+
+    settings = db.get_settings()
+    settings.recent_hours = 1
+    assert db.get_settings().recent_hours != 1
+    assert get_settings.call_count == 1
+
+    db.upsert_settings(settings)
+    assert db.get_settings().recent_hours == 1
+    assert get_settings.call_count == 2
+
+    feed, _, _ = dummy_feeds()
+    assert db.get_feeds() == []
+    db.upsert_feed(feed)
+    assert [i.id for i in db.get_feeds()] == [feed.id]
+    assert [i.id for i in db.get_feeds()] == [feed.id]
+    assert get_feeds.call_count == 2
+
+    db.delete_feed(feed)
+    assert db.get_feeds() == []
+
+
+def test_metadata_cache_handlers(db):
+    from app.llm.dummy import DummyLLMHandler
+
+    with pytest.raises(IndexError):
+        db.get_handler("dummy_llm")
+
+    db.upsert_handler(DummyLLMHandler(temerity=10))
+    handler = db.get_handler("dummy_llm")
+
+    assert handler.temerity == 10
+    assert db.get_handler("dummy_llm") is handler
+
+
+def test_outbox(db):
+    from app.models import OutboxItem
+
+    items = [
+        OutboxItem(entry_id=str(i), feed_id="feed", not_before=not_before)
+        for i, not_before in enumerate([30, 10, 20, 100])
+    ]
+    for item in items:
+        db.upsert_outbox_item(item)
+
+    assert [i.entry_id for i in db.get_outbox_items(before=50)] == ["1", "2", "0"]
+
+    items[1].not_before = 200
+    db.upsert_outbox_item(items[1])
+    db.delete_outbox_item(items[2])
+
+    assert [i.entry_id for i in db.get_outbox_items(before=150)] == ["0", "3"]
+
+
+def test_change_log(db):
+    assert db.get_change_seq() == 0
+
+    feed, _, _ = dummy_feeds()
+    db.upsert_feed(feed)
+
+    entries = dummy_entries(feed.id, 2, feed.url)
+    for entry in entries:
+        db.upsert_feed_entry(feed=feed, entry=entry)
+
+    db.upsert_feed(feed)
+    db.delete_feed_entry(entries[0])
+
+    # only the latest change to each record is kept
+    changes = db.get_changes()
+    assert [(i.kind, i.id, i.deleted) for i in changes] == [
+        ("entry", entries[1].id, False),
+        ("feed", feed.id, False),
+        ("entry", entries[0].id, True),
+    ]
+    assert [i.seq for i in changes] == [3, 4, 5]
+    assert db.get_change_seq() == 5
+
+    assert [i.seq for i in db.get_changes(after=4)] == [5]
+    assert db.get_changes(after=5) == []
+
+
+def test_metadata_cache_ignores_stale_snapshots(db):
+    settings = db.get_settings()
+    settings.recent_hours = 1
+    db.upsert_settings(settings)
+
+    def write_elsewhere():
+        settings.recent_hours = 99
+        db.upsert_settings(settings)
+
+    with db.snapshot():
+        db.get_feeds()
+
+        # another request writes outside this snapshot
+        Context().run(write_elsewhere)
+
+        db.get_settings()
+
+    assert db.get_settings().recent_hours == 99
@@ -0,0 +1,60 @@
+import pytest
+
+from app.handlers import LLMHandler
+from app.summary_cache import SummaryCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SummaryCache(path=tmp_path, maxsize=3)
+
+
+def test_summary_cache(cache):
+    key = cache.key(handler_id="openai", model="gpt", system="be brief", prompt="hi")
+
+    assert cache.get(key) is None
+
+    cache.set(key, "a summary")
+    assert cache.get(key) == "a summary"
+
+    assert cache.key("openai", "gpt", "be brief", "hi") == key
+    assert cache.key("openai", "gpt-2", "be brief", "hi") != key
+    assert cache.key("ollama", "gpt", "be brief", "hi") != key
+    assert cache.key("openai", "gpt", "be long", "hi") != key
+
+
+def test_summary_cache_evicts_least_recently_used(cache):
+    keys = [cache.key("openai", "gpt", "", str(i)) for i in range(4)]
+
+    for key in keys[:3]:
+        cache.set(key, "summary")
+
+    # using the oldest summary keeps it around
+    cache.get(keys[0])
+    cache.set(keys[3], "summary")
+
+    assert len(cache) == 3
+    assert cache.get(keys[1]) is None
+    assert all(cache.get(i) for i in [keys[0], keys[2], keys[3]])
+
+
+@pytest.mark.asyncio
+async def test_cached_summary(cache, mocker):
+    mocker.patch("app.handlers.summary_cache", cache)
+
+    class TestLLMHandler(LLMHandler):
+        id = "test_llm_handler"
+
+        async def summarize(self, feed, entry, mk):
+            pass
+
+    generate = mocker.AsyncMock(return_value="a summary")
+    handler = TestLLMHandler()
+
+    for _ in range(2):
+        summary = await handler.cached_summary(
+            model="model", system="system", prompt="prompt", generate=generate
+        )
+        assert summary == "a summary"
+
+    generate.assert_awaited_once()